@@ -0,0 +1,137 @@
+"""
+Measures how many records per second the log formatters format, for records like the ones manof logs.
+The formatters are compared with how they used to format records - the human readable formatter looking
+up a pygments lexer and formatter and doing a full highlight pass per record, and the filebeat json
+formatter encoding a copy of the whole document with simplejson.
+
+    python benchmarks/bench_log_formatters.py [--duration SECONDS]
+"""
+import argparse
+import datetime
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygments  # noqa: E402
+import pygments.formatters  # noqa: E402
+import pygments.lexers  # noqa: E402
+
+import clients.logging.formatter.human_readable  # noqa: E402
+import clients.logging.formatter.json  # noqa: E402
+
+RECORD_VARS = {
+    'short': {'target': 'adapter', 'num_running': 3, 'num_ready': 12},
+    'command': {
+        'command': 'docker run --detach --net host --name adapter --label '
+        'manof.runCommandMD5Hash=308408abfeec0535c980faac18bf1695 registry/adapter:latest',
+        'cwd': None,
+        'raise_on_error': True,
+    },
+    'nested': {'properties': {'image_name': 'adapter', 'context': None, 'env': []}},
+}
+
+
+class _HighlightPerRecordFormatter(
+    clients.logging.formatter.human_readable.HumanReadableFormatter
+):
+    """
+    Colors the vars the way that dominated HumanReadableFormatter's cost before it reused the lexer and
+    formatter - looking both up and doing a pygments highlight pass per record
+    """
+
+    def _prettify_output(self, vars_dict):
+        values_str = clients.logging.formatter.helpers.JsonFormatter.format_to_json_str(
+            vars_dict
+        )
+        json_lexer = pygments.lexers.get_lexer_by_name('Json')
+        formatter = pygments.formatters.get_formatter_by_name(
+            'terminal16m', style='paraiso-dark'
+        )
+        return pygments.highlight(values_str, json_lexer, formatter)
+
+
+class _DumpsFilebeatJsonFormatter(logging.Formatter):
+    """
+    Formats records as FilebeatJsonFormatter did before assembling pre-encoded parts - by copying the vars
+    into the document and encoding all of it with simplejson.dumps()
+    """
+
+    def format(self, record):
+        more = dict(record.vars) if len(record.vars) else {}
+        more.pop('ctx', None)
+
+        output = {
+            'when': datetime.datetime.fromtimestamp(record.created).isoformat(),
+            'who': record.name,
+            'severity': logging.getLevelName(record.levelno),
+            'what': record.getMessage(),
+            'more': more,
+            'ctx': record.vars.get('ctx', ''),
+            'lang': 'py',
+        }
+
+        return clients.logging.formatter.helpers.JsonFormatter.format_to_json_str(
+            output
+        )
+
+
+def _record(record_vars):
+    record = logging.LogRecord(
+        'manof.adapter', logging.DEBUG, __file__, 0, 'Running command', (), None
+    )
+    record.vars = record_vars
+    return record
+
+
+def measure(formatter, record, duration):
+    """
+    Returns the number of records formatted per second
+    """
+    num_records = 0
+    started = time.perf_counter()
+    deadline = started + duration
+
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            formatter.format(record)
+        num_records += 100
+
+    return num_records / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--duration', type=float, default=1.0)
+    args = parser.parse_args()
+
+    formatters = [
+        ('human readable (before)', _HighlightPerRecordFormatter(True)),
+        (
+            'human readable',
+            clients.logging.formatter.human_readable.HumanReadableFormatter(True),
+        ),
+        (
+            'human readable, no colors',
+            clients.logging.formatter.human_readable.HumanReadableFormatter(False),
+        ),
+        ('filebeat json (before)', _DumpsFilebeatJsonFormatter()),
+        ('filebeat json', clients.logging.formatter.json.FilebeatJsonFormatter()),
+    ]
+
+    for record_name, record_vars in RECORD_VARS.items():
+        record = _record(record_vars)
+        for formatter_name, formatter in formatters:
+            print(
+                '{0:<10} {1:<28} {2:>12,.0f} records/s'.format(
+                    record_name,
+                    formatter_name,
+                    measure(formatter, record, args.duration),
+                )
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,361 @@
+"""
+Measures manof's orchestration overhead, offline: manof commands are run on synthetic manofests against a
+fake docker CLI that answers immediately or after a configurable latency.
+
+For each command, dependency shape and --parallel value, reports:
+  - wall time of the command
+  - number of docker processes spawned
+  - peak RSS of the manof process
+  - CPU time of the manof process per target - the orchestration overhead, as everything else is waiting
+    for docker
+
+    python benchmarks/bench_orchestration.py [--targets N] [--shapes chain,fan-out,diamond]
+        [--commands provision,run,lift,rm,serialize] [--parallel 1,4,16]
+        [--latency-ms MS] [--command-latency-ms run=50,pull=100]
+"""
+import argparse
+import json
+import os
+import resource
+import runpy
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SHAPES = ['chain', 'fan-out', 'diamond', 'independent']
+COMMANDS = ['provision', 'run', 'lift', 'rm', 'serialize']
+
+# answers the docker commands manof runs, after the configured latency, and records each spawn
+_FAKE_DOCKER = '''#!{python} -S
+import json
+import os
+import sys
+import time
+
+args = sys.argv[1:]
+subcommand = ' '.join(args[:2]) if args[:1] in (['image'], ['volume'], ['buildx']) else args[0]
+
+fd = os.open(os.environ['FAKE_DOCKER_SPAWN_LOG'], os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+os.write(fd, (subcommand + '\\n').encode())
+os.close(fd)
+
+latencies = json.loads(os.environ.get('FAKE_DOCKER_COMMAND_LATENCY_MS', '{{}}'))
+latency_ms = latencies.get(
+    subcommand.split()[0], float(os.environ.get('FAKE_DOCKER_LATENCY_MS', '0'))
+)
+time.sleep(latency_ms / 1000.0)
+
+if subcommand == 'inspect':
+    print('true sha256:image')
+elif subcommand == 'image inspect':
+    print('sha256:image')
+elif subcommand == 'version':
+    print(json.dumps({{'Client': {{'Version': '24.0.5'}}, 'Server': {{'Version': '24.0.5'}}}}))
+elif subcommand == 'buildx version':
+    print('github.com/docker/buildx v0.11.2')
+'''
+
+_MANOFEST_HEADER = '''import manof
+
+
+class BenchTarget(manof.Image):
+    @property
+    def image_name(self):
+        return 'bench/' + self.name
+
+    @property
+    def local_repository(self):
+        return 'bench'
+
+    @property
+    def env(self):
+        return ['BENCH_ENV', {'BENCH_OVERRIDE': 'value'}]
+
+    @property
+    def labels(self):
+        return {'bench': self.name}
+'''
+
+_MANOFEST_TARGET = '''
+
+class {class_name}(BenchTarget):
+    @property
+    def depends_on(self):
+        return {depends_on!r}
+'''
+
+# runs manof in this (child) process, and reports on the run
+_CHILD = '''
+import json
+import os
+import resource
+import runpy
+import sys
+import time
+
+result_path, manof_path = sys.argv[1:3]
+sys.argv = [manof_path] + sys.argv[3:]
+sys.path.insert(0, os.path.dirname(manof_path))
+
+# import what manof imports up front, so that only the command itself is measured
+import twisted.internet.reactor
+import core
+
+
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+started, started_cpu_time = time.perf_counter(), cpu_time()
+code = 0
+try:
+    runpy.run_path(manof_path, run_name='__main__')
+except SystemExit as exc:
+    code = exc.code
+
+with open(result_path, 'w') as result_file:
+    json.dump(
+        {
+            'code': code,
+            'wall_time': time.perf_counter() - started,
+            'cpu_time': cpu_time() - started_cpu_time,
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        },
+        result_file,
+    )
+'''
+
+
+def target_names(num_targets):
+    return ['target{0:04d}'.format(index) for index in range(num_targets)]
+
+
+def class_name(target_name):
+
+    # targets depend on others by their class name
+    return target_name.capitalize()
+
+
+def dependencies(shape, num_targets):
+    """
+    Returns [the names of the targets each target depends on]
+    """
+    names = target_names(num_targets)
+
+    if shape == 'chain':
+        return [[]] + [[name] for name in names[:-1]]
+
+    if shape == 'fan-out':
+        return [[]] + [[names[0]]] * (num_targets - 1)
+
+    if shape == 'diamond':
+
+        # one root, every other target in the middle depends on it, and one sink depends on all of those
+        middle = names[1:-1]
+        return [[]] + [[names[0]]] * len(middle) + [middle]
+
+    return [[]] * num_targets
+
+
+def expected_depth(shape, num_targets):
+    """
+    Returns the number of levels of the graph of the shape
+    """
+    if shape == 'chain':
+        return num_targets
+
+    if shape == 'fan-out':
+        return min(num_targets, 2)
+
+    if shape == 'diamond':
+        return min(num_targets, 3)
+
+    return min(num_targets, 1)
+
+
+def get_depth(manofest_path, num_targets):
+    """
+    Returns the number of levels of the graph manof builds of the targets of the manofest
+    """
+    sys.path.insert(0, ROOT_DIR)
+    import clients.logging
+    import core
+    import core.scheduler
+
+    logger = clients.logging.Client('bench', 'error', output_stdout=False).logger
+    args = argparse.Namespace(manofest_path=manofest_path)
+    manofest = runpy.run_path(manofest_path)
+    targets = [
+        manofest[class_name(name)](logger, args) for name in target_names(num_targets)
+    ]
+
+    manof_core = core.Manof.__new__(core.Manof)
+    manof_core._logger = logger
+    manof_core._args = args
+    target_root = manof_core._target_tree_from_target_list(targets)
+
+    return len(
+        core.scheduler.TargetGraph.from_target_tree(target_root).teardown_levels()
+    )
+
+
+def generate_manofest(path, shape, num_targets):
+    with open(path, 'w') as manofest_file:
+        manofest_file.write(_MANOFEST_HEADER)
+
+        for name, depends_on in zip(
+            target_names(num_targets), dependencies(shape, num_targets)
+        ):
+            manofest_file.write(
+                _MANOFEST_TARGET.format(
+                    class_name=class_name(name),
+                    depends_on=[class_name(parent) for parent in depends_on] or None,
+                )
+            )
+
+
+def install_fake_docker(bin_dir):
+    os.makedirs(bin_dir, exist_ok=True)
+    docker_path = os.path.join(bin_dir, 'docker')
+
+    with open(docker_path, 'w') as docker_file:
+        docker_file.write(_FAKE_DOCKER.format(python=sys.executable))
+
+    os.chmod(docker_path, 0o755)
+
+
+def run_command(work_dir, manofest_path, command, num_targets, parallel, env):
+    """
+    Runs a manof command in a child process and returns what it reported on the run
+    """
+    result_path = os.path.join(work_dir, 'result.json')
+    spawn_log_path = os.path.join(work_dir, 'spawns.log')
+    if os.path.exists(spawn_log_path):
+        os.remove(spawn_log_path)
+
+    manof_args = [
+        '--log-disable-stdout',
+        '--parallel',
+        str(parallel),
+        '--manofest-path',
+        manofest_path,
+        command,
+    ] + target_names(num_targets)
+
+    subprocess.run(
+        [sys.executable, '-c', _CHILD, result_path, os.path.join(ROOT_DIR, 'manof.py')]
+        + manof_args,
+        cwd=work_dir,
+        env=dict(env, FAKE_DOCKER_SPAWN_LOG=spawn_log_path),
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+
+    with open(result_path) as result_file:
+        result = json.load(result_file)
+
+    try:
+        with open(spawn_log_path) as spawn_log:
+            result['num_spawns'] = len(spawn_log.readlines())
+    except IOError:
+        result['num_spawns'] = 0
+
+    return result
+
+
+def _parse_command_latencies(value):
+    latencies = {}
+    for command_latency in filter(None, value.split(',')):
+        command, latency_ms = command_latency.split('=')
+        latencies[command] = float(latency_ms)
+
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--targets', type=int, default=50)
+    parser.add_argument('--shapes', default='chain,fan-out,diamond')
+    parser.add_argument('--commands', default=','.join(COMMANDS))
+    parser.add_argument('--parallel', default='1,4,16')
+    parser.add_argument(
+        '--latency-ms', type=float, default=0, help='Latency of every docker command'
+    )
+    parser.add_argument(
+        '--command-latency-ms',
+        default='',
+        help='Latency of specific docker commands, e.g. run=50,pull=100',
+    )
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='manof-bench-')
+    bin_dir = os.path.join(work_dir, 'bin')
+    install_fake_docker(bin_dir)
+
+    env = dict(
+        os.environ,
+        PATH=bin_dir + os.pathsep + os.environ.get('PATH', ''),
+        XDG_CACHE_HOME=os.path.join(work_dir, 'cache'),
+        FAKE_DOCKER_LATENCY_MS=str(args.latency_ms),
+        FAKE_DOCKER_COMMAND_LATENCY_MS=json.dumps(
+            _parse_command_latencies(args.command_latency_ms)
+        ),
+    )
+
+    print(
+        '{0:<10} {1:<12} {2:>7} {3:>8} {4:>9} {5:>8} {6:>9} {7:>14}'.format(
+            'command',
+            'shape',
+            'targets',
+            'parallel',
+            'wall (s)',
+            'spawns',
+            'rss (MB)',
+            'cpu/target (ms)',
+        )
+    )
+
+    try:
+        for shape in args.shapes.split(','):
+            manofest_path = os.path.join(work_dir, '{0}.py'.format(shape))
+            generate_manofest(manofest_path, shape, args.targets)
+
+            depth = get_depth(manofest_path, args.targets)
+            if depth != expected_depth(shape, args.targets):
+                raise RuntimeError(
+                    'The {0} manofest has {1} levels rather than {2}'.format(
+                        shape, depth, expected_depth(shape, args.targets)
+                    )
+                )
+
+            for command in args.commands.split(','):
+                for parallel in [int(p) for p in args.parallel.split(',')]:
+                    result = run_command(
+                        work_dir, manofest_path, command, args.targets, parallel, env
+                    )
+
+                    print(
+                        '{0:<10} {1:<12} {2:>7} {3:>8} {4:>9.2f} {5:>8} {6:>9.1f} {7:>14.2f}{8}'.format(
+                            command,
+                            shape,
+                            args.targets,
+                            parallel,
+                            result['wall_time'],
+                            result['num_spawns'],
+                            result['max_rss_kb'] / 1024.0,
+                            result['cpu_time'] * 1000 / args.targets,
+                            '' if not result['code'] else '  (failed)',
+                        )
+                    )
+                    sys.stdout.flush()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Measures manof's startup cost in fresh interpreters: the import time of its top level modules and the
+latency of `manof --help`.
+
+    python benchmarks/bench_startup.py [--runs N] [--max-help-ms MS]
+
+With --max-help-ms, exits with a non-zero code if the median --help latency exceeds it
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules that must not be imported before a command actually runs
+HEAVY_MODULES = [
+    'twisted.internet.reactor',
+    'twisted.web',
+    'pygments',
+    'colorama',
+    'semver',
+    'inflection',
+    'core',
+]
+
+_IMPORT_TIME_SCRIPT = '''
+import time
+started = time.perf_counter()
+import {0}
+print(time.perf_counter() - started)
+'''
+
+_HELP_IMPORTS_SCRIPT = '''
+import argparse, runpy, sys
+manof_script = runpy.run_path('manof.py')
+manof_script['_register_arguments'](argparse.ArgumentParser())
+print(' '.join(sorted(sys.modules)))
+'''
+
+
+def _run_python(*args):
+    return subprocess.run(
+        [sys.executable] + list(args),
+        cwd=ROOT_DIR,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        check=True,
+        universal_newlines=True,
+    ).stdout
+
+
+def measure_import(module_name, runs):
+    return [
+        float(_run_python('-c', _IMPORT_TIME_SCRIPT.format(module_name)))
+        for _ in range(runs)
+    ]
+
+
+def measure_help(runs):
+    durations = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        _run_python('manof.py', '--help')
+        durations.append(time.perf_counter() - started)
+
+    return durations
+
+
+def heavy_modules_imported_by_help():
+    """
+    Returns the heavy modules imported just by registering manof's arguments (what --help does)
+    """
+    imported = set(_run_python('-c', _HELP_IMPORTS_SCRIPT).split())
+    return [
+        module
+        for module in HEAVY_MODULES
+        if any(
+            imported_module == module or imported_module.startswith(module + '.')
+            for imported_module in imported
+        )
+    ]
+
+
+def _report(name, durations):
+    print(
+        '{0:<28} median {1:8.1f}ms   min {2:8.1f}ms'.format(
+            name, statistics.median(durations) * 1000, min(durations) * 1000
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--max-help-ms', type=float)
+    args = parser.parse_args()
+
+    for module_name in ['clients.logging', 'manof', 'core']:
+        _report('import ' + module_name, measure_import(module_name, args.runs))
+
+    help_durations = measure_help(args.runs)
+    _report('manof --help', help_durations)
+
+    heavy_modules = heavy_modules_imported_by_help()
+    print('heavy modules imported by --help: {0}'.format(heavy_modules or 'none'))
+
+    if (
+        args.max_help_ms is not None
+        and statistics.median(help_durations) * 1000 > args.max_help_ms
+    ):
+        print('manof --help is slower than {0}ms'.format(args.max_help_ms))
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
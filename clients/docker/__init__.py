@@ -0,0 +1,393 @@
+import base64
+import io
+import os
+import urllib.parse
+
+import simplejson
+import zope.interface
+
+from twisted.internet import defer, endpoints, protocol
+from twisted.web import client, http_headers, iweb
+
+
+DEFAULT_SOCKET_PATH = '/var/run/docker.sock'
+
+
+def default_socket_path():
+    """
+    Resolve the daemon socket the same way the docker CLI does for unix sockets - DOCKER_HOST if it points
+    at a unix socket, the well known path otherwise
+    """
+    docker_host = os.environ.get('DOCKER_HOST', '')
+    if docker_host.startswith('unix://'):
+        return docker_host[len('unix://') :]
+
+    return DEFAULT_SOCKET_PATH
+
+
+def split_image_reference(reference):
+    """
+    Split an image reference to (repository, tag). e.g.:
+        busybox -> (busybox, latest)
+        localhost:5000/busybox:1 -> (localhost:5000/busybox, 1)
+        busybox@sha256:abc -> (busybox@sha256:abc, None)
+    """
+    if '@' in reference:
+        return reference, None
+
+    repository, _, tag = reference.rpartition(':')
+
+    # the colon belongs to a registry host:port, not to a tag
+    if not repository or '/' in tag:
+        return reference, 'latest'
+
+    return repository, tag
+
+
+class DockerApiError(Exception):
+    def __init__(self, method, path, code, message):
+        """
+        Raised when the daemon responds to an Engine API request with an error
+        :param method: the http method of the request
+        :type method: str
+        :param path: the request path
+        :type path: str
+        :param code: the http status code of the response (None for in-stream errors)
+        :type code: int
+        :param message: the error message as reported by the daemon
+        :type message: str
+        """
+        self._code = code
+        self._message = message
+
+        super(DockerApiError, self).__init__(
+            '{0} {1} failed with status {2}: {3}'.format(method, path, code, message)
+        )
+
+    @property
+    def code(self):
+        return self._code
+
+    @property
+    def message(self):
+        return self._message
+
+
+@zope.interface.implementer(iweb.IAgentEndpointFactory)
+class _UnixSocketEndpointFactory(object):
+    def __init__(self, reactor, socket_path):
+        self._reactor = reactor
+        self._socket_path = socket_path
+
+    def endpointForURI(self, uri):
+        return endpoints.UNIXClientEndpoint(self._reactor, self._socket_path)
+
+
+class _JsonStreamReader(protocol.Protocol):
+    """
+    Reads a stream of JSON messages (as returned by pull/push) without keeping progress messages in memory.
+    Fires the deferred with the list of non-progress messages, or errbacks on the first in-stream error
+    """
+
+    def __init__(self, deferred):
+        self._deferred = deferred
+        self._buffer = b''
+        self._messages = []
+        self._error = None
+
+    def dataReceived(self, data):
+        self._buffer += data
+        lines = self._buffer.split(b'\n')
+        self._buffer = lines.pop()
+
+        for line in lines:
+            self._handle_line(line)
+
+    def connectionLost(self, reason):
+        self._handle_line(self._buffer)
+
+        if self._error is not None:
+            self._deferred.errback(self._error)
+        else:
+            self._deferred.callback(self._messages)
+
+    def _handle_line(self, line):
+        line = line.strip()
+        if not line or self._error is not None:
+            return
+
+        message = simplejson.loads(line)
+
+        if 'error' in message:
+            self._error = Exception(message['error'])
+        elif not message.get('progressDetail'):
+            self._messages.append(message)
+
+
+class Client(object):
+    """
+    A minimal Docker Engine API client, talking HTTP over the daemon's unix socket through a persistent
+    connection pool. All methods return deferreds
+    """
+
+    def __init__(self, logger, socket_path=None, max_connections=16, reactor=None):
+        if reactor is None:
+            from twisted.internet import reactor
+
+        self._logger = logger
+        self._socket_path = socket_path or default_socket_path()
+        self._pool = client.HTTPConnectionPool(reactor, persistent=True)
+        self._pool.maxPersistentPerHost = max_connections
+        self._agent = client.Agent.usingEndpointFactory(
+            reactor,
+            _UnixSocketEndpointFactory(reactor, self._socket_path),
+            pool=self._pool,
+        )
+
+    @property
+    def socket_path(self):
+        return self._socket_path
+
+    def close(self):
+        return self._pool.closeCachedConnections()
+
+    def version(self):
+        return self._request_json('GET', '/version')
+
+    # containers
+
+    def create_container(self, config, name=None):
+        return self._request_json(
+            'POST', '/containers/create', query={'name': name}, body=config
+        )
+
+    def start_container(self, container):
+        return self._request_json(
+            'POST', '/containers/{0}/start'.format(_quote(container))
+        )
+
+    def stop_container(self, container, timeout=None):
+        return self._request_json(
+            'POST',
+            '/containers/{0}/stop'.format(_quote(container)),
+            query={'t': timeout},
+        )
+
+    def remove_container(self, container, force=False, volumes=False):
+        return self._request_json(
+            'DELETE',
+            '/containers/{0}'.format(_quote(container)),
+            query={'force': _bool(force), 'v': _bool(volumes)},
+        )
+
+    def inspect_container(self, container):
+        return self._request_json(
+            'GET', '/containers/{0}/json'.format(_quote(container))
+        )
+
+    def disconnect_container_from_network(self, network, container, force=False):
+        return self._request_json(
+            'POST',
+            '/networks/{0}/disconnect'.format(_quote(network)),
+            body={'Container': container, 'Force': force},
+        )
+
+    # images
+
+    def pull_image(self, image):
+        repository, tag = split_image_reference(image)
+        return self._request_stream(
+            'POST',
+            '/images/create',
+            query={'fromImage': repository, 'tag': tag},
+            headers=self._registry_auth_headers(repository),
+        )
+
+    def push_image(self, image):
+        repository, tag = split_image_reference(image)
+        return self._request_stream(
+            'POST',
+            '/images/{0}/push'.format(_quote(repository, safe='/:')),
+            query={'tag': tag},
+            headers=self._registry_auth_headers(repository),
+        )
+
+    def tag_image(self, image, target):
+        repository, tag = split_image_reference(target)
+        return self._request_json(
+            'POST',
+            '/images/{0}/tag'.format(_quote(image, safe='/:@')),
+            query={'repo': repository, 'tag': tag},
+        )
+
+    def remove_image(self, image, force=False):
+        return self._request_json(
+            'DELETE',
+            '/images/{0}'.format(_quote(image, safe='/:@')),
+            query={'force': _bool(force)},
+        )
+
+    def inspect_image(self, image):
+        return self._request_json(
+            'GET', '/images/{0}/json'.format(_quote(image, safe='/:@'))
+        )
+
+    # volumes
+
+    def create_volume(self, name, driver='local', driver_opts=None, labels=None):
+        return self._request_json(
+            'POST',
+            '/volumes/create',
+            body={
+                'Name': name,
+                'Driver': driver,
+                'DriverOpts': driver_opts or {},
+                'Labels': labels or {},
+            },
+        )
+
+    def inspect_volume(self, name):
+        return self._request_json('GET', '/volumes/{0}'.format(_quote(name)))
+
+    def remove_volume(self, name, force=False):
+        return self._request_json(
+            'DELETE',
+            '/volumes/{0}'.format(_quote(name)),
+            query={'force': _bool(force)},
+        )
+
+    def list_volumes(self):
+        return self._request_json('GET', '/volumes')
+
+    @defer.inlineCallbacks
+    def _request_json(self, method, path, query=None, body=None, headers=None):
+        response = yield self._request(method, path, query, body, headers)
+        content = yield client.readBody(response)
+
+        defer.returnValue(simplejson.loads(content) if content.strip() else None)
+
+    @defer.inlineCallbacks
+    def _request_stream(self, method, path, query=None, body=None, headers=None):
+        response = yield self._request(method, path, query, body, headers)
+
+        d = defer.Deferred()
+        response.deliverBody(_JsonStreamReader(d))
+
+        try:
+            messages = yield d
+        except Exception as exc:
+            raise DockerApiError(method, path, None, str(exc))
+
+        defer.returnValue(messages)
+
+    @defer.inlineCallbacks
+    def _request(self, method, path, query=None, body=None, headers=None):
+        query = {k: v for k, v in (query or {}).items() if v is not None}
+        uri = 'http://docker{0}'.format(path)
+        if query:
+            uri += '?' + urllib.parse.urlencode(query)
+
+        request_headers = http_headers.Headers(
+            {k: [v] for k, v in (headers or {}).items()}
+        )
+
+        body_producer = None
+        if body is not None:
+            request_headers.addRawHeader('Content-Type', 'application/json')
+            body_producer = client.FileBodyProducer(
+                io.BytesIO(simplejson.dumps(body).encode('utf-8'))
+            )
+
+        self._logger.verbose('Sending docker API request', method=method, uri=uri)
+
+        response = yield self._agent.request(
+            method.encode('ascii'),
+            uri.encode('utf-8'),
+            request_headers,
+            body_producer,
+        )
+
+        if response.code >= 400:
+            content = yield client.readBody(response)
+            try:
+                message = simplejson.loads(content)['message']
+            except Exception:
+                message = content.decode('utf-8', 'replace').strip()
+
+            raise DockerApiError(method, path, response.code, message)
+
+        defer.returnValue(response)
+
+    @staticmethod
+    def _registry_auth_headers(repository):
+        """
+        The daemon expects X-Registry-Auth on pull/push. Use the credentials stored by `docker login`
+        in the docker config file if there are any for this registry (credential helpers are not supported,
+        see uses_credential_helper())
+        """
+        registry = _get_registry(repository)
+        auth_config = {}
+
+        try:
+            encoded_auth = (
+                _load_docker_config().get('auths', {}).get(registry, {}).get('auth')
+            )
+            if encoded_auth:
+                username, _, password = (
+                    base64.b64decode(encoded_auth).decode('utf-8').partition(':')
+                )
+                auth_config = {
+                    'username': username,
+                    'password': password,
+                    'serveraddress': registry,
+                }
+        except Exception:
+            pass
+
+        return {
+            'X-Registry-Auth': base64.urlsafe_b64encode(
+                simplejson.dumps(auth_config).encode('utf-8')
+            ).decode('ascii')
+        }
+
+
+def uses_credential_helper(repository):
+    """
+    Whether the docker config file delegates the credentials of the repository's registry to a credential
+    helper (credHelpers, or credsStore for all registries), which only the docker CLI can query
+    """
+    try:
+        docker_config = _load_docker_config()
+    except Exception:
+        return False
+
+    return bool(
+        docker_config.get('credHelpers', {}).get(_get_registry(repository))
+        or docker_config.get('credsStore')
+    )
+
+
+def _get_registry(repository):
+    registry = repository.split('/')[0]
+    if '.' not in registry and ':' not in registry and registry != 'localhost':
+        registry = 'https://index.docker.io/v1/'
+
+    return registry
+
+
+def _load_docker_config():
+    config_path = os.path.join(
+        os.environ.get('DOCKER_CONFIG', os.path.expanduser('~/.docker')),
+        'config.json',
+    )
+
+    with open(config_path) as config_file:
+        return simplejson.load(config_file)
+
+
+def _quote(value, safe=''):
+    return urllib.parse.quote(value, safe=safe)
+
+
+def _bool(value):
+    return '1' if value else None
@@ -0,0 +1,807 @@
+import argparse
+import os
+import re
+import shlex
+
+import simplejson
+
+from twisted.internet import defer
+
+import clients.docker
+
+
+class _UnsupportedCommand(Exception):
+    pass
+
+
+class _ArgumentParser(argparse.ArgumentParser):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('add_help', False)
+        kwargs.setdefault('allow_abbrev', False)
+        super(_ArgumentParser, self).__init__(*args, **kwargs)
+
+    def error(self, message):
+
+        # an argument we don't know how to translate - let the docker CLI handle the command
+        raise _UnsupportedCommand(message)
+
+
+def split_command(command):
+    """
+    Split a shell command line into the argv lists of its '&&' separated commands. Returns None if the
+    command relies on anything else the shell would do for it (pipes, redirections, expansions, etc.)
+    """
+    segments = []
+    quote = None
+    start = 0
+    idx = 0
+
+    while idx < len(command):
+        char = command[idx]
+
+        if quote == '\'':
+            if char == '\'':
+                quote = None
+
+        # expanded by the shell even inside double quotes
+        elif char in '$`\\':
+            return None
+
+        elif quote == '"':
+            if char == '"':
+                quote = None
+
+        elif char in '\'"':
+            quote = char
+
+        elif command.startswith('&&', idx):
+            segments.append(command[start:idx])
+            idx += 2
+            start = idx
+            continue
+
+        elif char in '|&;<>(){}[]*?~#!\n':
+            return None
+
+        idx += 1
+
+    if quote is not None:
+        return None
+
+    segments.append(command[start:])
+    argvs = [shlex.split(segment) for segment in segments]
+
+    if not all(argvs):
+        return None
+
+    return argvs
+
+
+class Adapter(object):
+    """
+    Executes docker CLI command lines through the Engine API client, emulating the CLI's output and exit code.
+    Only the subset of the CLI manof emits is supported - anything else is left for the real CLI
+    """
+
+    def __init__(self, logger, docker_client):
+        self._logger = logger
+        self._client = docker_client
+
+    @property
+    def client(self):
+        return self._client
+
+    def execute(self, command):
+        """
+        :param command: a shell command line or an argv sequence
+        :return: A deferred firing with (out, err, code) as bytes, bytes, int, or None if the command
+            can't be executed through the API
+        :rtype: defer.Deferred or NoneType
+        """
+        argvs = split_command(command) if isinstance(command, str) else [list(command)]
+        if argvs is None:
+            return None
+
+        try:
+            operations = [self._parse(argv) for argv in argvs]
+        except _UnsupportedCommand as exc:
+            self._logger.verbose(
+                'Command not supported by docker API backend',
+                command=command,
+                reason=str(exc),
+            )
+            return None
+
+        return self._execute_operations(operations)
+
+    @defer.inlineCallbacks
+    def _execute_operations(self, operations):
+        out_lines = []
+        err_lines = []
+        code = 0
+
+        # like '&&' - stop at the first failing command
+        for operation in operations:
+            out, err = yield operation()
+            out_lines += out
+            err_lines += err
+
+            if err:
+                code = 1
+                break
+
+        defer.returnValue(
+            (
+                '\n'.join(out_lines).encode('utf-8'),
+                '\n'.join(err_lines).encode('utf-8'),
+                code,
+            )
+        )
+
+    def _parse(self, argv):
+        if len(argv) < 2 or argv[0] != 'docker':
+            raise _UnsupportedCommand('Not a docker command')
+
+        subcommand, args = argv[1], argv[2:]
+
+        # management commands (docker container rm, docker image tag, ...)
+        if subcommand in ['container', 'image', 'volume', 'network'] and args:
+            subcommand = '{0}_{1}'.format(subcommand, args[0])
+            args = args[1:]
+
+        parse = getattr(self, '_parse_{0}'.format(subcommand), None)
+        if parse is None:
+            raise _UnsupportedCommand('Unsupported subcommand: {0}'.format(subcommand))
+
+        return parse(args)
+
+    # containers
+
+    def _parse_run(self, args):
+        parsed = _container_parser('run').parse_args(args)
+
+        # attaching to the container's streams is left for the CLI
+        if not parsed.detach:
+            raise _UnsupportedCommand('Only detached runs are supported')
+
+        config = _container_config(parsed)
+
+        @defer.inlineCallbacks
+        def _run():
+            container = yield self._create_container(parsed.image, config, parsed.name)
+            yield self._client.start_container(container['Id'])
+            defer.returnValue(container['Id'])
+
+        return self._single(_run)
+
+    def _parse_create(self, args):
+        parsed = _container_parser('create').parse_args(args)
+        config = _container_config(parsed)
+
+        @defer.inlineCallbacks
+        def _create():
+            container = yield self._create_container(parsed.image, config, parsed.name)
+            defer.returnValue(container['Id'])
+
+        return self._single(_create)
+
+    _parse_container_run = _parse_run
+    _parse_container_create = _parse_create
+
+    def _parse_start(self, args):
+        parser = _ArgumentParser(prog='start')
+        parser.add_argument('containers', nargs='+')
+        parsed = parser.parse_args(args)
+
+        return self._each(parsed.containers, self._client.start_container)
+
+    def _parse_stop(self, args):
+        parser = _ArgumentParser(prog='stop')
+        parser.add_argument('-t', '--time', type=int)
+        parser.add_argument('containers', nargs='+')
+        parsed = parser.parse_args(args)
+
+        return self._each(
+            parsed.containers,
+            lambda container: self._client.stop_container(container, parsed.time),
+        )
+
+    def _parse_rm(self, args):
+        parser = _ArgumentParser(prog='rm')
+        parser.add_argument('-f', '--force', action='store_true')
+        parser.add_argument('-v', '--volumes', action='store_true')
+        parser.add_argument('containers', nargs='+')
+        parsed = parser.parse_args(args)
+
+        return self._each(
+            parsed.containers,
+            lambda container: self._client.remove_container(
+                container, force=parsed.force, volumes=parsed.volumes
+            ),
+        )
+
+    _parse_container_start = _parse_start
+    _parse_container_stop = _parse_stop
+    _parse_container_rm = _parse_rm
+
+    def _parse_inspect(self, args, inspectors=None):
+        parser = _ArgumentParser(prog='inspect')
+        parser.add_argument('-f', '--format')
+        parser.add_argument('--type', choices=['container', 'image'])
+        parser.add_argument('names', nargs='+')
+        parsed = parser.parse_args(args)
+
+        if inspectors is None:
+            inspectors = {
+                'container': [self._client.inspect_container],
+                'image': [self._client.inspect_image],
+            }.get(
+                parsed.type,
+                [self._client.inspect_container, self._client.inspect_image],
+            )
+
+        return self._inspect(parsed.names, parsed.format, inspectors)
+
+    def _parse_container_inspect(self, args):
+        return self._parse_inspect(args, [self._client.inspect_container])
+
+    def _parse_image_inspect(self, args):
+        return self._parse_inspect(args, [self._client.inspect_image])
+
+    def _parse_network_disconnect(self, args):
+        parser = _ArgumentParser(prog='network disconnect')
+        parser.add_argument('-f', '--force', action='store_true')
+        parser.add_argument('network')
+        parser.add_argument('container')
+        parsed = parser.parse_args(args)
+
+        @defer.inlineCallbacks
+        def _disconnect():
+            yield self._client.disconnect_container_from_network(
+                parsed.network, parsed.container, force=parsed.force
+            )
+            defer.returnValue(None)
+
+        return self._single(_disconnect)
+
+    # images
+
+    def _parse_pull(self, args):
+        parser = _ArgumentParser(prog='pull')
+        parser.add_argument('-q', '--quiet', action='store_true')
+        parser.add_argument('image')
+        parsed = parser.parse_args(args)
+        _check_registry_credentials(parsed.image)
+
+        @defer.inlineCallbacks
+        def _pull():
+            messages = yield self._client.pull_image(parsed.image)
+            lines = [] if parsed.quiet else _status_lines(messages)
+            defer.returnValue('\n'.join(lines + [parsed.image]))
+
+        return self._single(_pull)
+
+    def _parse_push(self, args):
+        parser = _ArgumentParser(prog='push')
+        parser.add_argument('-q', '--quiet', action='store_true')
+        parser.add_argument('image')
+        parsed = parser.parse_args(args)
+        _check_registry_credentials(parsed.image)
+
+        @defer.inlineCallbacks
+        def _push():
+            messages = yield self._client.push_image(parsed.image)
+            defer.returnValue(
+                None if parsed.quiet else '\n'.join(_status_lines(messages))
+            )
+
+        return self._single(_push)
+
+    def _parse_tag(self, args):
+        parser = _ArgumentParser(prog='tag')
+        parser.add_argument('source')
+        parser.add_argument('target')
+        parsed = parser.parse_args(args)
+
+        @defer.inlineCallbacks
+        def _tag():
+            yield self._client.tag_image(parsed.source, parsed.target)
+            defer.returnValue(None)
+
+        return self._single(_tag)
+
+    def _parse_rmi(self, args):
+        parser = _ArgumentParser(prog='rmi')
+        parser.add_argument('-f', '--force', action='store_true')
+        parser.add_argument('images', nargs='+')
+        parsed = parser.parse_args(args)
+
+        @defer.inlineCallbacks
+        def _remove_image(image):
+            deleted = yield self._client.remove_image(image, force=parsed.force)
+            defer.returnValue(
+                '\n'.join(
+                    '{0}: {1}'.format(k, v) for item in deleted for k, v in item.items()
+                )
+            )
+
+        return self._each(parsed.images, _remove_image)
+
+    _parse_image_pull = _parse_pull
+    _parse_image_push = _parse_push
+    _parse_image_tag = _parse_tag
+    _parse_image_rm = _parse_rmi
+
+    # volumes
+
+    def _parse_volume_create(self, args):
+        parser = _ArgumentParser(prog='volume create')
+        parser.add_argument('-d', '--driver', default='local')
+        parser.add_argument('--label', action='append', default=[])
+        parser.add_argument('-o', '--opt', action='append', default=[])
+        parser.add_argument('--name')
+        parser.add_argument('volume', nargs='?')
+        parsed = parser.parse_args(args)
+
+        name = parsed.volume or parsed.name
+        if name is None:
+            raise _UnsupportedCommand('Anonymous volumes are not supported')
+
+        @defer.inlineCallbacks
+        def _create():
+            volume = yield self._client.create_volume(
+                name,
+                driver=parsed.driver,
+                driver_opts=_key_values(parsed.opt),
+                labels=_key_values(parsed.label),
+            )
+            defer.returnValue(volume['Name'])
+
+        return self._single(_create)
+
+    def _parse_volume_inspect(self, args):
+        parser = _ArgumentParser(prog='volume inspect')
+        parser.add_argument('-f', '--format')
+        parser.add_argument('volumes', nargs='+')
+        parsed = parser.parse_args(args)
+
+        return self._inspect(
+            parsed.volumes, parsed.format, [self._client.inspect_volume]
+        )
+
+    def _parse_volume_rm(self, args):
+        parser = _ArgumentParser(prog='volume rm')
+        parser.add_argument('-f', '--force', action='store_true')
+        parser.add_argument('volumes', nargs='+')
+        parsed = parser.parse_args(args)
+
+        return self._each(
+            parsed.volumes,
+            lambda volume: self._client.remove_volume(volume, force=parsed.force),
+        )
+
+    def _parse_volume_ls(self, args):
+        parser = _ArgumentParser(prog='volume ls')
+        parser.add_argument('-q', '--quiet', action='store_true')
+        parser.add_argument('--format')
+        parsed = parser.parse_args(args)
+
+        if not parsed.quiet and _Template(parsed.format or '').fields != [['Name']]:
+            raise _UnsupportedCommand('Only volume names can be listed')
+
+        @defer.inlineCallbacks
+        def _list():
+            response = yield self._client.list_volumes()
+            defer.returnValue(
+                '\n'.join(volume['Name'] for volume in response['Volumes'] or [])
+            )
+
+        return self._single(_list)
+
+    # helpers
+
+    @defer.inlineCallbacks
+    def _create_container(self, image, config, name):
+        try:
+            container = yield self._client.create_container(config, name)
+        except clients.docker.DockerApiError as exc:
+            if exc.code != 404:
+                raise
+
+            # like the CLI, pull images that don't exist locally
+            yield self._client.pull_image(image)
+            container = yield self._client.create_container(config, name)
+
+        defer.returnValue(container)
+
+    def _inspect(self, names, template, inspectors):
+        template = _Template(template) if template is not None else None
+
+        @defer.inlineCallbacks
+        def _inspect_object(name):
+            for inspector in inspectors:
+                try:
+                    obj = yield inspector(name)
+                except clients.docker.DockerApiError as exc:
+                    if exc.code != 404:
+                        raise
+                else:
+                    defer.returnValue(obj)
+
+            raise clients.docker.DockerApiError(
+                'GET', name, 404, 'No such object: {0}'.format(name)
+            )
+
+        @defer.inlineCallbacks
+        def _operation():
+            out, err, objs = [], [], []
+
+            for name in names:
+                try:
+                    obj = yield _inspect_object(name)
+                except clients.docker.DockerApiError as exc:
+                    err.append('Error: {0}'.format(exc.message))
+                except Exception as exc:
+                    err.append(_daemon_error(exc))
+                else:
+                    objs.append(obj)
+                    if template is not None:
+                        out.append(template.render(obj))
+
+            if template is None:
+                out.append(simplejson.dumps(objs, indent=4))
+
+            defer.returnValue((out, err))
+
+        return _operation
+
+    @staticmethod
+    def _single(function):
+        @defer.inlineCallbacks
+        def _operation():
+            try:
+                out = yield function()
+            except Exception as exc:
+                defer.returnValue(([], [_daemon_error(exc)]))
+
+            defer.returnValue(([out] if out else [], []))
+
+        return _operation
+
+    @staticmethod
+    def _each(names, function):
+        """
+        Like the CLI, operate on all names concurrently and print the names the operation succeeded on
+        """
+
+        def _operation():
+            def _on_results(results):
+                out, err = [], []
+                for name, (success, result) in zip(names, results):
+                    if success:
+                        out.append(result if isinstance(result, str) else name)
+                    else:
+                        err.append(_daemon_error(result.value))
+
+                return out, err
+
+            d = defer.DeferredList(
+                [defer.maybeDeferred(function, name) for name in names],
+                consumeErrors=True,
+            )
+            d.addCallback(_on_results)
+            return d
+
+        return _operation
+
+
+class _Template(object):
+    """
+    The (very) small subset of go templates used with --format: {{.A.B}}, {{json .A}} and {{index .A "key"}}
+    """
+
+    _action_re = re.compile(
+        r'^(?:(?P<function>json|index)\s+)?\.(?P<path>[\w.]*)'
+        r'(?:\s+"(?P<key>[^"]*)")?$'
+    )
+
+    def __init__(self, template):
+        self._parts = []
+        self._fields = []
+
+        for idx, part in enumerate(re.split(r'{{(.*?)}}', template)):
+
+            # literal text
+            if idx % 2 == 0:
+                self._parts.append(part)
+                continue
+
+            match = self._action_re.match(part.strip())
+            if match is None or (match.group('function') == 'index') != (
+                match.group('key') is not None
+            ):
+                raise _UnsupportedCommand('Unsupported template: {0}'.format(part))
+
+            path = [field for field in match.group('path').split('.') if field]
+            self._fields.append(path)
+            self._parts.append((match.group('function'), path, match.group('key')))
+
+    @property
+    def fields(self):
+        return self._fields
+
+    def render(self, obj):
+        rendered = ''
+        for part in self._parts:
+            if isinstance(part, str):
+                rendered += part
+                continue
+
+            function, path, key = part
+            value = obj
+            for field in path:
+                value = value.get(field) if isinstance(value, dict) else None
+
+            if function == 'json':
+                rendered += simplejson.dumps(value)
+            elif function == 'index':
+                rendered += _go_format((value or {}).get(key, ''))
+            else:
+                rendered += _go_format(value)
+
+        return rendered
+
+
+def _check_registry_credentials(image):
+    repository, _ = clients.docker.split_image_reference(image)
+    if clients.docker.uses_credential_helper(repository):
+        raise _UnsupportedCommand(
+            'Registry credentials are kept by a credential helper'
+        )
+
+
+def _container_parser(prog):
+    parser = _ArgumentParser(prog=prog)
+    parser.add_argument('-d', '--detach', action='store_true')
+    parser.add_argument('-i', '--interactive', action='store_true')
+    parser.add_argument('-t', '--tty', action='store_true')
+    parser.add_argument('--rm', action='store_true')
+    parser.add_argument('--privileged', action='store_true')
+    parser.add_argument('--oom-kill-disable', action='store_true')
+    parser.add_argument('--no-healthcheck', action='store_true')
+    parser.add_argument('--name')
+    parser.add_argument('-h', '--hostname')
+    parser.add_argument('-u', '--user')
+    parser.add_argument('--pid')
+    parser.add_argument('--net', '--network', dest='net')
+    parser.add_argument('--log-driver')
+    parser.add_argument('--health-cmd')
+    parser.add_argument('--health-interval')
+    parser.add_argument('--health-retries', type=int)
+    parser.add_argument('--health-timeout')
+    parser.add_argument('-m', '--memory')
+    parser.add_argument('--memory-reservation')
+    parser.add_argument('--kernel-memory')
+    parser.add_argument('--memory-swap')
+    parser.add_argument('--memory-swappiness', type=int)
+    parser.add_argument('--cpus', type=float)
+    parser.add_argument('--cpu-period', type=int)
+    parser.add_argument('--cpu-quota', type=int)
+    parser.add_argument('--cpuset-cpus')
+    parser.add_argument('-c', '--cpu-shares', type=int)
+
+    for repeated in [
+        '--device',
+        '--dns',
+        '--add-host',
+        '--cap-add',
+        '--cap-drop',
+        '--device-cgroup-rule',
+        '--device-read-bps',
+        '--device-read-iops',
+        '--device-write-bps',
+        '--device-write-iops',
+    ]:
+        parser.add_argument(repeated, action='append', default=[])
+
+    parser.add_argument('-l', '--label', action='append', default=[])
+    parser.add_argument('-p', '--publish', action='append', default=[])
+    parser.add_argument('-v', '--volume', action='append', default=[])
+    parser.add_argument('-e', '--env', action='append', default=[])
+    parser.add_argument('image')
+    parser.add_argument('command', nargs=argparse.REMAINDER)
+
+    return parser
+
+
+def _container_config(parsed):
+    """
+    Translate parsed docker run/create arguments to an Engine API container config
+    """
+    exposed_ports = {}
+    port_bindings = {}
+    for publish in parsed.publish:
+        port, _, proto = publish.partition('/')
+        parts = port.split(':')
+        container_port = '{0}/{1}'.format(parts[-1], proto or 'tcp')
+        binding = {
+            'HostIp': parts[0] if len(parts) == 3 else '',
+            'HostPort': parts[-2] if len(parts) > 1 else '',
+        }
+        exposed_ports[container_port] = {}
+        port_bindings.setdefault(container_port, []).append(binding)
+
+    host_config = {
+        'NetworkMode': parsed.net or 'default',
+        'Privileged': parsed.privileged,
+        'AutoRemove': parsed.rm,
+        'Binds': parsed.volume,
+        'PortBindings': port_bindings,
+        'Dns': parsed.dns,
+        'ExtraHosts': parsed.add_host,
+        'CapAdd': parsed.cap_add,
+        'CapDrop': parsed.cap_drop,
+        'DeviceCgroupRules': parsed.device_cgroup_rule,
+        'Devices': [_device(device) for device in parsed.device],
+        'BlkioDeviceReadBps': _throttles(parsed.device_read_bps, _bytes),
+        'BlkioDeviceReadIOps': _throttles(parsed.device_read_iops, int),
+        'BlkioDeviceWriteBps': _throttles(parsed.device_write_bps, _bytes),
+        'BlkioDeviceWriteIOps': _throttles(parsed.device_write_iops, int),
+        'OomKillDisable': parsed.oom_kill_disable,
+    }
+
+    optional_host_config = {
+        'PidMode': parsed.pid,
+        'Memory': _bytes(parsed.memory),
+        'MemoryReservation': _bytes(parsed.memory_reservation),
+        'KernelMemory': _bytes(parsed.kernel_memory),
+        'MemorySwap': _bytes(parsed.memory_swap),
+        'MemorySwappiness': parsed.memory_swappiness,
+        'NanoCpus': int(parsed.cpus * 1e9) if parsed.cpus else None,
+        'CpuPeriod': parsed.cpu_period,
+        'CpuQuota': parsed.cpu_quota,
+        'CpusetCpus': parsed.cpuset_cpus,
+        'CpuShares': parsed.cpu_shares,
+        'LogConfig': (
+            {'Type': parsed.log_driver, 'Config': {}} if parsed.log_driver else None
+        ),
+    }
+    host_config.update({k: v for k, v in optional_host_config.items() if v is not None})
+
+    config = {
+        'Image': parsed.image,
+        'Labels': _key_values(parsed.label),
+        'Env': [_env(env) for env in parsed.env if _env(env) is not None],
+        'ExposedPorts': exposed_ports,
+        'Tty': parsed.tty,
+        'OpenStdin': parsed.interactive,
+        'HostConfig': host_config,
+    }
+
+    if parsed.command:
+        config['Cmd'] = parsed.command
+
+    if parsed.hostname:
+        config['Hostname'] = parsed.hostname
+
+    if parsed.user:
+        config['User'] = parsed.user
+
+    if parsed.no_healthcheck:
+        config['Healthcheck'] = {'Test': ['NONE']}
+    elif parsed.health_cmd is not None:
+        healthcheck = {'Test': ['CMD-SHELL', parsed.health_cmd]}
+        if parsed.health_interval:
+            healthcheck['Interval'] = _duration(parsed.health_interval)
+        if parsed.health_timeout:
+            healthcheck['Timeout'] = _duration(parsed.health_timeout)
+        if parsed.health_retries is not None:
+            healthcheck['Retries'] = parsed.health_retries
+        config['Healthcheck'] = healthcheck
+
+    return config
+
+
+def _env(env):
+    if '=' in env:
+        return env
+
+    # like the CLI, --env NAME forwards NAME from the environment, if set
+    value = os.environ.get(env)
+    return '{0}={1}'.format(env, value) if value is not None else None
+
+
+def _key_values(items):
+    key_values = {}
+    for item in items:
+        key, _, value = item.partition('=')
+        key_values[key] = value
+
+    return key_values
+
+
+def _device(device):
+    parts = device.split(':')
+    return {
+        'PathOnHost': parts[0],
+        'PathInContainer': parts[1] if len(parts) > 1 else parts[0],
+        'CgroupPermissions': parts[2] if len(parts) > 2 else 'rwm',
+    }
+
+
+def _throttles(throttles, parse_rate):
+    devices = []
+    for throttle in throttles:
+        path, _, rate = throttle.rpartition(':')
+        devices.append({'Path': path, 'Rate': parse_rate(rate)})
+
+    return devices
+
+
+def _bytes(size):
+    """
+    Parse a docker size string (e.g. 256m, 1.5g, 50mb) to bytes, in binary units like the CLI does
+    """
+    if size is None:
+        return None
+
+    if str(size) == '-1':
+        return -1
+
+    match = re.match(r'^(\d+(?:\.\d+)?)\s*([kmgtp])?i?b?$', str(size).lower())
+    if match is None:
+        raise _UnsupportedCommand('Invalid size: {0}'.format(size))
+
+    power = ' kmgtp'.index(match.group(2) or ' ')
+    return int(float(match.group(1)) * (1024**power))
+
+
+def _duration(duration):
+    """
+    Parse a go duration string (e.g. 1m30s, 500ms) to nanoseconds
+    """
+    units = {
+        'h': 3600 * 10**9,
+        'm': 60 * 10**9,
+        's': 10**9,
+        'ms': 10**6,
+        'us': 10**3,
+        'ns': 1,
+    }
+
+    parts = re.findall(r'(\d+(?:\.\d+)?)(h|ms|us|ns|m|s)', duration)
+    if not parts or ''.join(n + u for n, u in parts) != duration:
+        raise _UnsupportedCommand('Invalid duration: {0}'.format(duration))
+
+    return int(sum(float(number) * units[unit] for number, unit in parts))
+
+
+def _go_format(value):
+    if value is None:
+        return '<no value>'
+
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+
+    return str(value)
+
+
+def _status_lines(messages):
+    lines = []
+    for message in messages:
+        if 'status' not in message:
+            continue
+
+        if 'id' in message:
+            lines.append('{0}: {1}'.format(message['id'], message['status']))
+        else:
+            lines.append(message['status'])
+
+    return lines
+
+
+def _daemon_error(exc):
+    if isinstance(exc, clients.docker.DockerApiError):
+        return 'Error response from daemon: {0}'.format(exc.message)
+
+    return 'Error during connect: {0}'.format(exc)
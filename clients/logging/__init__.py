@@ -1,13 +1,12 @@
+import atexit
 import logging
 import logging.handlers
 import os
+import queue
 import sys
-
-from twisted.python.log import addObserver
+import threading
 
 from clients.logging.formatter import helpers
-import clients.logging.formatter.human_readable
-import clients.logging.formatter.json
 
 
 class Record(logging.LogRecord):
@@ -64,6 +63,123 @@ class _VariableLogging(logging.Logger):
         self._bound_variables.update(kw_args)
 
 
+class _AsyncHandler(logging.Handler):
+    """
+    Hands records to the handlers it wraps through a bounded queue, drained in batches by a writer thread,
+    so that slow terminals and disks don't stall the thread logging them (i.e. the reactor).
+
+    When the queue is full, records are either waited for (block) or, if they are below info, dropped
+    (drop-verbose). The number of dropped records is logged once the writer catches up
+    """
+
+    overflow_policies = ['block', 'drop-verbose']
+
+    _stop = object()
+
+    def __init__(self, queue_size=10000, overflow='block', batch_size=256):
+        super(_AsyncHandler, self).__init__()
+        self.handlers = []
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._overflow = overflow
+        self._batch_size = batch_size
+        self._num_dropped = 0
+        self._num_dropped_lock = threading.Lock()
+        self._writer = threading.Thread(
+            target=self._write_records, name='log-writer', daemon=True
+        )
+        self._writer.start()
+
+    def add_handler(self, handler):
+        self.handlers.append(handler)
+
+    def handle(self, record):
+
+        # don't queue records none of the handlers would emit
+        if not any(record.levelno >= handler.level for handler in self.handlers):
+            return False
+
+        # the message args and the vars dict may change once this returns
+        record.msg = record.getMessage()
+        record.args = None
+        record.vars = dict(record.vars)
+
+        if self._overflow == 'drop-verbose' and record.levelno < helpers.Severity.Info:
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                with self._num_dropped_lock:
+                    self._num_dropped += 1
+        else:
+            self._queue.put(record)
+
+        return True
+
+    def flush(self):
+        """
+        Wait for all queued records to be written
+        """
+        if self._writer.is_alive():
+            self._queue.join()
+
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(self._stop)
+            self._writer.join()
+
+        for handler in self.handlers:
+            handler.close()
+
+        super(_AsyncHandler, self).close()
+
+    def _write_records(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self._batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            stopped = False
+            for record in batch:
+                if record is self._stop:
+                    stopped = True
+                else:
+                    self._emit_to_handlers(record)
+
+            self._emit_num_dropped()
+
+            for handler in self.handlers:
+                handler.flush()
+
+            for _ in batch:
+                self._queue.task_done()
+
+            if stopped:
+                return
+
+    def _emit_to_handlers(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def _emit_num_dropped(self):
+        with self._num_dropped_lock:
+            num_dropped, self._num_dropped = self._num_dropped, 0
+
+        if num_dropped:
+            record = logging.makeLogRecord(
+                {
+                    'name': 'logging',
+                    'levelno': helpers.Severity.Warning,
+                    'levelname': logging.getLevelName(helpers.Severity.Warning),
+                    'msg': 'Dropped verbose log records, the log writer fell behind',
+                    'vars': {'num_dropped': num_dropped},
+                }
+            )
+            self._emit_to_handlers(record)
+
+
 class TwistedExceptionSink(object):
     def __init__(self, logger_instance):
         self.logger_instance = logger_instance
@@ -106,6 +222,9 @@ class Client(object):
         max_num_log_files=3,
         log_file_name=None,
         log_colors='on',
+        log_async=False,
+        log_async_queue_size=10000,
+        log_async_overflow='block',
     ):
 
         # disabled - this hijacks stdout and adds RESETCOLOR at the end regardless if we are on atty or not
@@ -117,6 +236,15 @@ class Client(object):
         self.logger = logging.getLogger(name)
         self.logger.setLevel(helpers.Severity.get_level_by_string(initial_severity))
 
+        # with async logging, handlers are wrapped by a handler writing from its own thread
+        self._async_handler = None
+        if log_async:
+            self._async_handler = _AsyncHandler(
+                queue_size=log_async_queue_size, overflow=log_async_overflow
+            )
+            self.logger.addHandler(self._async_handler)
+            atexit.register(self.close)
+
         initial_console_severity = (
             initial_console_severity
             if initial_console_severity is not None
@@ -141,6 +269,8 @@ class Client(object):
             else:  # on - colors when stdout is a tty
                 enable_colors = sys.stdout.isatty()
 
+            import clients.logging.formatter.human_readable
+
             human_stdout_handler = logging.StreamHandler(sys.__stdout__)
             human_stdout_handler.setFormatter(
                 clients.logging.formatter.human_readable.HumanReadableFormatter(
@@ -150,7 +280,7 @@ class Client(object):
             human_stdout_handler.setLevel(
                 helpers.Severity.get_level_by_string(initial_console_severity)
             )
-            self.logger.addHandler(human_stdout_handler)
+            self._add_handler(human_stdout_handler)
 
         if output_dir is not None:
             log_file_name = (
@@ -166,6 +296,9 @@ class Client(object):
                 initial_file_severity,
             )
 
+        # twisted's logging is only imported once there is a logger to sink its errors to
+        from twisted.python.log import addObserver
+
         addObserver(TwistedExceptionSink(self.logger))
 
     def enable_log_file_writing(
@@ -189,8 +322,10 @@ class Client(object):
         # Checks if the logger already have a RotatingFileHandler
         if not any(
             isinstance(h, logging.handlers.RotatingFileHandler)
-            for h in self.logger.handlers
+            for h in self._handlers()
         ):
+            import clients.logging.formatter.json
+
             helpers.make_dir_recursively(output_dir)
             log_path = os.path.join(output_dir, '{0}.log'.format(log_file_name))
 
@@ -208,7 +343,35 @@ class Client(object):
             rotating_file_handler.setLevel(
                 helpers.Severity.get_level_by_string(initial_file_severity)
             )
-            self.logger.addHandler(rotating_file_handler)
+            self._add_handler(rotating_file_handler)
+
+    def flush(self):
+        """
+        Wait for the records logged so far to be written
+        """
+        for handler in self.logger.handlers:
+            handler.flush()
+
+    def close(self):
+        """
+        Write all queued records and stop the async log writer, if any
+        """
+        if self._async_handler is not None:
+            self.logger.removeHandler(self._async_handler)
+            self._async_handler.close()
+            self._async_handler = None
+
+    def _add_handler(self, handler):
+        if self._async_handler is not None:
+            self._async_handler.add_handler(handler)
+        else:
+            self.logger.addHandler(handler)
+
+    def _handlers(self):
+        if self._async_handler is not None:
+            return self._async_handler.handlers
+
+        return self.logger.handlers
 
     @staticmethod
     def register_arguments(parser):
@@ -267,6 +430,29 @@ class Client(object):
             choices=['on', 'off', 'always'],
             default='on',
         )
+        parser.add_argument(
+            '--log-async',
+            help=(
+                'Write logs from a separate thread, so slow terminals and disks don\'t '
+                'stall execution'
+            ),
+            action='store_true',
+        )
+        parser.add_argument(
+            '--log-async-queue-size',
+            help='Max number of log records waiting to be written (with --log-async)',
+            type=int,
+            default=10000,
+        )
+        parser.add_argument(
+            '--log-async-overflow',
+            help=(
+                'What to do when the log record queue is full (with --log-async): '
+                'block until there is room, or drop verbose and debug records'
+            ),
+            choices=_AsyncHandler.overflow_policies,
+            default='block',
+        )
 
 
 class TestingClient(Client):
@@ -67,6 +67,33 @@ class JsonFormatter(logging.Formatter):
         return JsonFormatter.format_to_json_str(params)
 
 
+# created on first use, as pygments is only imported once colored output is emitted
+_json_lexer = None
+_json_terminal_formatter = None
+
+
+def highlight_json(json_str):
+    """
+    Color json for a 24 bit color terminal, reusing the same lexer and formatter
+
+    :param json_str: The json to color
+    :rtype: str
+    """
+    global _json_lexer, _json_terminal_formatter
+
+    import pygments
+    import pygments.formatters
+    import pygments.lexers
+
+    if _json_lexer is None:
+        _json_lexer = pygments.lexers.get_lexer_by_name('Json')
+        _json_terminal_formatter = pygments.formatters.get_formatter_by_name(
+            'terminal16m', style='paraiso-dark'
+        )
+
+    return pygments.highlight(json_str, _json_lexer, _json_terminal_formatter)
+
+
 def make_dir_recursively(path):
     """
     Create a directory in a location if it doesn't exist
@@ -4,12 +4,43 @@ import textwrap
 import simplejson
 
 import colorama
-import pygments.formatters
-import pygments.lexers
 
 import clients.logging.formatter.helpers as helpers
 
 
+class _JsonColors(object):
+    """
+    The colors the paraiso-dark pygments style gives json tokens, as 24 bit terminal escape sequences,
+    and templates of the json the formatter emits colored with them
+    """
+
+    punctuation = '\x1b[38;2;231;233;219m{0}\x1b[39m'
+    key = '\x1b[38;2;91;196;191m{0}\x1b[39m'
+    string = '\x1b[38;2;72;182;133m{0}\x1b[39m'
+
+    # "name": "value"
+    pair = (
+        key.format('{0}')
+        + punctuation.format(':')
+        + punctuation.format(' ')
+        + string.format('{1}')
+    )
+    pair_separator = punctuation.format(',') + punctuation.format(' ')
+
+    # {"name": "value", ...}
+    short_values = punctuation.format('{{') + '{0}' + punctuation.format('}}')
+
+    # {"name":
+    #    "wrapped text"}
+    long_value = (
+        punctuation.format('{{')
+        + key.format('{0}')
+        + punctuation.format(':')
+        + '\n{1}'
+        + punctuation.format('}}')
+    )
+
+
 class HumanReadableFormatter(logging.Formatter):
     def __init__(self, enable_colors, *args, **kwargs):
         super(HumanReadableFormatter, self).__init__(*args, **kwargs)
@@ -30,17 +61,14 @@ class HumanReadableFormatter(logging.Formatter):
         helpers.Severity.Error: colorama.Fore.LIGHTRED_EX,
     }
 
+    # Maps severity to the color of the message
+    _level_to_what_color = {
+        helpers.Severity.Info: colorama.Fore.CYAN,
+    }
+
     def format(self, record):
-        def _get_what_color():
-            return {
-                helpers.Severity.Verbose: colorama.Fore.LIGHTCYAN_EX,
-                helpers.Severity.Debug: colorama.Fore.LIGHTCYAN_EX,
-                helpers.Severity.Info: colorama.Fore.CYAN,
-                helpers.Severity.Warning: colorama.Fore.LIGHTCYAN_EX,
-                helpers.Severity.Error: colorama.Fore.LIGHTCYAN_EX,
-            }.get(record.levelno, colorama.Fore.LIGHTCYAN_EX)
-
-        # coloured using pygments
+
+        # coloured like pygments colors json
         if self._enable_colors:
             more = self._prettify_output(record.vars) if len(record.vars) else ''
         else:
@@ -59,7 +87,9 @@ class HumanReadableFormatter(logging.Formatter):
                 record.levelno, colorama.Fore.RESET
             ),
             'what': record.getMessage(),
-            'what_color': _get_what_color(),
+            'what_color': HumanReadableFormatter._level_to_what_color.get(
+                record.levelno, colorama.Fore.LIGHTCYAN_EX
+            ),
             'more': more,
         }
 
@@ -88,6 +118,10 @@ class HumanReadableFormatter(logging.Formatter):
         dictionary, if the string value is larger than 40 chars, wrap the string using textwrap and
         output it last.
 
+        The short values and the long strings are colored directly, which is much faster than a pygments
+        highlight pass yet produces the same output. Nested dictionaries (and long strings pygments would
+        not read as a single json string) are still colored by pygments
+
         :param vars_dict: dictionary containing the message vars
         :type vars_dict: dict(str: str)
         :rtype: str
@@ -108,6 +142,7 @@ class HumanReadableFormatter(logging.Formatter):
                         simplejson.dumps(
                             var_value, indent=4, cls=helpers.ObjectEncoder
                         ),
+                        True,
                     )
                 )
 
@@ -122,7 +157,10 @@ class HumanReadableFormatter(logging.Formatter):
                     replace_whitespace=False,
                 )
 
-                long_values.append((var_name, wrapped_text))
+                # quotes and escapes inside the raw text break it into several json tokens
+                long_values.append(
+                    (var_name, wrapped_text, '"' in var_value or '\\' in var_value)
+                )
             else:
                 short_values.append((var_name, str(var_value)))
 
@@ -132,22 +170,56 @@ class HumanReadableFormatter(logging.Formatter):
         #                 "very long text for debugging purposes"}
 
         # The long text is not a full json string, but a raw string (not escaped), as to keep it human readable,
-        # but it is surrounded by double-quotes so the coloring lexer will eat it up
-        values_str = ''
+        # but it is surrounded by double-quotes so it is colored like a json string
+        colored_lines = []
         if short_values:
-            values_str = helpers.JsonFormatter.format_to_json_str(
-                {k: v for k, v in short_values}
-            )
-        if long_values:
-            values_str += '\n'
+            colored_lines.append(self._color_short_values(short_values))
 
-            for lv_name, lv_value in long_values:
-                values_str += '{{{0}:\n{1}}}\n'.format(
-                    helpers.JsonFormatter.format_to_json_str(lv_name),
-                    lv_value.rstrip('\n'),
+        for lv_name, lv_value, needs_lexer in long_values:
+            lv_name = helpers.JsonFormatter.format_to_json_str(lv_name)
+            lv_value = lv_value.rstrip('\n')
+
+            if needs_lexer:
+                colored_lines.append(
+                    helpers.highlight_json(
+                        '{{{0}:\n{1}}}'.format(lv_name, lv_value)
+                    ).rstrip('\n')
+                )
+            else:
+                colored_lines.append(self._color_long_value(lv_name, lv_value))
+
+        return '\n'.join(colored_lines) + '\n'
+
+    @staticmethod
+    def _color_short_values(short_values):
+        """
+        Colors {"name": "value", ...} for a dictionary whose values are all strings
+        """
+        return _JsonColors.short_values.format(
+            _JsonColors.pair_separator.join(
+                _JsonColors.pair.format(
+                    helpers.JsonFormatter.format_to_json_str(name),
+                    helpers.JsonFormatter.format_to_json_str(value),
                 )
-        json_lexer = pygments.lexers.get_lexer_by_name('Json')
-        formatter = pygments.formatters.get_formatter_by_name(
-            'terminal16m', style='paraiso-dark'
+                for name, value in short_values
+            )
         )
-        return pygments.highlight(values_str, json_lexer, formatter)
+
+    @staticmethod
+    def _color_long_value(name, wrapped_text):
+        """
+        Colors {"name":\n   "wrapped text"}, where the wrapped text may span several lines. Like pygments,
+        each line is colored separately and the indent of the first line is colored as whitespace
+        """
+        lines = wrapped_text.split('\n')
+        first_line = lines[0].lstrip(' ')
+        indent = lines[0][: len(lines[0]) - len(first_line)]
+        lines[0] = first_line
+
+        colored_text = '\n'.join(
+            _JsonColors.string.format(line) if line else '' for line in lines
+        )
+        if indent:
+            colored_text = _JsonColors.punctuation.format(indent) + colored_text
+
+        return _JsonColors.long_value.format(name, colored_text)
@@ -1,39 +1,141 @@
 import datetime
 import logging
 
+import simplejson
+import simplejson.encoder
+
 import clients.logging.formatter.helpers
 
+# encodes a str as an ascii json string (C accelerated where available)
+_encode_str = simplejson.encoder.encode_basestring_ascii
+
+# how the values of the most common types are encoded, exactly as simplejson would encode them
+_encoders_by_type = {
+    str: _encode_str,
+    int: int.__repr__,
+    bool: lambda value: 'true' if value else 'false',
+    type(None): lambda value: 'null',
+}
+
 
 class FilebeatJsonFormatter(logging.Formatter):
+    """
+    Formats records as the json documents filebeat ships:
+    {"when": ..., "who": ..., "severity": ..., "what": ..., "more": {vars}, "ctx": ..., "lang": "py"}
+
+    The output is the same as simplejson.dumps() of the document, but the document is assembled from
+    pre-encoded parts: the static envelope, the timestamp of the second (cached), the encoded logger names
+    and severities (cached) and the vars, encoded by type. Values that can't be encoded as utf-8 are
+    re-encoded on their own
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(FilebeatJsonFormatter, self).__init__(*args, **kwargs)
+        self._timestamp_second = None
+        self._timestamp_second_str = None
+        self._encoded_names = {}
+        self._encoded_severities = {}
+
     def format(self, record):
 
         # handle non-json-parsable vars:
         try:
 
             # we can't delete from record.vars because of other handlers
-            more = dict(record.vars) if len(record.vars) else {}
-            try:
-                del more['ctx']
-            except Exception:
-                pass
+            more = self._encode_vars(record.vars)
         except Exception as exc:
-            more = f'Record vars are not parsable: {str(exc)}'
+            more = _encode_str(f'Record vars are not parsable: {str(exc)}')
 
         try:
             what = record.getMessage()
         except Exception as exc:
             what = f'Log message is not parsable: {str(exc)}'
 
-        output = {
-            'when': datetime.datetime.fromtimestamp(record.created).isoformat(),
-            'who': record.name,
-            'severity': logging.getLevelName(record.levelno),
-            'what': what,
-            'more': more,
-            'ctx': record.vars.get('ctx', ''),
-            'lang': 'py',
-        }
-
-        return clients.logging.formatter.helpers.JsonFormatter.format_to_json_str(
-            output
+        try:
+            ctx = self._encode_value(record.vars.get('ctx', ''))
+        except Exception:
+            ctx = _encode_str('')
+
+        return (
+            '{"when": "'
+            + self._format_when(record.created)
+            + '", "who": '
+            + self._encode_name(record.name)
+            + ', "severity": '
+            + self._encode_severity(record.levelno)
+            + ', "what": '
+            + self._encode_value(what)
+            + ', "more": '
+            + more
+            + ', "ctx": '
+            + ctx
+            + ', "lang": "py"}'
         )
+
+    def _format_when(self, created):
+        """
+        datetime.fromtimestamp(created).isoformat(), with the part up to the second computed once a second
+        """
+        second = int(created)
+        microsecond = round((created - second) * 1e6)
+        if microsecond >= 1000000:
+            second += 1
+            microsecond -= 1000000
+
+        if second != self._timestamp_second:
+            self._timestamp_second = second
+            self._timestamp_second_str = datetime.datetime.fromtimestamp(
+                second
+            ).isoformat()
+
+        if not microsecond:
+            return self._timestamp_second_str
+
+        return '{0}.{1:06d}'.format(self._timestamp_second_str, microsecond)
+
+    def _encode_name(self, name):
+        encoded_name = self._encoded_names.get(name)
+        if encoded_name is None:
+            encoded_name = self._encoded_names[name] = _encode_str(name)
+
+        return encoded_name
+
+    def _encode_severity(self, levelno):
+        encoded_severity = self._encoded_severities.get(levelno)
+        if encoded_severity is None:
+            encoded_severity = self._encoded_severities[levelno] = self._encode_value(
+                logging.getLevelName(levelno)
+            )
+
+        return encoded_severity
+
+    def _encode_vars(self, record_vars):
+        if not len(record_vars):
+            return '{}'
+
+        encoded_vars = []
+        for name, value in record_vars.items():
+            if name == 'ctx':
+                continue
+
+            if type(name) is not str:
+                return self._encode_value(
+                    {
+                        name: value
+                        for name, value in record_vars.items()
+                        if name != 'ctx'
+                    }
+                )
+
+            encoded_vars.append(_encode_str(name) + ': ' + self._encode_value(value))
+
+        return '{' + ', '.join(encoded_vars) + '}'
+
+    @staticmethod
+    def _encode_value(value):
+        encoder = _encoders_by_type.get(type(value))
+        if encoder is not None:
+            return encoder(value)
+
+        # everything else (including floats, for their special values) as simplejson encodes it
+        return clients.logging.formatter.helpers.JsonFormatter.format_to_json_str(value)
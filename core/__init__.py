@@ -3,12 +3,21 @@ import sys
 import inspect
 import inflection
 import os
+import time
 import importlib.machinery
 
 from twisted.internet import defer
+from twisted.python import failure
 
 import manof
+import manof.image
 import manof.utils
+import manof.utils.metrics
+import manof.utils.profiling
+import manof.utils.tracing
+import core.history
+import core.parallelism
+import core.scheduler
 import core.update_manager
 
 
@@ -21,6 +30,10 @@ class RootTarget(manof.Target):
 
 
 class Manof(object):
+
+    # commands run on many images at once by a single docker command
+    _batched_commands = ['stop', 'rm']
+
     def __init__(self, logger, args, known_arg_options):
         self._logger = logger
         self._args = self._ungreedify_targets(args, known_arg_options)
@@ -39,12 +52,69 @@ class Manof(object):
             self._args.num_retries + 1 if self._args.command in ['pull', 'push'] else 1
         )
 
+        # with --parallel auto, how many commands run at a time adapts to the daemon and the host
+        self._adaptive_parallelism = None
+        if self._args.parallel == 'auto':
+            if not 1 <= self._args.parallel_min <= self._args.parallel_max:
+                raise ValueError(
+                    '--parallel-min must be at least 1 and at most --parallel-max'
+                )
+
+            self._adaptive_parallelism = core.parallelism.AdaptiveParallelism(
+                self._logger, self._args.parallel_min, self._args.parallel_max
+            )
+            manof.utils.observe_commands(self._adaptive_parallelism)
+
+        if 'docker_backend' in self._args and self._args.docker_backend == 'api':
+
+            # twisted.web is only needed by the api backend
+            import clients.docker
+            import clients.docker.cli
+
+            docker_socket = (
+                self._args.docker_socket or clients.docker.default_socket_path()
+            )
+
+            self._logger.debug('Using docker engine API backend', socket=docker_socket)
+            docker_client = clients.docker.Client(
+                self._logger,
+                docker_socket,
+                max_connections=(
+                    self._args.parallel_max
+                    if self._adaptive_parallelism is not None
+                    else max(self._args.parallel or 1, 1)
+                ),
+            )
+            manof.utils.use_docker_api(
+                clients.docker.cli.Adapter(self._logger, docker_client)
+            )
+
+        if 'trace_file' in self._args and self._args.trace_file:
+            manof.utils.tracing.enable(self._args.trace_file)
+
+        if 'metrics_file' in self._args and self._args.metrics_file:
+            manof.utils.metrics.enable(self._args.metrics_file)
+
+        if 'profile_manofest' in self._args and self._args.profile_manofest:
+            manof.utils.profiling.start_property_profiler()
+
         manof_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
         self._update_manager = core.update_manager.UpdateManager(
             self._logger, manof_path
         )
         self._alias_target_map = {}
 
+        # {resource class: limit} set by the manofest's resource_limits, once loaded
+        self._manofest_resource_limits = {}
+
+        # the durations of the commands run on each target, kept across invocations (not of dry runs)
+        self._history = None
+        if (
+            not ('no_history' in self._args and self._args.no_history)
+            and not self._args.dry_run
+        ):
+            self._history = core.history.History(self._get_history_path())
+
     def _ungreedify_targets(self, parsed_args, known_arg_options):
         """
         We cleanup unknown argument values from the greedy 'targets' nargs. This is to allow using spaces in the
@@ -68,11 +138,13 @@ class Manof(object):
             ):
                 if value in parsed_args.targets:
                     parsed_args.targets.remove(value)
-                if not len(parsed_args.targets):
-                    raise IOError(
-                        'No targets arguments found. You must have entered a bad'
-                        ' argument combination'
-                    )
+
+                    # only an emptied list is an error - stats may be given no targets at all
+                    if not len(parsed_args.targets):
+                        raise IOError(
+                            'No targets arguments found. You must have entered a bad'
+                            ' argument combination'
+                        )
 
         return parsed_args
 
@@ -89,24 +161,108 @@ class Manof(object):
             )
             raise failure
 
-        # get deferred and attach errback so we have tracebacks
-        d = defer.maybeDeferred(getattr(self, self._args.command))
-        d.addErrback(_log_tracebacks)
+        started = time.time()
+        succeeded = False
+
+        try:
+            with manof.utils.tracing.span(self._args.command, 'command'):
+
+                # get deferred and attach errback so we have tracebacks
+                d = defer.maybeDeferred(getattr(self, self._args.command))
+                d.addErrback(_log_tracebacks)
+
+                # wait for the command to run
+                yield d
+
+            succeeded = True
+        finally:
+            self._write_trace()
+            self._report_property_profile()
+            self._write_metrics(started, succeeded)
+            self._write_history()
+
+    def _report_property_profile(self):
+        profiler = manof.utils.profiling.stop_property_profiler()
+        if profiler is None:
+            return
+
+        # stdout may be the output of the command (e.g. serialize)
+        sys.stderr.write(profiler.format_table() + '\n')
+
+        if self._args.profile_manofest_json:
+            with open(self._args.profile_manofest_json, 'w') as profile_file:
+                profile_file.write(profiler.format_json())
+
+    def _write_metrics(self, started, succeeded):
+        if not manof.utils.metrics.is_enabled():
+            return
+
+        ended = time.time()
+        command = self._args.command
+        manof.utils.metrics.observe(
+            'manof_command_duration_seconds', ended - started, command=command
+        )
+        manof.utils.metrics.set_gauge(
+            'manof_command_success', int(succeeded), command=command
+        )
+        manof.utils.metrics.set_gauge(
+            'manof_command_last_run_timestamp_seconds', ended, command=command
+        )
+
+        try:
+            manof.utils.metrics.write()
+        except Exception as exc:
+            self._logger.warn(
+                'Failed to write metrics file',
+                metrics_file=self._args.metrics_file,
+                exc=repr(exc),
+            )
+        else:
+            self._logger.debug(
+                'Wrote metrics file', metrics_file=self._args.metrics_file
+            )
+
+    def _write_history(self):
+        if self._history is None:
+            return
+
+        try:
+            self._history.write()
+        except Exception as exc:
+            self._logger.warn(
+                'Failed to write history', path=self._history.path, exc=repr(exc)
+            )
 
-        # wait for the command to run
-        yield d
+    def _write_trace(self):
+        if not manof.utils.tracing.is_enabled():
+            return
+
+        try:
+            manof.utils.tracing.write()
+        except Exception as exc:
+            self._logger.warn(
+                'Failed to write trace file',
+                trace_file=self._args.trace_file,
+                exc=repr(exc),
+            )
+        else:
+            self._logger.debug('Wrote trace file', trace_file=self._args.trace_file)
 
     def provision(self):
         return self._run_command_on_target_tree('provision')
 
+    @defer.inlineCallbacks
     def run(self):
-        return self._run_command_on_target_tree('run')
+        results = yield self._run_command_on_target_tree('run')
+        self._log_incremental_run_summary(results)
 
     def stop(self):
         return self._run_command_on_target_tree('stop')
 
+    @defer.inlineCallbacks
     def lift(self):
-        return self._run_command_on_target_tree('lift')
+        results = yield self._lift_target_tree()
+        self._log_incremental_run_summary(results)
 
     def rm(self):
         return self._run_command_on_target_tree('rm')
@@ -120,6 +276,29 @@ class Manof(object):
     def update(self):
         return self._update_manager.update()
 
+    def stats(self):
+        history = core.history.History(self._get_history_path())
+        target_names = set(self._args.targets) | set(
+            inflection.underscore(target) for target in self._args.targets
+        )
+
+        stats = history.get_stats(target_names, self._args.last)
+        if not stats:
+            self._logger.info('No history recorded yet', path=history.path)
+            return
+
+        sys.stdout.write(core.history.format_stats(stats) + '\n')
+
+        for row in stats:
+            if row['regressed']:
+                self._logger.warn(
+                    'Command regressed',
+                    target=row['target'],
+                    command=row['command'],
+                    last=round(row['last'], 3),
+                    change=round(row['change'], 3),
+                )
+
     @defer.inlineCallbacks
     def serialize(self):
         targets = []
@@ -134,62 +313,433 @@ class Manof(object):
 
     @defer.inlineCallbacks
     def _run_command_on_target_tree(self, command_name):
+        """
+        Runs the command on all targets, returns {target name: command result}
+        """
+        target_root = self._load_manofest()
+        number_of_parallel_commands = self._get_parallelism()
+        graph = core.scheduler.TargetGraph.from_target_tree(target_root)
+        resource_limits = self._create_resource_limits()
+
+        if command_name in self._batched_commands:
+            results = yield self._run_batched_command_on_target_graph(
+                graph, command_name, number_of_parallel_commands, resource_limits
+            )
+        else:
+            scheduler = core.scheduler.Scheduler(
+                self._logger, number_of_parallel_commands, resource_limits
+            )
+            results = yield scheduler.run(
+                graph,
+                lambda target: self._run_command_on_target(target, command_name),
+                resource_class=lambda target: target.resource_class(command_name),
+                weights=self._get_history_weights(
+                    {target: [command_name] for target in graph.targets}
+                ),
+            )
+
+        defer.returnValue(results)
+
+    @defer.inlineCallbacks
+    def _lift_target_tree(self):
+        """
+        Lifts in two phases that overlap: all images are provisioned concurrently (bounded by
+        --provision-parallel), and containers are run in dependency order - each as soon as its own image
+        is provisioned and the targets it depends on are running. Targets overriding lift() are lifted
+        as a whole in dependency order. Returns {target name: lift result}
+        """
         target_root = self._load_manofest()
-        number_of_parallel_commands = (
-            1 if self._args.parallel is None else self._args.parallel
+        number_of_parallel_commands = self._get_parallelism()
+        number_of_parallel_provisions = (
+            number_of_parallel_commands
+            if self._args.provision_parallel is None
+            else self._args.provision_parallel
         )
-        semaphore = defer.DeferredSemaphore(number_of_parallel_commands)
-        yield self._run_command_on_target_children(target_root, command_name, semaphore)
+        graph = core.scheduler.TargetGraph.from_target_tree(target_root)
+        resource_limits = self._create_resource_limits()
+
+        two_phase_targets = [
+            target
+            for target in graph.targets
+            if isinstance(target, manof.Image) and type(target).lift is manof.Image.lift
+        ]
+
+        weights = self._get_history_weights(
+            {
+                target: (
+                    ['provision', 'run'] if target in two_phase_targets else ['lift']
+                )
+                for target in graph.targets
+            }
+        )
+        critical_path_lengths = graph.critical_path_lengths(weights)
+
+        # provision the images heading the longest chains first, so their runs can start early. once a
+        # provision or a run fails the rest of the provisions aren't started, and fail like it
+        provision_semaphore = self._create_semaphore(number_of_parallel_provisions)
+        failures = []
+
+        def _provision(target):
+            if failures:
+                return defer.fail(failures[0])
+
+            d = self._run_command_on_target(target, 'provision')
+            d.addErrback(lambda failure: failures.append(failure) or failure)
+            return d
+
+        provisions = {
+            target: resource_limits.run(
+                target.resource_class('provision'),
+                provision_semaphore.run,
+                _provision,
+                target,
+            )
+            for target in sorted(
+                two_phase_targets, key=lambda target: -critical_path_lengths[target]
+            )
+        }
+
+        def _command_name(target):
+            return 'run' if target in provisions else 'lift'
+
+        scheduler = core.scheduler.Scheduler(
+            self._logger, number_of_parallel_commands, resource_limits
+        )
+        results = yield scheduler.run(
+            graph,
+            lambda target: self._run_command_on_target(target, _command_name(target)),
+            prerequisites=provisions,
+            resource_class=lambda target: target.resource_class(_command_name(target)),
+            weights=weights,
+            on_failure=failures.append,
+        )
+
+        defer.returnValue(results)
 
     @defer.inlineCallbacks
-    def _run_command_on_target_node_and_children(self, target, command_name, semaphore):
-        yield semaphore.acquire()
+    def _run_batched_command_on_target_graph(
+        self, graph, command_name, number_of_parallel_commands, resource_limits
+    ):
+        """
+        Tears the graph down level by level, leaves first, so targets are stopped before the targets they
+        depend on. Images on a level that don't override the command are handled by one docker command per
+        chunk of them, all chunks at once (docker stops the containers of each concurrently, so a level
+        takes about one --time grace period). The other targets run one by one, up to
+        number_of_parallel_commands at a time. Each chunk or target takes a slot of its resource class.
+        If the command fails on any target of a level, the next levels aren't started.
+        Returns {target name: command result}
+        """
+        semaphore = self._create_semaphore(number_of_parallel_commands)
+        results = {}
+
+        for level in graph.teardown_levels():
+            batched_targets = [
+                target
+                for target in level
+                if isinstance(target, manof.Image)
+                and getattr(type(target), command_name)
+                is getattr(manof.Image, command_name)
+            ]
+            chunk_size = manof.image.Constants.MAX_CONTAINERS_PER_COMMAND
+
+            # a chunk holds targets of a single resource class
+            targets_by_resource_class = {}
+            for target in batched_targets:
+                targets_by_resource_class.setdefault(
+                    target.resource_class(command_name), []
+                ).append(target)
+
+            operations = [
+                resource_limits.run(
+                    resource_class,
+                    self._run_command_on_batch,
+                    targets[index : index + chunk_size],
+                    command_name,
+                )
+                for resource_class, targets in targets_by_resource_class.items()
+                for index in range(0, len(targets), chunk_size)
+            ]
+            operations += [
+                resource_limits.run(
+                    target.resource_class(command_name),
+                    semaphore.run,
+                    self._run_command_on_single_target,
+                    target,
+                    command_name,
+                )
+                for target in level
+                if target not in batched_targets
+            ]
+
+            outcomes = yield defer.gatherResults(operations, consumeErrors=True)
+
+            failures = []
+            for target, outcome in [
+                item
+                for operation_outcomes in outcomes
+                for item in operation_outcomes.items()
+            ]:
+                if isinstance(outcome, failure.Failure):
+                    failures.append(outcome)
+                    self._logger.warn(
+                        'Command failed on target',
+                        command=command_name,
+                        target=target.name,
+                        error=outcome.getErrorMessage(),
+                    )
+                else:
+                    results[target.name] = outcome
+
+            if failures:
+                failures[0].raiseException()
+
+        defer.returnValue(results)
+
+    def _get_history_path(self):
+        return core.history.get_path(self._args.manofest_path)
+
+    def _get_history_weights(self, command_names):
+        """
+        Returns {target: the sum of the durations the history expects of its commands}, for the longest
+        chains of work to start first. Targets without history weigh as much as the average target with.
+        Returns None if there's no history of any target, for targets to weigh the same
+        :param command_names: {target: [names of the commands to run on it]}
+        :type command_names: dict
+        """
+        if self._history is None:
+            return None
+
         try:
-            yield manof.utils.retry_until_successful(
-                self._number_of_tries, self._logger, getattr(target, command_name)
+            expected_durations = {
+                command_name: self._history.get_expected_durations(command_name)
+                for command_name in set(sum(command_names.values(), []))
+            }
+        except Exception as exc:
+            self._logger.warn(
+                'Failed to read history', path=self._history.path, exc=repr(exc)
             )
-        except Exception as e:
-            semaphore.release()
-            raise e
+            return None
+
+        weights = {}
+        for target, target_command_names in command_names.items():
+            durations = [
+                expected_durations[command_name][target.name]
+                for command_name in target_command_names
+                if target.name in expected_durations[command_name]
+            ]
+
+            if durations:
+                weights[target] = sum(durations)
+
+        if not weights:
+            return None
+
+        average_weight = sum(weights.values()) / len(weights)
+        for target in command_names:
+            weights.setdefault(target, average_weight)
+
+        self._logger.debug(
+            'Weighing targets by history',
+            weights={
+                target.name: round(weight, 3) for target, weight in weights.items()
+            },
+        )
+        return weights
 
-        semaphore.release()
-        yield self._run_command_on_target_children(target, command_name, semaphore)
+    def _get_parallelism(self):
+        """
+        How many commands to run at a time - a number, or the AdaptiveParallelism of --parallel auto
+        """
+        if self._adaptive_parallelism is not None:
+            return self._adaptive_parallelism
+
+        return 1 if self._args.parallel is None else self._args.parallel
+
+    @staticmethod
+    def _create_semaphore(parallelism):
+
+        # the slots of an adaptive parallelism are shared by all the commands of the invocation
+        if isinstance(parallelism, core.parallelism.AdaptiveParallelism):
+            return parallelism
+
+        return defer.DeferredSemaphore(parallelism)
+
+    def _create_resource_limits(self):
+        """
+        The limits of the manofest's resource_limits, overridden by --resource-limit
+        """
+        limits = dict(self._manofest_resource_limits)
+        if 'resource_limit' in self._args and self._args.resource_limit:
+            limits.update(self._args.resource_limit)
+
+        for resource_class, limit in limits.items():
+            if not isinstance(limit, int) or limit < 1:
+                raise ValueError(
+                    'Invalid limit of resource class {0}: {1}'.format(
+                        resource_class, limit
+                    )
+                )
+
+        if limits:
+            self._logger.debug('Limiting resource classes', limits=limits)
+
+        return core.scheduler.ResourceLimits(limits)
+
+    def _run_command_on_single_target(self, target, command_name):
+        """
+        Returns a deferred firing with {target: command result or failure}
+        """
+        d = self._run_command_on_target(target, command_name)
+        d.addBoth(lambda outcome: {target: outcome})
+        return d
+
+    @defer.inlineCallbacks
+    def _run_command_on_batch(self, targets, command_name):
+        """
+        Returns a deferred firing with {target: command result or failure}
+        """
+        started = time.time()
 
-    def _run_command_on_target_children(self, target, command_name, semaphore):
-        defer_list = [
-            self._run_command_on_target_node_and_children(
-                dependent_target, command_name, semaphore
+        with manof.utils.tracing.span(
+            '{0} {1} targets'.format(command_name, len(targets)),
+            'target',
+            targets=[target.name for target in targets],
+        ):
+            try:
+                failures = yield getattr(manof.Image, 'batched_' + command_name)(
+                    targets
+                )
+            except Exception:
+                batch_failure = failure.Failure()
+                failures = {target: batch_failure for target in targets}
+
+        duration = time.time() - started
+        outcomes = {}
+        for target in targets:
+            manof.utils.metrics.observe(
+                'manof_target_duration_seconds',
+                duration,
+                command=command_name,
+                target=target.name,
             )
-            for dependent_target in target.dependent_targets
+
+            outcomes[target] = failures.get(target)
+            if self._history is not None:
+                self._history.record(
+                    target.name, command_name, duration, outcomes[target] is None
+                )
+
+            if outcomes[target] is not None:
+                manof.utils.metrics.inc(
+                    'manof_target_failures_total',
+                    command=command_name,
+                    target=target.name,
+                )
+
+        defer.returnValue(outcomes)
+
+    @defer.inlineCallbacks
+    def _run_command_on_target(self, target, command_name):
+        started = time.time()
+        result = None
+        succeeded = False
+
+        try:
+            with manof.utils.tracing.span(
+                '{0} {1}'.format(command_name, target.name),
+                'target',
+                target=target.name,
+            ):
+                result = yield manof.utils.retry_until_successful(
+                    self._number_of_tries, self._logger, getattr(target, command_name)
+                )
+
+            succeeded = True
+        except Exception:
+            manof.utils.metrics.inc(
+                'manof_target_failures_total', command=command_name, target=target.name
+            )
+            raise
+        finally:
+            duration = time.time() - started
+            manof.utils.metrics.observe(
+                'manof_target_duration_seconds',
+                duration,
+                command=command_name,
+                target=target.name,
+            )
+
+            # skipped runs and provisions (incremental runs, build cache hits) tell nothing of how long
+            # the command takes on the target
+            if self._history is not None and result not in [
+                manof.image.Constants.RUN_RESULT_SKIPPED,
+                manof.image.Constants.PROVISION_RESULT_SKIPPED,
+            ]:
+                self._history.record(target.name, command_name, duration, succeeded)
+
+        if result in [
+            manof.image.Constants.RUN_RESULT_SKIPPED,
+            manof.image.Constants.RUN_RESULT_RECREATED,
+            manof.image.Constants.PROVISION_RESULT_SKIPPED,
+        ]:
+            manof.utils.metrics.inc(
+                'manof_target_results_total',
+                command=command_name,
+                target=target.name,
+                result=result,
+            )
+
+        defer.returnValue(result)
+
+    def _log_incremental_run_summary(self, results):
+        if 'incremental' not in self._args or not self._args.incremental:
+            return
+
+        skipped = [
+            name
+            for name, result in results.items()
+            if result == manof.image.Constants.RUN_RESULT_SKIPPED
+        ]
+        recreated = [
+            name
+            for name, result in results.items()
+            if result == manof.image.Constants.RUN_RESULT_RECREATED
         ]
 
-        return defer.DeferredList(defer_list, fireOnOneErrback=True, consumeErrors=True)
+        self._logger.info(
+            'Incremental run summary', skipped=skipped, recreated=recreated
+        )
 
     def _load_manofest(self):
 
         # load the manofest
-        targets = self._load_targets_from_manofest(self._args.manofest_path)
+        with manof.utils.tracing.span(
+            'load manofest', 'manofest', manofest_path=self._args.manofest_path
+        ):
+            targets = self._load_targets_from_manofest(self._args.manofest_path)
 
         # create a new argparser
         secondary_ap = argparse.ArgumentParser(conflict_handler='resolve')
 
         # pass I
         # iterate over targets and register class level arguments
-        for target in targets:
-            target.register_args(secondary_ap)
+        with manof.utils.tracing.span('argument pass I', 'arguments'):
+            for target in targets:
+                target.register_args(secondary_ap)
 
-        # iterate over the targets and replace the args
-        for target in targets:
-            target.update_args(secondary_ap.parse_known_args()[0])
+            # iterate over the targets and replace the args
+            for target in targets:
+                target.update_args(secondary_ap.parse_known_args()[0])
 
         # pass II
         # iterate over targets and register env args
-        for target in targets:
-            target.register_env_args(secondary_ap)
+        with manof.utils.tracing.span('argument pass II', 'arguments'):
+            for target in targets:
+                target.register_env_args(secondary_ap)
 
-        # iterate over the targets again and update the new env args
-        for target in targets:
-            target.update_args(secondary_ap.parse_known_args()[0])
+            # iterate over the targets again and update the new env args
+            for target in targets:
+                target.update_args(secondary_ap.parse_known_args()[0])
 
         # we don't allow store_true args in manofest, and this is enforcing it.
         # the reason for that is the way that _ungreedify_targets() cleanup unknown args,
@@ -208,6 +758,7 @@ class Manof(object):
         # start by loading the manofest module
         self._logger.debug('Loading manofest', manofest_path=manofest_path)
         manofest_module = self._load_manofest_module(manofest_path)
+        self._manofest_resource_limits = getattr(manofest_module, 'resource_limits', {})
 
         # normalize to cls names
         excluded_targets = self._normalize_target_names_to_cls_names(
@@ -334,23 +885,25 @@ class Manof(object):
 
     def _target_tree_from_target_list(self, targets):
         """
-        Returns a root target under which the tree of targets fans out
+        Returns a root target under which the graph of targets fans out
 
         Given:
          a has no dependency
          b depends on a
          c depends on b
-         d depends on a
+         d depends on a and c
          e has no dependency
          f depends on e
 
-        and the list of targets passed in the arguments is only a, b, c, d, f, the tree will look like:
+        and the list of targets passed in the arguments is only a, b, c, d, f, the graph will look like:
 
-        root -> a -> b -> c
+        root -> a -> b -> c -> d
                   -> d
              -> f
 
-        since e was not passed, f will depend on root. If e were passed, there would be e -> f under root
+        since e was not passed, f will depend on root. If e were passed, there would be e -> f under root.
+        A target depending on several targets is a dependent target of each of them, and will only run
+        once all of them are done
         """
 
         def _get_target_by_name(target_name):
@@ -363,22 +916,45 @@ class Manof(object):
         # services no purpose other than being a root
         root_target = RootTarget(self._logger, self._args)
 
-        # iterate over the targets and add each target to its parent. if it has one. otherwise add it to root_target
+        # get the parent targets, according to the "depends_on" member. parent targets that are not in
+        # the list (meaning either the user misspelled the target or simply didn't pass the target in
+        # the args) are ignored
+        dependencies = {}
         for target in targets:
-            if target.depends_on is not None:
-
-                # get the parent target, according to the "depends_on" member. if there is no parent target,
-                # or if the parent target is not in the list (meaning either the user misspelled the target or simply
-                # didn't pass the target in the args) add it to the root
-                parent_target = _get_target_by_name(target.depends_on) or root_target
+            depends_on = target.depends_on
+            if isinstance(depends_on, str):
+                depends_on = [depends_on]
+
+            parent_targets = [
+                _get_target_by_name(parent_name) for parent_name in depends_on or []
+            ]
+            dependencies[target] = [
+                parent_target
+                for parent_target in parent_targets
+                if parent_target is not None
+            ]
+
+        # raises if the targets depend on each other in a cycle
+        graph = core.scheduler.TargetGraph(targets, dependencies)
+
+        # add each target to its parents. if it has none, add it to root_target
+        for target in graph.targets:
+            for parent_target in graph.parents(target) or [root_target]:
                 parent_target.add_dependent_target(target)
-            else:
-                root_target.add_dependent_target(target)
 
         return root_target
 
-    def _get_next_dependent_target(self, parent_target):
+    def _get_next_dependent_target(self, parent_target, visited_targets=None):
+
+        # targets with several parents are reachable through each of them, only return them once
+        if visited_targets is None:
+            visited_targets = set()
+
         for dependent_target in parent_target.dependent_targets:
+            if dependent_target in visited_targets:
+                continue
+
+            visited_targets.add(dependent_target)
 
             # return this target
             yield dependent_target
@@ -388,7 +964,7 @@ class Manof(object):
 
                 # iterate through the dependent targets of the dependent target
                 for dependent_target in self._get_next_dependent_target(
-                    dependent_target
+                    dependent_target, visited_targets
                 ):
                     yield dependent_target
 
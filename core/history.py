@@ -0,0 +1,249 @@
+import contextlib
+import hashlib
+import os
+import sqlite3
+import statistics
+import time
+
+import manof.utils
+
+
+# how many runs of each command on each target are kept
+MAX_RUNS_KEPT = 50
+
+# the duration expected of a command on a target is the median of its last runs
+NUM_RUNS_EXPECTED_FROM = 5
+
+# the last run of a command on a target regressed if it took this many times the median of the runs
+# before it...
+REGRESSION_FACTOR = 1.5
+
+# ...and at least this many seconds more
+MIN_REGRESSION = 1.0
+
+_SPARK_CHARACTERS = '▁▂▃▄▅▆▇█'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS durations (
+    target TEXT NOT NULL,
+    command TEXT NOT NULL,
+    duration REAL NOT NULL,
+    succeeded INTEGER NOT NULL,
+    recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS durations_by_target_and_command
+    ON durations (target, command, recorded_at);
+'''
+
+
+def get_path(manofest_path):
+    """
+    The history of a manofest is kept in manof's cache dir (not in the manofest's repository), one database per
+    manofest, named after its directory
+    """
+    manofest_path = os.path.abspath(manofest_path)
+
+    return os.path.join(
+        manof.utils.cache_dir(),
+        'history',
+        '{0}-{1}.sqlite'.format(
+            os.path.basename(os.path.dirname(manofest_path)),
+            hashlib.md5(manofest_path.encode('utf-8')).hexdigest()[:12],
+        ),
+    )
+
+
+class History(object):
+    """
+    The durations of the commands manof ran on each target, kept across invocations in a sqlite database.
+    Durations are recorded in memory and written at the end of the invocation, in a single transaction
+    """
+
+    def __init__(self, path):
+        self._path = path
+
+        # (target, command, duration, succeeded, recorded at) rows yet to be written
+        self._pending = []
+
+    @property
+    def path(self):
+        return self._path
+
+    def record(self, target_name, command_name, duration, succeeded):
+        self._pending.append(
+            (target_name, command_name, duration, int(succeeded), time.time())
+        )
+
+    def write(self):
+        if not self._pending:
+            return
+
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+
+        with self._connect() as connection:
+            connection.executemany(
+                'INSERT INTO durations VALUES (?, ?, ?, ?, ?)', self._pending
+            )
+
+            # keep the last runs of the targets and commands just recorded
+            for target_name, command_name in set(row[:2] for row in self._pending):
+                connection.execute(
+                    'DELETE FROM durations WHERE rowid IN ('
+                    'SELECT rowid FROM durations WHERE target = ? AND command = ? '
+                    'ORDER BY recorded_at DESC LIMIT -1 OFFSET ?)',
+                    (target_name, command_name, MAX_RUNS_KEPT),
+                )
+
+            connection.commit()
+
+        self._pending = []
+
+    def get_expected_durations(self, command_name):
+        """
+        Returns {target name: the median duration of the last successful runs of the command on it}
+        """
+        durations = {}
+        for target_name, duration in self._query(
+            'SELECT target, duration FROM durations WHERE command = ? AND succeeded '
+            'ORDER BY recorded_at DESC',
+            (command_name,),
+        ):
+            durations.setdefault(target_name, []).append(duration)
+
+        return {
+            target_name: statistics.median(target_durations[:NUM_RUNS_EXPECTED_FROM])
+            for target_name, target_durations in durations.items()
+        }
+
+    def get_stats(self, target_names=None, num_runs=10):
+        """
+        Returns [{target, command, runs, failures, durations, median, last, change, regressed}] per target
+        and command, over their last num_runs runs. durations are those of the successful runs, oldest
+        first. change is the ratio of the last duration to the median of the ones before it
+        """
+        runs = {}
+        for target_name, command_name, duration, succeeded in self._query(
+            'SELECT target, command, duration, succeeded FROM durations '
+            'ORDER BY recorded_at DESC'
+        ):
+            if target_names and target_name not in target_names:
+                continue
+
+            key_runs = runs.setdefault((target_name, command_name), [])
+            if len(key_runs) < num_runs:
+                key_runs.append((duration, succeeded))
+
+        stats = []
+        for (target_name, command_name), key_runs in sorted(runs.items()):
+            durations = [
+                duration for duration, succeeded in reversed(key_runs) if succeeded
+            ]
+            row = {
+                'target': target_name,
+                'command': command_name,
+                'runs': len(key_runs),
+                'failures': len(key_runs) - len(durations),
+                'durations': durations,
+                'median': statistics.median(durations) if durations else None,
+                'last': durations[-1] if durations else None,
+                'change': None,
+                'regressed': False,
+            }
+
+            if len(durations) > 1:
+                previous_median = statistics.median(durations[:-1])
+                if previous_median:
+                    row['change'] = durations[-1] / previous_median
+
+                row['regressed'] = (
+                    durations[-1] > previous_median * REGRESSION_FACTOR
+                    and durations[-1] - previous_median > MIN_REGRESSION
+                )
+
+            stats.append(row)
+
+        return stats
+
+    def _query(self, query, parameters=()):
+        if not os.path.exists(self._path):
+            return []
+
+        with self._connect() as connection:
+            return connection.execute(query, parameters).fetchall()
+
+    @contextlib.contextmanager
+    def _connect(self):
+
+        # other invocations may be writing, wait for them rather than fail
+        connection = sqlite3.connect(self._path, timeout=10)
+
+        try:
+            connection.executescript(_SCHEMA)
+            yield connection
+        finally:
+            connection.close()
+
+
+def format_stats(stats):
+    header = [
+        'target',
+        'command',
+        'runs',
+        'failures',
+        'median s',
+        'last s',
+        'change',
+        'trend',
+    ]
+    rows = []
+
+    for row in stats:
+        rows.append(
+            [
+                row['target'],
+                row['command'],
+                str(row['runs']),
+                str(row['failures']),
+                _format_seconds(row['median']),
+                _format_seconds(row['last']),
+                (
+                    '{0:+.0%}'.format(row['change'] - 1)
+                    if row['change'] is not None
+                    else '-'
+                ),
+                _sparkline(row['durations'])
+                + ('  REGRESSED' if row['regressed'] else ''),
+            ]
+        )
+
+    widths = [
+        max(len(line[column]) for line in [header] + rows)
+        for column in range(len(header))
+    ]
+
+    return '\n'.join(
+        '  '.join(
+            value.ljust(width) if column < 2 else value.rjust(width)
+            for column, (value, width) in enumerate(zip(line[:-1], widths))
+        )
+        + '  '
+        + line[-1]
+        for line in [header] + rows
+    )
+
+
+def _format_seconds(seconds):
+    return '{0:.2f}'.format(seconds) if seconds is not None else '-'
+
+
+def _sparkline(durations):
+    if not durations:
+        return ''
+
+    low, high = min(durations), max(durations)
+    scale = (len(_SPARK_CHARACTERS) - 1) / (high - low) if high > low else 0
+
+    return ''.join(
+        _SPARK_CHARACTERS[int(round((duration - low) * scale))]
+        for duration in durations
+    )
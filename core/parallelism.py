@@ -0,0 +1,296 @@
+import os
+import re
+import time
+
+from twisted.internet import defer
+
+import manof.utils.tracing
+
+
+# a command taking this many times longer than the fastest of its kind signals the daemon is congested...
+LATENCY_TOLERANCE = 3.0
+
+# ...unless it's slower by less than this many seconds, which is noise for short commands
+MIN_LATENCY_INCREASE = 1.0
+
+# the limit is multiplied by this on congestion
+DECREASE_FACTOR = 0.5
+
+# the host is overloaded above this 1 minute load average per CPU...
+MAX_LOAD_PER_CPU = 1.0
+
+# ...or above this share (%) of the last 10 seconds in which some tasks stalled on memory
+MAX_MEMORY_PRESSURE = 10.0
+
+# the host load is sampled at most this often (seconds)
+HOST_LOAD_SAMPLE_INTERVAL = 1.0
+
+MEMORY_PRESSURE_PATH = '/proc/pressure/memory'
+
+# short daemon control calls, whose duration is the daemon's latency. other commands take as long as the
+# work they do (build, pull, push), the grace period of the containers they stop (stop, rm --force), or the
+# container they run (non-detached run)
+_CONTROL_SUBCOMMANDS = frozenset(
+    [
+        'docker create',
+        'docker start',
+        'docker inspect',
+        'docker image',
+        'docker volume',
+        'docker network',
+        'docker tag',
+        'docker version',
+    ]
+)
+
+# errors of commands the daemon failed to serve in time
+_CONGESTION_ERROR_PATTERN = re.compile(
+    r'timeout|timed out|deadline exceeded|cannot connect to the docker daemon|'
+    r'connection reset|too many requests',
+    re.IGNORECASE,
+)
+
+
+class AdaptiveParallelism(object):
+    """
+    A limit of concurrent target operations (for --parallel auto), adjusted at runtime by AIMD between a
+    minimum and a maximum. Fed the docker commands executed (see manof.utils.observe_commands), it:
+      - halves the limit on signs of congestion: a daemon control call (e.g. inspect, create, start, volume
+        operations, detached runs) taking LATENCY_TOLERANCE times longer than the fastest of its kind, a
+        command failing with a timeout or connection error, a retried operation, or
+        an overloaded host (load average or memory pressure)
+      - otherwise raises it by one per round of commands completed while all slots are in use (by one per
+        command until the first decrease, to ramp up quickly)
+    Signals from commands started before the last decrease are ignored, as they were started under the
+    previous limit. Each decision is logged.
+
+    Slots are taken like those of a DeferredSemaphore (acquire, release, run), or with try_acquire() by
+    the scheduler, which is notified when slots may have become available
+    """
+
+    def __init__(self, logger, minimum, maximum, host_load=None, clock=time.monotonic):
+        self._logger = logger.get_child('parallelism')
+        self._minimum = minimum
+        self._maximum = maximum
+        self._host_load = host_load or HostLoad()
+        self._clock = clock
+        self._limit = float(minimum)
+        self._slow_start = True
+        self._last_decrease = None
+
+        # {subcommand: the shortest duration seen}
+        self._fastest = {}
+
+        self._num_acquired = 0
+        self._waiting = []
+        self._listeners = []
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    def try_acquire(self):
+        if self._num_acquired >= self.limit:
+            return False
+
+        self._num_acquired += 1
+        return True
+
+    def acquire(self):
+        """
+        Returns a deferred firing once a slot is acquired
+        """
+        if self.try_acquire():
+            return defer.succeed(self)
+
+        d = defer.Deferred()
+        self._waiting.append(d)
+        return d
+
+    def release(self):
+        self._num_acquired -= 1
+        self._on_slots_available()
+
+    def run(self, f, *args, **kwargs):
+        """
+        Runs f once a slot is acquired, returns a deferred firing with its result
+        """
+
+        def _run(_):
+            d = defer.maybeDeferred(f, *args, **kwargs)
+            d.addBoth(self._release_and_pass)
+            return d
+
+        return self.acquire().addCallback(_run)
+
+    def add_listener(self, listener):
+        """
+        Call listener() when slots may have become available
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+
+    def command_done(self, command_line, duration, code, err):
+        started = self._clock() - duration
+        subcommand = _get_control_subcommand(command_line)
+        reason = None
+
+        if code and _CONGESTION_ERROR_PATTERN.search(err or ''):
+            reason = 'Command failed'
+
+        elif subcommand is not None:
+            fastest = self._fastest.get(subcommand)
+
+            if fastest is None or duration < fastest:
+                self._fastest[subcommand] = duration
+            elif (
+                duration > fastest * LATENCY_TOLERANCE
+                and duration - fastest > MIN_LATENCY_INCREASE
+            ):
+                reason = 'Command slowed down'
+
+        if reason is None:
+            reason = self._host_load.get_overload()
+
+        if reason is not None:
+            self._decrease(
+                reason,
+                started,
+                subcommand=subcommand,
+                duration=round(duration, 3),
+                fastest=self._fastest.get(subcommand),
+            )
+        else:
+            self._increase()
+
+    def operation_retried(self):
+        self._decrease('Operation retried', self._clock())
+
+    def _increase(self):
+
+        # there's no telling whether more would do if the limit isn't reached
+        if self._num_acquired < self.limit or self._limit >= self._maximum:
+            return
+
+        previous_limit = self.limit
+        self._limit = min(
+            self._maximum, self._limit + (1 if self._slow_start else 1 / self.limit)
+        )
+
+        if self.limit != previous_limit:
+            self._logger.info(
+                'Increasing parallelism',
+                limit=self.limit,
+                previous_limit=previous_limit,
+                slow_start=self._slow_start,
+            )
+            self._trace_limit()
+            self._on_slots_available()
+
+    def _decrease(self, reason, started, **details):
+        if self._last_decrease is not None and started < self._last_decrease:
+            return
+
+        previous_limit = self.limit
+        self._slow_start = False
+        self._last_decrease = self._clock()
+        self._limit = max(self._minimum, int(self._limit * DECREASE_FACTOR))
+
+        # already at the minimum - nothing to tell
+        if self.limit == previous_limit:
+            return
+
+        self._logger.info(
+            'Decreasing parallelism',
+            reason=reason,
+            limit=self.limit,
+            previous_limit=previous_limit,
+            **details
+        )
+        self._trace_limit()
+
+    def _trace_limit(self):
+        manof.utils.tracing.counter('parallelism', limit=self.limit)
+
+    def _release_and_pass(self, result):
+        self.release()
+        return result
+
+    def _on_slots_available(self):
+        while self._waiting and self.try_acquire():
+            self._waiting.pop(0).callback(self)
+
+        for listener in list(self._listeners):
+            listener()
+
+
+class HostLoad(object):
+    """
+    Tells whether the host is overloaded, by its load average per CPU and its memory pressure (PSI, where
+    the kernel provides it). Sampled at most once per HOST_LOAD_SAMPLE_INTERVAL
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._sampled_at = None
+        self._overload = None
+
+    def get_overload(self):
+        """
+        Returns why the host is overloaded, or None if it isn't
+        """
+        now = self._clock()
+        if (
+            self._sampled_at is None
+            or now - self._sampled_at >= HOST_LOAD_SAMPLE_INTERVAL
+        ):
+            self._sampled_at = now
+            self._overload = self._sample()
+
+        return self._overload
+
+    def _sample(self):
+        try:
+            load_per_cpu = os.getloadavg()[0] / (os.cpu_count() or 1)
+        except OSError:
+            load_per_cpu = 0.0
+
+        if load_per_cpu > MAX_LOAD_PER_CPU:
+            return 'Host load average is {0:.2f} per CPU'.format(load_per_cpu)
+
+        memory_pressure = _read_memory_pressure()
+        if memory_pressure is not None and memory_pressure > MAX_MEMORY_PRESSURE:
+            return 'Host memory pressure is {0:.2f}%'.format(memory_pressure)
+
+        return None
+
+
+def _get_control_subcommand(command_line):
+    """
+    Returns the subcommand of a daemon control call (a detached run being one), or None for other commands
+    """
+    args = command_line.split()
+    subcommand = ' '.join(args[:2])
+
+    if subcommand == 'docker run' and ('--detach' in args or '-d' in args):
+        return 'docker run --detach'
+
+    return subcommand if subcommand in _CONTROL_SUBCOMMANDS else None
+
+
+def _read_memory_pressure():
+    """
+    Returns the share (%) of the last 10 seconds some tasks stalled on memory, or None if unavailable
+    """
+    try:
+        with open(MEMORY_PRESSURE_PATH) as pressure_file:
+            for line in pressure_file:
+                fields = line.split()
+                if fields and fields[0] == 'some':
+                    return float(dict(f.split('=') for f in fields[1:])['avg10'])
+    except (IOError, OSError, KeyError, ValueError):
+        pass
+
+    return None
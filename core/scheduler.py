@@ -0,0 +1,462 @@
+import contextlib
+import heapq
+import itertools
+
+from twisted.internet import defer
+from twisted.python import failure
+
+import manof.utils.tracing
+import core.parallelism
+
+
+class TargetGraph(object):
+    """
+    The dependency graph (DAG) of the targets a command runs on
+    """
+
+    def __init__(self, targets, dependencies):
+        """
+        :param targets: the targets, in the order they were requested
+        :type targets: list
+        :param dependencies: {target: [targets it depends on]}, all of which must be in targets
+        :type dependencies: dict
+        """
+        self._targets = list(targets)
+        self._parents = {target: [] for target in self._targets}
+        self._children = {target: [] for target in self._targets}
+
+        for target, parents in dependencies.items():
+            for parent in parents:
+                if parent not in self._parents[target]:
+                    self._parents[target].append(parent)
+                    self._children[parent].append(target)
+
+        self._raise_on_cycles()
+
+    @classmethod
+    def from_target_tree(cls, target_root):
+        """
+        Create the graph of the targets under target_root (excluding it), where each target depends on the
+        targets it was added to as a dependent
+        """
+        targets = []
+        dependencies = {}
+        pending = [target_root]
+
+        while pending:
+            parent = pending.pop(0)
+            for target in parent.dependent_targets:
+                if target not in dependencies:
+                    targets.append(target)
+                    dependencies[target] = []
+                    pending.append(target)
+
+                if parent is not target_root:
+                    dependencies[target].append(parent)
+
+        return cls(targets, dependencies)
+
+    @property
+    def targets(self):
+        return self._targets
+
+    def parents(self, target):
+        return self._parents[target]
+
+    def children(self, target):
+        return self._children[target]
+
+    def critical_path_lengths(self, weights=None):
+        """
+        Returns {target: the length of the longest dependency chain starting at it} - the number of targets
+        in it, or the sum of their weights if given ({target: weight}, e.g. their expected durations)
+        """
+        lengths = {}
+
+        for target in reversed(self._topological_order()):
+            lengths[target] = (1 if weights is None else weights[target]) + max(
+                [lengths[child] for child in self._children[target]] or [0]
+            )
+
+        return lengths
+
+    def teardown_levels(self):
+        """
+        Returns [[targets]] grouped by the number of targets in the longest dependency chain starting at
+        them, leaves first - so that each target is on a later level than all the targets depending on it
+        """
+        lengths = self.critical_path_lengths()
+
+        levels = [[] for _ in range(max(lengths.values(), default=0))]
+        for target in self._targets:
+            levels[lengths[target] - 1].append(target)
+
+        return levels
+
+    def _topological_order(self):
+        num_pending_parents = {
+            target: len(parents) for target, parents in self._parents.items()
+        }
+        ready = [target for target in self._targets if not num_pending_parents[target]]
+        order = []
+
+        while ready:
+            target = ready.pop(0)
+            order.append(target)
+
+            for child in self._children[target]:
+                num_pending_parents[child] -= 1
+                if not num_pending_parents[child]:
+                    ready.append(child)
+
+        return order
+
+    def _raise_on_cycles(self):
+        ordered = set(self._topological_order())
+        if len(ordered) == len(self._targets):
+            return
+
+        # walk up the parents of an unordered target until a target repeats itself
+        path = [next(target for target in self._targets if target not in ordered)]
+        while path.count(path[-1]) < 2:
+            path.append(
+                next(
+                    parent
+                    for parent in self._parents[path[-1]]
+                    if parent not in ordered
+                )
+            )
+
+        cycle = path[path.index(path[-1]) :]
+        raise RuntimeError(
+            'Dependency cycle between targets: {0}'.format(
+                ' -> '.join(target.name for target in reversed(cycle))
+            )
+        )
+
+
+class ResourceLimits(object):
+    """
+    Per resource class concurrency limits (e.g. at most 2 builds and 4 pulls at a time), on top of the
+    global one. Classes without a limit are unlimited
+    """
+
+    def __init__(self, limits=None):
+        """
+        :param limits: {resource class: max operations of the class at a time}
+        :type limits: dict
+        """
+        self._semaphores = {
+            resource_class: defer.DeferredSemaphore(limit)
+            for resource_class, limit in (limits or {}).items()
+        }
+
+    def acquire(self, resource_class):
+        """
+        Returns a deferred firing once a slot of the class is acquired
+        """
+        if resource_class not in self._semaphores:
+            return defer.succeed(None)
+
+        return self._semaphores[resource_class].acquire()
+
+    def release(self, resource_class):
+        if resource_class in self._semaphores:
+            self._semaphores[resource_class].release()
+
+    def run(self, resource_class, f, *args, **kwargs):
+        """
+        Runs f once a slot of the class is acquired, returns a deferred firing with its result
+        """
+        if resource_class not in self._semaphores:
+            return defer.maybeDeferred(f, *args, **kwargs)
+
+        return self._semaphores[resource_class].run(f, *args, **kwargs)
+
+
+class Scheduler(object):
+    """
+    Runs an operation on all targets of a graph, starting each target as soon as all the targets it
+    depends on are done. Ready targets with the longest chain of targets depending on them go first.
+    A target with a resource class first waits for a slot of its class, then for a global one - so
+    targets of a busy class don't hold global slots others could use
+    """
+
+    def __init__(self, logger, max_parallel=1, resource_limits=None):
+        """
+        :param max_parallel: how many operations to run at a time
+        :type max_parallel: int or core.parallelism.AdaptiveParallelism
+        :param resource_limits: the limits of the resource classes of the operations
+        :type resource_limits: ResourceLimits
+        """
+        self._logger = logger
+        self._max_parallel = max_parallel
+        self._resource_limits = resource_limits or ResourceLimits()
+
+    def run(
+        self,
+        graph,
+        operation,
+        prerequisites=None,
+        resource_class=None,
+        weights=None,
+        on_failure=None,
+    ):
+        """
+        :param graph: the graph of targets to run the operation on
+        :type graph: TargetGraph
+        :param operation: a callable receiving a target, may return a deferred
+        :param prerequisites: {target: deferred} that must fire before the target is started, on top of the
+            targets it depends on. The results of the deferreds are consumed - a failing prerequisite
+            counts as a failure of the target
+        :type prerequisites: dict
+        :param resource_class: a callable receiving a target, returning the resource class of its operation
+            (or None if the operation isn't limited by class)
+        :param weights: {target: weight} to find the longest chains by (e.g. expected durations), rather
+            than by the number of targets in them
+        :type weights: dict
+        :param on_failure: a callable receiving the first failure as soon as it happens - e.g. to stop
+            starting prerequisites the run would wait for
+        :return: A deferred firing with {target name: operation result}. If the operation fails on any
+            target, no more targets are started and the deferred fails with the first failure once the
+            running operations (and prerequisites) are done
+        :rtype: defer.Deferred
+        """
+        return _SchedulerRun(
+            self._logger,
+            self._max_parallel,
+            self._resource_limits,
+            graph,
+            operation,
+            prerequisites or {},
+            resource_class or (lambda target: None),
+            weights,
+            on_failure or (lambda failure: None),
+        ).start()
+
+
+class _SchedulerRun(object):
+    def __init__(
+        self,
+        logger,
+        max_parallel,
+        resource_limits,
+        graph,
+        operation,
+        prerequisites,
+        resource_class,
+        weights,
+        on_failure,
+    ):
+        self._logger = logger
+        self._max_parallel = max_parallel
+        self._adaptive_parallelism = (
+            max_parallel
+            if isinstance(max_parallel, core.parallelism.AdaptiveParallelism)
+            else None
+        )
+        self._resource_limits = resource_limits
+        self._graph = graph
+        self._operation = operation
+        self._resource_classes = {
+            target: resource_class(target) for target in graph.targets
+        }
+        self._prerequisites = prerequisites
+        self._num_pending_prerequisites = len(prerequisites)
+        self._priorities = graph.critical_path_lengths(weights)
+
+        # the parents and prerequisite each target still waits for
+        self._num_pending_parents = {
+            target: len(graph.parents(target)) + (target in prerequisites)
+            for target in graph.targets
+        }
+        self._sequence = itertools.count()
+        self._ready = []
+        self._num_running = 0
+
+        # targets waiting for a slot of their resource class
+        self._num_waiting_for_class = 0
+        self._results = {}
+        self._first_failure = None
+        self._on_failure = on_failure
+        self._dispatching = False
+        self._deferred = defer.Deferred()
+
+        # when each ready target became ready, for tracing how long it waited for a free slot
+        self._ready_at = {}
+
+    def start(self):
+        if self._adaptive_parallelism is not None:
+            self._adaptive_parallelism.add_listener(self._start_ready_targets)
+
+        with self._holding_dispatch():
+            for target in self._graph.targets:
+                if not self._num_pending_parents[target]:
+                    self._on_target_ready(target)
+
+            for target, prerequisite in self._prerequisites.items():
+                prerequisite.addBoth(self._on_prerequisite_done, target)
+
+        self._start_ready_targets()
+        return self._deferred
+
+    def _on_target_ready(self, target):
+        self._ready_at[target] = manof.utils.tracing.now()
+        self._num_waiting_for_class += 1
+
+        d = self._resource_limits.acquire(self._resource_classes[target])
+        d.addCallback(self._on_class_slot_acquired, target)
+
+    def _on_class_slot_acquired(self, _, target):
+        self._num_waiting_for_class -= 1
+
+        if self._first_failure is not None:
+            self._resource_limits.release(self._resource_classes[target])
+        else:
+            heapq.heappush(
+                self._ready, (-self._priorities[target], next(self._sequence), target)
+            )
+
+        self._start_ready_targets()
+
+    @contextlib.contextmanager
+    def _holding_dispatch(self):
+        """
+        Targets getting a slot of their class within the block (which may happen synchronously) are only
+        started after it, once the state is consistent again
+        """
+        dispatching, self._dispatching = self._dispatching, True
+        try:
+            yield
+        finally:
+            self._dispatching = dispatching
+
+    def _start_ready_targets(self):
+
+        # operations that complete synchronously call back into here - let the outer loop start their
+        # children rather than recursing
+        if self._dispatching:
+            return
+
+        self._dispatching = True
+        try:
+            self._start_ready_targets_until_limit()
+        finally:
+            self._dispatching = False
+
+        self._trace_counts()
+
+        # once failed, the targets holding slots of their class won't be started
+        if self._first_failure is not None:
+            while self._ready:
+                _, _, target = heapq.heappop(self._ready)
+                self._resource_limits.release(self._resource_classes[target])
+
+        if (
+            not self._num_running
+            and not self._num_pending_prerequisites
+            and not self._num_waiting_for_class
+        ):
+            self._finish()
+
+    def _trace_counts(self):
+        manof.utils.tracing.counter(
+            'targets',
+            running=self._num_running,
+            ready=len(self._ready) + self._num_waiting_for_class,
+        )
+
+    def _acquire_slot(self):
+        if self._adaptive_parallelism is not None:
+            return self._adaptive_parallelism.try_acquire()
+
+        return self._num_running < self._max_parallel
+
+    def _release_slot(self):
+        if self._adaptive_parallelism is not None:
+            self._adaptive_parallelism.release()
+
+    def _start_ready_targets_until_limit(self):
+        while self._ready and self._first_failure is None and self._acquire_slot():
+            _, _, target = heapq.heappop(self._ready)
+            self._num_running += 1
+
+            self._logger.debug(
+                'Starting target',
+                target=target.name,
+                resource_class=self._resource_classes[target],
+                critical_path_length=self._priorities[target],
+                num_running=self._num_running,
+                num_ready=len(self._ready),
+            )
+
+            manof.utils.tracing.async_span(
+                'waiting for a slot',
+                'scheduler',
+                self._ready_at.pop(target),
+                target=target.name,
+            )
+            self._trace_counts()
+
+            d = defer.maybeDeferred(self._operation, target)
+            d.addCallbacks(
+                self._on_target_done,
+                self._on_target_failed,
+                callbackArgs=(target,),
+                errbackArgs=(target,),
+            )
+
+    def _on_target_done(self, result, target):
+        self._num_running -= 1
+        self._results[target.name] = result
+
+        with self._holding_dispatch():
+            for child in self._graph.children(target):
+                self._num_pending_parents[child] -= 1
+                if not self._num_pending_parents[child]:
+                    self._on_target_ready(child)
+
+            self._resource_limits.release(self._resource_classes[target])
+            self._release_slot()
+
+        self._start_ready_targets()
+
+    def _on_prerequisite_done(self, result, target):
+        self._num_pending_prerequisites -= 1
+
+        if isinstance(result, failure.Failure):
+            self._fail(result)
+        else:
+            self._num_pending_parents[target] -= 1
+            if not self._num_pending_parents[target]:
+                with self._holding_dispatch():
+                    self._on_target_ready(target)
+
+        self._start_ready_targets()
+
+    def _on_target_failed(self, target_failure, target):
+        self._num_running -= 1
+        self._fail(target_failure)
+
+        with self._holding_dispatch():
+            self._resource_limits.release(self._resource_classes[target])
+            self._release_slot()
+
+        self._start_ready_targets()
+
+    def _fail(self, target_failure):
+        if self._first_failure is None:
+            self._first_failure = target_failure
+            self._on_failure(target_failure)
+
+    def _finish(self):
+        if self._deferred.called:
+            return
+
+        if self._adaptive_parallelism is not None:
+            self._adaptive_parallelism.remove_listener(self._start_ready_targets)
+
+        if self._first_failure is not None:
+            self._deferred.errback(self._first_failure)
+        else:
+            self._deferred.callback(self._results)
@@ -1,16 +1,20 @@
 import argparse
 import sys
 
-from twisted.internet import reactor
-
-import core
 import clients.logging
 
 
 def _run(args, known_arg_options):
+
+    # imported here rather than at the top so that --help (and argument errors) don't pay for the
+    # reactor, twisted and the manof core
+    from twisted.internet import reactor
+
+    import core
+
     retval = 1
 
-    logger = clients.logging.Client(
+    logging_client = clients.logging.Client(
         'manof',
         initial_severity=args.log_severity,
         initial_console_severity=args.log_console_severity,
@@ -21,7 +25,11 @@ def _run(args, known_arg_options):
         max_num_log_files=args.log_file_rotate_num_files,
         log_file_name=args.log_file_name,
         log_colors=args.log_colors,
-    ).logger
+        log_async=args.log_async,
+        log_async_queue_size=args.log_async_queue_size,
+        log_async_overflow=args.log_async_overflow,
+    )
+    logger = logging_client.logger
 
     # start root logger with kwargs and create manof
     manof_instance = core.Manof(logger, args, known_arg_options)
@@ -33,12 +41,43 @@ def _run(args, known_arg_options):
 
     reactor.run()
 
+    # write whatever is still queued by the async log writer
+    logging_client.close()
+
     if logger.first_error is None:
         retval = 0
 
     return retval
 
 
+def _parallel(value):
+    if value == 'auto':
+        return value
+
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'Expected a number or auto, got {0}'.format(value)
+        )
+
+
+def _resource_limit(value):
+    resource_class, _, limit = value.partition('=')
+
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = 0
+
+    if not resource_class or limit < 1:
+        raise argparse.ArgumentTypeError(
+            'Expected CLASS=NUM with NUM >= 1, got {0}'.format(value)
+        )
+
+    return resource_class, limit
+
+
 def _register_arguments(parser):
 
     # main command subparser, to which we'll add subparsers below
@@ -76,13 +115,125 @@ def _register_arguments(parser):
         '-p',
         '--parallel',
         action='store',
-        help='Set how many commands to run in parallel',
+        help=(
+            'Set how many commands to run in parallel, or auto to adapt it at runtime (between '
+            '--parallel-min and --parallel-max) to the docker daemon\'s latency and the host\'s load'
+        ),
+        type=_parallel,
+    )
+
+    parser.add_argument(
+        '--parallel-min',
+        help='With --parallel auto, the least commands to run in parallel (default: 1)',
+        type=int,
+        default=1,
+    )
+
+    parser.add_argument(
+        '--parallel-max',
+        help='With --parallel auto, the most commands to run in parallel (default: 16)',
         type=int,
+        default=16,
+    )
+
+    parser.add_argument(
+        '--resource-limit',
+        help=(
+            'Set how many commands of a resource class (build, network-pull, push, local, or a class '
+            'declared by the manofest) to run in parallel, within --parallel, as CLASS=NUM. Overrides the '
+            'manofest\'s resource_limits. May be given multiple times'
+        ),
+        action='append',
+        type=_resource_limit,
+    )
+
+    parser.add_argument(
+        '--docker-backend',
+        help=(
+            'How to talk to the docker daemon. api: use the Engine API over the daemon\'s unix socket, '
+            'falling back to the docker CLI for commands it doesn\'t support (default: cli)'
+        ),
+        choices=['cli', 'api'],
+        default='cli',
+    )
+
+    parser.add_argument(
+        '--docker-socket',
+        help=(
+            'The docker daemon unix socket used by the api backend '
+            '(default: from DOCKER_HOST, or /var/run/docker.sock)'
+        ),
+    )
+
+    parser.add_argument(
+        '--daemon-probe-cache-ttl',
+        help=(
+            'Cache the docker daemon capabilities (versions, experimental, buildx/BuildKit) on disk '
+            'for this many seconds, per DOCKER_HOST (default: 0, probe on every invocation)'
+        ),
+        type=int,
+        default=0,
+    )
+
+    parser.add_argument(
+        '--trace-file',
+        help=(
+            'Record the time spent in each phase (manofest load, argument passes, target commands, '
+            'subprocesses, waiting for a free slot, retries) to this file, in Chrome Trace Event format '
+            '(open it in chrome://tracing or https://ui.perfetto.dev)'
+        ),
+    )
+
+    parser.add_argument(
+        '--profile-manofest',
+        help=(
+            'Count the evaluations of each property of each target and the time spent in them, and print '
+            'them (costliest first) when the command is done'
+        ),
+        action='store_true',
+    )
+
+    parser.add_argument(
+        '--profile-manofest-json',
+        help='With --profile-manofest, also write the property profile to this file as JSON',
+    )
+
+    parser.add_argument(
+        '--no-history',
+        help=(
+            'Don\'t record the durations of the commands run on each target (by default kept in '
+            '$XDG_CACHE_HOME/manof/history, to start the longest chains of work first and for manof stats)'
+        ),
+        action='store_true',
+    )
+
+    parser.add_argument(
+        '--metrics-file',
+        help=(
+            'Write metrics of the invocation (command and target durations, subprocesses, retries, failures, '
+            'build cache hits, captured output) to this file in the Prometheus text format, e.g. in the '
+            'node_exporter textfile collector directory (name it *.prom)'
+        ),
     )
 
     # update
     subparsers.add_parser('update', help='Updates Manof')
 
+    # stats
+    stats_command = subparsers.add_parser(
+        'stats',
+        help='Show the durations of the commands run on targets across invocations, flagging regressions',
+    )
+    stats_command.add_argument(
+        'targets', nargs='*', help='The targets to show (default: all)'
+    )
+    stats_command.add_argument(
+        '--last',
+        help='How many of the last runs of each command to show (default: 10)',
+        type=int,
+        default=10,
+    )
+
     # base sub parser
     base_command_parent_parser = argparse.ArgumentParser(add_help=False)
     base_command_parent_parser.add_argument('targets', nargs='+')
@@ -114,6 +265,14 @@ def _register_arguments(parser):
         ),
         action='store_true',
     )
+    provision_parent_command.add_argument(
+        '--build-cache',
+        help=(
+            'Skip the build of images whose context files, dockerfile, build flags and tag did not '
+            'change since the local image was built (default: False)'
+        ),
+        action='store_true',
+    )
     provision_parent_command.add_argument(
         '-tl',
         '--skip-tag-local',
@@ -176,6 +335,14 @@ def _register_arguments(parser):
         help='Image: Delete named_volumes that are used by this image',
         action='store_true',
     )
+    run_parent_parser.add_argument(
+        '--incremental',
+        help=(
+            'Leave running containers untouched if their run command and image didn\'t change '
+            'since they were started'
+        ),
+        action='store_true',
+    )
     run_parent_parser.add_argument(
         '-pco',
         '--print-command-only',
@@ -258,7 +425,7 @@ def _register_arguments(parser):
     )
 
     # lift
-    subparsers.add_parser(
+    lift_command = subparsers.add_parser(
         'lift',
         help='Provision and run targets',
         parents=[
@@ -267,6 +434,14 @@ def _register_arguments(parser):
             run_parent_parser,
         ],
     )
+    lift_command.add_argument(
+        '--provision-parallel',
+        help=(
+            'How many images to provision (build or pull) simultaneously, while containers are run in '
+            'dependency order (default: --parallel)'
+        ),
+        type=int,
+    )
 
     known_option_strings = list(parser._option_string_actions.keys())
 
@@ -1,15 +1,17 @@
 import os
 import hashlib
 import sys
-import pipes
 import inspect
 import re
-import semver
 
 from twisted.internet import defer
 
 import manof
 import manof.utils
+import manof.utils.daemon
+import manof.utils.build_cache
+import manof.utils.metrics
+import manof.utils.tracing
 
 
 class Constants(object):
@@ -17,6 +19,17 @@ class Constants(object):
     RUN_COMMAND_MD5_HASH_LABEL_VALUE_PLACEHOLDER = (
         '<placeholder:manof.runCommandMD5Hash>'
     )
+    RUN_RESULT_SKIPPED = 'skipped'
+    RUN_RESULT_RECREATED = 'recreated'
+    PROVISION_RESULT_SKIPPED = 'skipped'
+
+    # the most containers passed to a single docker stop/rm by batched_stop() and batched_rm()
+    MAX_CONTAINERS_PER_COMMAND = 50
+
+
+# the pulls and builds in flight, shared by all images so that images resolving to the same image pull or
+# build it once
+_in_flight_operations = manof.utils.SingleFlight()
 
 
 class Image(manof.Target):
@@ -33,43 +46,61 @@ class Image(manof.Target):
         if 'force_rm' in self._args and self._args.force_rm:
             provision_args.append('--force-rm')
 
-        daemon_supports_multiplatform_build = (
-            yield self._daemon_supports_multiplatform_build()
-        )
-        if self.platform_architecture and daemon_supports_multiplatform_build:
-            provision_args.append('--platform={0}'.format(self.platform_architecture))
+        if self.platform_architecture:
+            daemon_supports_multiplatform_build = (
+                yield self._daemon_supports_multiplatform_build()
+            )
+            if daemon_supports_multiplatform_build:
+                provision_args.append(
+                    '--platform={0}'.format(self.platform_architecture)
+                )
 
         # if there is a context, do a build
         if self.context is not None:
-            command = 'docker build --rm {0} --tag={1} -f {2} {3}'.format(
-                ' '.join(provision_args), self.image_name, self.dockerfile, self.context
+            command = manof.utils.Argv(
+                ['docker', 'build', '--rm']
+                + provision_args
+                + [
+                    '--tag={0}'.format(self.image_name),
+                    '-f',
+                    self.dockerfile,
+                    self.context,
+                ]
             )
 
-            # if image provides a programmatic docker ignore, we need to create a temporary
-            # file at the context and remove it when we're done
-            if self.dockerignore is not None:
-                dockerignore_path = os.path.join(self.context, '.dockerignore')
-
-                try:
-
-                    # write the docker ignore
-                    with open(dockerignore_path, 'w') as dockerignore_file:
-                        dockerignore_file.write('\n'.join(self.dockerignore))
-
-                    # do the build
-                    yield self._run_command(command)
-
-                finally:
-
-                    # whatever happens, delete docker ignore silently
-                    try:
-                        os.remove(dockerignore_path)
-                    except Exception:
-                        pass
-            else:
-
-                # just run the command
-                yield self._run_command(command)
+            build_key = None
+            if self._build_cache_requested():
+                build_key = yield self._build_cache.compute_key(
+                    self.context,
+                    self.dockerfile,
+                    self.dockerignore,
+                    provision_args,
+                    self.image_name,
+                )
+
+                image_is_up_to_date = yield self._image_is_built_from(build_key)
+                manof.utils.metrics.inc(
+                    'manof_build_cache_total',
+                    result='hit' if image_is_up_to_date else 'miss',
+                )
+
+                if image_is_up_to_date:
+                    self._logger.info(
+                        'Image is up to date with its context, skipping build',
+                        image_name=self.image_name,
+                    )
+                    defer.returnValue(Constants.PROVISION_RESULT_SKIPPED)
+
+            # the command has the context, dockerfile, tag and flags of the build
+            dockerignore = self.dockerignore
+            yield self._run_coalesced(
+                'build',
+                (command, None if dockerignore is None else tuple(dockerignore)),
+                self._build,
+                command,
+                dockerignore,
+                build_key,
+            )
         else:
 
             # there's nothing to build, just pull
@@ -80,83 +111,156 @@ class Image(manof.Target):
 
         self._logger.debug('Running')
 
-        # remove
-        if self.container_name:
+        incremental = self._incremental_run_requested()
+
+        # remove. on incremental runs, only once we know the container has changed
+        if self.container_name and not incremental:
             yield self.rm(True)
 
-        command = 'docker run '
+        command, command_sha = yield self._generate_run_command()
+
+        if hasattr(self._args, 'print_command_only') and self._args.print_command_only:
+            print(command)
+        elif (
+            hasattr(self._args, 'print_run_md5_only') and self._args.print_run_md5_only
+        ):
+            print(command_sha)
+
+        if incremental and self.container_name:
+            unchanged = yield self._container_is_unchanged(command_sha)
+            if unchanged:
+                self._logger.info(
+                    'Container is unchanged, skipping run',
+                    container_name=self.container_name,
+                    run_command_md5=command_sha,
+                )
+                defer.returnValue(Constants.RUN_RESULT_SKIPPED)
+
+            yield self.rm(True)
+
+        # pipe the container's output as it arrives
+        out_line_received = self._pipe_line(sys.stdout) if self.pipe_stdout else None
+        err_line_received = self._pipe_line(sys.stderr) if self.pipe_stderr else None
+
+        try:
+            yield self._run_command(
+                command,
+                out_line_received=out_line_received,
+                err_line_received=err_line_received,
+            )
+
+        except Exception as exc:
+            dangling_container_error = re.search(
+                'endpoint with name (?P<container_name>.*) already exists in network'
+                ' (?P<network>.*).',
+                str(exc),
+            )
+
+            if (
+                dangling_container_error is not None
+                and self.force_run_with_disconnection
+            ):
+                container_name = dangling_container_error.group('container_name')
+                network = dangling_container_error.group('network')
+                yield self._disconnect_container_from_network(container_name, network)
+
+                self._logger.debug('Re-running container', command=str(command))
+                yield self._run_command(command)
+
+            else:
+
+                # a failed command's stderr was already piped
+                if self.pipe_stderr and not isinstance(
+                    exc, manof.utils.CommandFailedError
+                ):
+                    sys.stderr.write(str(exc))
+
+                raise exc
+
+        defer.returnValue(Constants.RUN_RESULT_RECREATED)
+
+    @defer.inlineCallbacks
+    def _generate_run_command(self):
+        """
+        Returns the docker run command of this image along with its md5, which is also set as a label
+        on the container
+        """
+        args = ['docker', 'run']
 
         # add detach if needed
         if self.detach:
-            command += '--detach '
+            args.append('--detach')
 
         # make it interactive
         if self.interactive:
-            command += '--interactive '
+            args.append('--interactive')
 
         # allocate a pseudo-tty
         if self.tty:
-            command += '--tty '
+            args.append('--tty')
 
         # add rm if needed
         if self.rm_on_run:
-            command += '--rm '
+            args.append('--rm')
 
         # add privileged if needed
         if self.privileged:
-            command += '--privileged '
+            args.append('--privileged')
 
         if self.pid:
-            command += '--pid {0} '.format(self.pid)
+            args += ['--pid', self.pid]
 
-        command = self._add_resource_limit_arguments(command)
+        args += self._generate_resource_limit_args()
 
         # add devices
         for device in self.devices:
             if device:
-                command += '--device={0} '.format(device)
+                args.append('--device={0}'.format(device))
 
         # add dns if needed, this allowes for the container to resolve addresses using custom dns resolvers
         for dns_ip in self.dns:
-            command += '--dns {0} '.format(dns_ip)
+            args += ['--dns', dns_ip]
 
         # add net
-        command += '--net {0} '.format(self.net)
+        args += ['--net', self.net]
 
         # add custom hosts to /etc/hosts
         if self.add_hosts is not None:
             for hostname, address in self.add_hosts.items():
-                command += '--add-host {0}:{1} '.format(hostname, address)
+                args += ['--add-host', '{0}:{1}'.format(hostname, address)]
 
         # add log driver
         if self.log_driver is not None:
-            command += '--log-driver {0} '.format(self.log_driver)
+            args += ['--log-driver', self.log_driver]
 
         # add labels
         if len(self.labels):
             for k, v in self.labels.items():
-                command += '--label {0}={1} '.format(k, v)
+                args += ['--label', '{0}={1}'.format(k, v)]
 
-        command += '--label {0}={1} '.format(
-            Constants.RUN_COMMAND_MD5_HASH_LABEL_NAME,
-            Constants.RUN_COMMAND_MD5_HASH_LABEL_VALUE_PLACEHOLDER,
-        )
+        args += [
+            '--label',
+            '{0}={1}'.format(
+                Constants.RUN_COMMAND_MD5_HASH_LABEL_NAME,
+                Constants.RUN_COMMAND_MD5_HASH_LABEL_VALUE_PLACEHOLDER,
+            ),
+        ]
 
         # add user/group
         if self.user_and_group is not None:
             user, group = self.user_and_group
-            command += '--user {0}:{1} '.format(user, group)
+            args += ['--user', '{0}:{1}'.format(user, group)]
 
         # add health check related args
-        command += self._generate_healthcheck_args()
+        args += self._generate_healthcheck_args()
 
         # add published ports
         for exposed_port in self.exposed_ports:
             if isinstance(exposed_port, int):
-                command += '--publish {0}:{0} '.format(exposed_port)
+                args += ['--publish', '{0}:{0}'.format(exposed_port)]
             elif isinstance(exposed_port, dict):
                 host_port, container_port = list(exposed_port.items())[0]
-                command += '--publish {0}:{1} '.format(host_port, container_port)
+                args += ['--publish', '{0}:{1}'.format(host_port, container_port)]
 
         # add volumes
         for volume in self.volumes:
@@ -174,7 +278,7 @@ class Image(manof.Target):
                 if not host_path.startswith('/'):
                     host_path = os.path.join(self.host_manofest_dir, host_path)
 
-            command += '--volume {0}:{1} '.format(host_path, container_path)
+            args += ['--volume', '{0}:{1}'.format(host_path, container_path)]
 
         # replace env vars with argument-given ones:
         for env in self._update_env_override():
@@ -194,91 +298,77 @@ class Image(manof.Target):
             else:
                 raise RuntimeError('Invalid env')
 
-            command += '--env {0}={1} '.format(lvalue, pipes.quote(str(rvalue)))
+            # passed as is - there's no shell to quote it from
+            args += ['--env', '{0}={1}'.format(lvalue, rvalue)]
 
         # set hostname
         if self.hostname is not None:
-            command += '--hostname={0} '.format(self.hostname)
+            args.append('--hostname={0}'.format(self.hostname))
 
         # set name
         if self.container_name:
-            command += '--name {0} '.format(self.container_name)
+            args += ['--name', self.container_name]
 
         for cap in self.cap_add:
             if cap:
-                command += '--cap-add={0} '.format(cap)
+                args.append('--cap-add={0}'.format(cap))
 
         for cap in self.cap_drop:
             if cap:
-                command += '--cap-drop={0} '.format(cap)
+                args.append('--cap-drop={0}'.format(cap))
 
-        command = self._add_device_arguments(command)
+        args += self._generate_device_args()
 
         # set tag
-        command += self.image_name + ' '
+        args.append(self.image_name)
 
-        # if there's a command, append it
+        # if there's a command, append it. a command relying on the shell (e.g. for '&&' or expansions)
+        # makes the whole command line run by one
+        command = manof.utils.Argv(args)
         if self.command is not None:
-            command += self.command
+            command_args = manof.utils.split_argv(self.command)
 
-        # strip trailing space
-        command = command.strip()
+            if command_args is not None:
+                command = manof.utils.Argv(command + command_args)
+            else:
+                command = '{0} {1}'.format(command, self.command).strip()
 
-        # update command md5
+        # update command md5. it's computed over the command line as manof used to build it - unquoted, with
+        # the manofest's command as is - so containers of unchanged targets keep their md5
         md5 = hashlib.md5()
-        md5.update(command.encode('utf-8'))
-        command_sha = md5.hexdigest()
-        command = command.replace(
-            Constants.RUN_COMMAND_MD5_HASH_LABEL_VALUE_PLACEHOLDER, command_sha
+        md5.update(
+            '{0} {1}'.format(' '.join(str(arg) for arg in args), self.command or '')
+            .strip()
+            .encode('utf-8')
         )
+        command_sha = md5.hexdigest()
 
-        if hasattr(self._args, 'print_command_only') and self._args.print_command_only:
-            print(command)
-        elif (
-            hasattr(self._args, 'print_run_md5_only') and self._args.print_run_md5_only
-        ):
-            print(command_sha)
-
-        try:
-            out, _, _ = yield self._run_command(command)
-
-            if self.pipe_stdout:
-                sys.stdout.write(out)
-
-        except Exception as exc:
-            dangling_container_error = re.search(
-                'endpoint with name (?P<container_name>.*) already exists in network'
-                ' (?P<network>.*).',
-                str(exc),
+        if isinstance(command, manof.utils.Argv):
+            command = manof.utils.Argv(
+                arg.replace(
+                    Constants.RUN_COMMAND_MD5_HASH_LABEL_VALUE_PLACEHOLDER, command_sha
+                )
+                for arg in command
+            )
+        else:
+            command = command.replace(
+                Constants.RUN_COMMAND_MD5_HASH_LABEL_VALUE_PLACEHOLDER, command_sha
             )
 
-            if (
-                dangling_container_error is not None
-                and self.force_run_with_disconnection
-            ):
-                container_name = dangling_container_error.group('container_name')
-                network = dangling_container_error.group('network')
-                yield self._disconnect_container_from_network(container_name, network)
-
-                self._logger.debug('Re-running container', command=command)
-                yield self._run_command(command)
-
-            else:
-
-                if self.pipe_stderr:
-                    if isinstance(exc, manof.utils.CommandFailedError):
-                        sys.stderr.write(exc.err)
-                    else:
-                        sys.stderr.write(str(exc))
-
-                raise exc
+        defer.returnValue((command, command_sha))
 
     @defer.inlineCallbacks
     def stop(self):
         self._logger.debug('Stopping')
 
-        command = 'docker stop --time={0} '.format(self._args.time)
-        command += self.container_name
+        command = manof.utils.Argv(
+            [
+                'docker',
+                'stop',
+                '--time={0}'.format(self._args.time),
+                self.container_name,
+            ]
+        )
 
         # stop container
         yield self._run_command(command, raise_on_error=True)
@@ -288,12 +378,12 @@ class Image(manof.Target):
 
         self._logger.debug('Removing')
 
-        command = 'docker rm '
+        command = ['docker', 'rm']
 
         if force or (hasattr(self._args, 'force') and self._args.force):
-            command += '--force '
+            command.append('--force')
 
-        command += self.container_name
+        command = manof.utils.Argv(command + [self.container_name])
 
         # remove containers and ignore errors (since docker returns error if the container doesn't exist)
         yield self._run_command(command, raise_on_error=False)
@@ -302,6 +392,88 @@ class Image(manof.Target):
         if 'volumes' in self._args and self._args.volumes:
             yield self._delete_all_named_volumes()
 
+    @classmethod
+    @defer.inlineCallbacks
+    def batched_stop(cls, images):
+        """
+        Like stop() on each of the images, with a single docker stop. Images whose containers docker
+        didn't report as stopped are then stopped on their own, to fail like stop() does
+        :param images: images that don't override stop(), all sharing the same args
+        :return: A deferred firing with {image: failure} of the images that failed
+        :rtype: defer.Deferred
+        """
+        for image in images:
+            image._logger.debug('Stopping')
+
+        command = manof.utils.Argv(
+            ['docker', 'stop', '--time={0}'.format(images[0]._args.time)]
+            + [image.container_name for image in images]
+        )
+        out, _, _ = yield images[0]._run_command(command, raise_on_error=False)
+
+        # like docker stop of a single container, the batch succeeds on a dry run
+        stopped = set(out.splitlines())
+        unstopped = [
+            image
+            for image in images
+            if not image._args.dry_run and image.container_name not in stopped
+        ]
+
+        failures = yield cls._failures_of(unstopped, lambda image: image.stop())
+        defer.returnValue(failures)
+
+    @classmethod
+    @defer.inlineCallbacks
+    def batched_rm(cls, images):
+        """
+        Like rm() on each of the images, with a single docker rm. Named volumes are deleted after all the
+        containers are removed
+        :param images: images that don't override rm(), all sharing the same args
+        :return: A deferred firing with {image: failure} of the images that failed
+        :rtype: defer.Deferred
+        """
+        args = images[0]._args
+
+        for image in images:
+            image._logger.debug('Removing')
+
+        command = ['docker', 'rm']
+
+        if hasattr(args, 'force') and args.force:
+            command.append('--force')
+
+        command = manof.utils.Argv(command + [image.container_name for image in images])
+
+        # remove containers and ignore errors (since docker returns error if a container doesn't exist)
+        yield images[0]._run_command(command, raise_on_error=False)
+
+        failures = {}
+        if 'volumes' in args and args.volumes:
+            failures = yield cls._failures_of(
+                images, lambda image: image._delete_all_named_volumes()
+            )
+
+        defer.returnValue(failures)
+
+    @staticmethod
+    @defer.inlineCallbacks
+    def _failures_of(images, operation):
+        """
+        Run operation on all images concurrently, and return {image: failure} of those it failed on
+        """
+        results = yield defer.DeferredList(
+            [defer.maybeDeferred(operation, image) for image in images],
+            consumeErrors=True,
+        )
+
+        defer.returnValue(
+            {
+                image: result
+                for image, (success, result) in zip(images, results)
+                if not success
+            }
+        )
+
     @defer.inlineCallbacks
     def push(self):
         if self.skip_push:
@@ -321,10 +493,10 @@ class Image(manof.Target):
 
         # tag and push
         yield self._run_command(
-            [
-                'docker tag {0} {1}'.format(self.image_name, self.remote_image_name),
-                'docker push {0}'.format(self.remote_image_name),
-            ]
+            manof.utils.Argv(['docker', 'tag', self.image_name, self.remote_image_name])
+        )
+        yield self._run_command(
+            manof.utils.Argv(['docker', 'push', self.remote_image_name])
         )
 
         if not self._args.no_cleanup:
@@ -333,7 +505,9 @@ class Image(manof.Target):
                 image_name=self.image_name,
                 remote_image_name=self.remote_image_name,
             )
-            yield self._run_command('docker rmi {0}'.format(self.remote_image_name))
+            yield self._run_command(
+                manof.utils.Argv(['docker', 'rmi', self.remote_image_name])
+            )
 
         self.pprint_json(
             {
@@ -351,86 +525,168 @@ class Image(manof.Target):
         )
 
         # first, pull the image
-        yield self._run_command('docker pull {0}'.format(self.remote_image_name))
+        yield self._run_coalesced(
+            'pull',
+            self.remote_image_name,
+            self._run_command,
+            manof.utils.Argv(['docker', 'pull', self.remote_image_name]),
+        )
 
         # tag pulled images with its local repository + name
         if self._args.tag_local:
             yield self._tag_local()
 
+    @defer.inlineCallbacks
+    def _build(self, command, dockerignore, build_key):
+
+        # if image provides a programmatic docker ignore, we need to create a temporary
+        # file at the context and remove it when we're done
+        if dockerignore is not None:
+            dockerignore_path = os.path.join(self.context, '.dockerignore')
+
+            try:
+
+                # write the docker ignore
+                with open(dockerignore_path, 'w') as dockerignore_file:
+                    dockerignore_file.write('\n'.join(dockerignore))
+
+                # do the build
+                yield self._run_command(command)
+
+            finally:
+
+                # whatever happens, delete docker ignore silently
+                try:
+                    os.remove(dockerignore_path)
+                except Exception:
+                    pass
+        else:
+
+            # just run the command
+            yield self._run_command(command)
+
+        if build_key is not None:
+            image_id = yield self._get_image_id()
+            if image_id is not None:
+                self._build_cache.store(self.image_name, build_key, image_id)
+
+    @defer.inlineCallbacks
+    def _run_coalesced(self, operation, key, function, *args):
+        """
+        Run function, unless an identical operation (by key) is already in flight for another image - in
+        which case wait for it and share its result instead
+        """
+        key = (operation, key)
+        if not _in_flight_operations.in_flight(key):
+            result = yield _in_flight_operations.run(key, function, *args)
+            defer.returnValue(result)
+
+        self._logger.info(
+            'Identical operation already in flight, waiting for it',
+            operation=operation,
+            image_name=self.image_name,
+        )
+        manof.utils.metrics.inc('manof_coalesced_operations_total', operation=operation)
+
+        with manof.utils.tracing.span(
+            'waiting for in flight {0}'.format(operation),
+            'coalesced',
+            image_name=self.image_name,
+        ):
+            result = yield _in_flight_operations.run(key, function, *args)
+
+        defer.returnValue(result)
+
     @defer.inlineCallbacks
     def lift(self):
         self._logger.debug('Lifting')
 
         # remove containers and ignore errors (since docker returns error if the container doesn't exist)
         yield self.provision()
-        yield self.run()
+        result = yield self.run()
+
+        defer.returnValue(result)
+
+    def resource_class(self, command_name):
+        if command_name in ['provision', 'lift']:
+            return 'build' if self.context is not None else 'network-pull'
+
+        if command_name == 'pull':
+            return 'network-pull'
 
-    def _add_resource_limit_arguments(self, command):
+        if command_name == 'push':
+            return 'push'
+
+        return super(Image, self).resource_class(command_name)
+
+    def _generate_resource_limit_args(self):
         """
         Those route directly to docker args, see docker docs for more info:
         https://docs.docker.com/config/containers/resource_constraints/
         """
+        args = []
 
         # add memory limit args
         if self.memory:
-            command += '--memory {0} '.format(self.memory)
+            args += ['--memory', self.memory]
 
         if self.memory_reservation:
-            command += '--memory-reservation {0} '.format(self.memory_reservation)
+            args += ['--memory-reservation', self.memory_reservation]
 
         if self.kernel_memory:
-            command += '--kernel-memory {0} '.format(self.kernel_memory)
+            args += ['--kernel-memory', self.kernel_memory]
 
         if self.memory_swap:
-            command += '--memory-swap {0} '.format(self.memory_swap)
+            args += ['--memory-swap', self.memory_swap]
 
         if self.memory_swappiness:
-            command += '--memory-swappiness {0} '.format(self.memory_swappiness)
+            args += ['--memory-swappiness', self.memory_swappiness]
 
         if self.oom_kill_disable:
-            command += '--oom-kill-disable '
+            args.append('--oom-kill-disable')
 
         # add cpus limit args
         if self.cpus:
-            command += '--cpus {0} '.format(self.cpus)
+            args += ['--cpus', self.cpus]
 
         if self.cpu_period:
-            command += '--cpu-period {0} '.format(self.cpu_period)
+            args += ['--cpu-period', self.cpu_period]
 
         if self.cpu_quota:
-            command += '--cpu-quota {0} '.format(self.cpu_quota)
+            args += ['--cpu-quota', self.cpu_quota]
 
         if self.cpuset_cpus:
-            command += '--cpuset-cpus {0} '.format(self.cpuset_cpus)
+            args += ['--cpuset-cpus', self.cpuset_cpus]
 
         if self.cpu_shares:
-            command += '--cpu-shares {0} '.format(self.cpu_shares)
+            args += ['--cpu-shares', self.cpu_shares]
 
-        return command
+        return args
 
-    def _add_device_arguments(self, command):
+    def _generate_device_args(self):
+        args = []
 
         # set device cgroup rule
         if self.device_cgroup_rule:
-            command += '--device-cgroup-rule={0} '.format(self.device_cgroup_rule)
+            args.append('--device-cgroup-rule={0}'.format(self.device_cgroup_rule))
 
         # set device read bps
         if self.device_read_bps:
-            command += '--device-read-bps={0} '.format(self.device_read_bps)
+            args.append('--device-read-bps={0}'.format(self.device_read_bps))
 
         # set device read iops
         if self.device_read_iops:
-            command += '--device-read-iops={0} '.format(self.device_read_iops)
+            args.append('--device-read-iops={0}'.format(self.device_read_iops))
 
         # set device write bps
         if self.device_write_bps:
-            command += '--device-write-bps={0} '.format(self.device_write_bps)
+            args.append('--device-write-bps={0}'.format(self.device_write_bps))
 
         # set device write iops
         if self.device_write_iops:
-            command += '--device-write-iops={0} '.format(self.device_write_iops)
+            args.append('--device-write-iops={0}'.format(self.device_write_iops))
 
-        return command
+        return args
 
     @property
     def platform_architecture(self):
@@ -729,6 +985,9 @@ class Image(manof.Target):
 
     def to_dict(self):
         d = super(Image, self).to_dict()
+
+        # don't modify the list the property returned, it may be memoized
+        d['volumes'] = list(d['volumes'])
         for idx, item in enumerate(d['volumes']):
             if issubclass(type(item), dict):
                 volume = list(item.keys())[0]
@@ -745,7 +1004,7 @@ class Image(manof.Target):
         """
         Set all the env related args we registered to environment
         """
-        env = self.env
+        env = list(self.env)
         for idx, envvar in enumerate(env):
             if isinstance(envvar, dict):
                 envvar = list(envvar.keys())[0]
@@ -780,12 +1039,125 @@ class Image(manof.Target):
         )
 
         yield self._run_command(
-            'docker tag {0} {1}'.format(self.remote_image_name, self.image_name)
+            manof.utils.Argv(['docker', 'tag', self.remote_image_name, self.image_name])
         )
 
         # Clean repository from image name if provided
         if self.image_name != self.remote_image_name:
-            yield self._run_command('docker rmi {0}'.format(self.remote_image_name))
+            yield self._run_command(
+                manof.utils.Argv(['docker', 'rmi', self.remote_image_name])
+            )
+
+    def _incremental_run_requested(self):
+        if 'incremental' not in self._args or not self._args.incremental:
+            return False
+
+        if self._args.dry_run:
+            return False
+
+        # volumes are re-created under the running container's feet, so it must be re-created as well
+        if 'delete_volumes' in self._args and self._args.delete_volumes:
+            self._logger.debug('Deleting volumes, ignoring incremental run')
+            return False
+
+        return True
+
+    def _build_cache_requested(self):
+        if 'build_cache' not in self._args or not self._args.build_cache:
+            return False
+
+        if self._args.dry_run:
+            return False
+
+        # no-cache asks for a real build
+        if 'no_cache' in self._args and self._args.no_cache:
+            self._logger.debug('Building without cache, ignoring build cache')
+            return False
+
+        return True
+
+    @property
+    def _build_cache(self):
+        return manof.utils.build_cache.get_build_cache(self._logger)
+
+    @defer.inlineCallbacks
+    def _image_is_built_from(self, build_key):
+        """
+        An image is built from build_key if the last build of image_name with this key produced the image
+        currently tagged as image_name
+        """
+        built_image_id = self._build_cache.get_image_id(self.image_name, build_key)
+        if built_image_id is None:
+            self._logger.debug('Image was not built with this build key')
+            defer.returnValue(False)
+
+        image_id = yield self._get_image_id()
+
+        self._logger.debug(
+            'Compared image to build key',
+            built_image_id=built_image_id,
+            image_id=image_id,
+        )
+
+        defer.returnValue(image_id == built_image_id)
+
+    @defer.inlineCallbacks
+    def _get_image_id(self):
+        out, _, code = yield self._run_command(
+            manof.utils.Argv(
+                ['docker', 'image', 'inspect', '--format', '{{.Id}}', self.image_name]
+            ),
+            raise_on_error=False,
+        )
+
+        defer.returnValue(None if code else out.strip())
+
+    @defer.inlineCallbacks
+    def _container_is_unchanged(self, command_sha):
+        """
+        A container is unchanged if it's running, was started with the same run command and from the
+        image currently tagged as image_name
+        """
+        out, _, code = yield self._run_command(
+            manof.utils.Argv(
+                [
+                    'docker',
+                    'inspect',
+                    '--format',
+                    '{{{{.State.Running}}}} {{{{.Image}}}} '
+                    '{{{{ index .Config.Labels "{0}"}}}}'.format(
+                        Constants.RUN_COMMAND_MD5_HASH_LABEL_NAME
+                    ),
+                    self.container_name,
+                ]
+            ),
+            raise_on_error=False,
+        )
+        if code:
+            self._logger.debug('Container does not exist')
+            defer.returnValue(False)
+
+        running, container_image_id, container_sha = (out.split() + ['', '', ''])[:3]
+
+        image_id = yield self._get_image_id()
+
+        unchanged = (
+            running == 'true'
+            and container_sha == command_sha
+            and container_image_id == image_id
+        )
+
+        self._logger.debug(
+            'Compared container to run command',
+            unchanged=unchanged,
+            running=running,
+            container_run_command_md5=container_sha,
+            run_command_md5=command_sha,
+            container_image_id=container_image_id,
+            image_id=image_id,
+        )
+
+        defer.returnValue(unchanged)
 
     @defer.inlineCallbacks
     def _ensure_named_volume_exists(self, volume_name):
@@ -810,29 +1182,37 @@ class Image(manof.Target):
                 named_volume = host_path(self._logger, self._args)
                 yield named_volume.rm(safe=True)
 
+    @staticmethod
+    def _pipe_line(stream):
+        def _write_line(line):
+            stream.write(line + '\n')
+            stream.flush()
+
+        return _write_line
+
     @staticmethod
     def _classname_is_subclass(class_name, cls):
         return inspect.isclass(class_name) and issubclass(class_name, cls)
 
     def _generate_healthcheck_args(self):
-        arg_string = ''
+        args = []
 
         if self.health_cmd is not None:
-            arg_string += '--health-cmd=\"{0}\" '.format(self.health_cmd)
+            args.append('--health-cmd={0}'.format(self.health_cmd))
 
         if self.health_interval is not None:
-            arg_string += '--health-interval={0} '.format(self.health_interval)
+            args.append('--health-interval={0}'.format(self.health_interval))
 
         if self.health_retries is not None:
-            arg_string += '--health-retries={0} '.format(self.health_retries)
+            args.append('--health-retries={0}'.format(self.health_retries))
 
         if self.health_timeout is not None:
-            arg_string += '--health-timeout={0} '.format(self.health_timeout)
+            args.append('--health-timeout={0}'.format(self.health_timeout))
 
         if self.no_healthcheck:
-            arg_string += '--no-healthcheck '
+            args.append('--no-healthcheck')
 
-        return arg_string
+        return args
 
     def _determine_repository(self):
 
@@ -855,26 +1235,24 @@ class Image(manof.Target):
     def _disconnect_container_from_network(self, container_name, network):
         self._logger.debug('Disconnecting container from net')
         yield self._run_command(
-            'docker network disconnect -f {0} {1}'.format(network, container_name),
+            manof.utils.Argv(
+                ['docker', 'network', 'disconnect', '-f', network, container_name]
+            ),
             raise_on_error=False,
         )
 
     @defer.inlineCallbacks
     def _daemon_supports_multiplatform_build(self):
+        if self._args.dry_run:
+            defer.returnValue(True)
 
-        # multiplatform build is not experimental from 20.10.21
-        out, _, _ = yield self._run_command(
-            'docker version --format \'{{.Client.Version}}\''
+        cache_ttl = (
+            self._args.daemon_probe_cache_ttl
+            if 'daemon_probe_cache_ttl' in self._args
+            else 0
+        )
+        capabilities = yield manof.utils.daemon.get_capabilities(
+            self._logger, cache_ttl
         )
-        try:
-            if out and semver.Version.parse(out) >= semver.Version.parse('20.10.21'):
-                defer.returnValue(True)
-
-        except ValueError:
-            pass
-
-        # There are 2 lines with the key Experimental - one for the server and one for the client.
-        # They both need to be true for the multiplatform build to be supported
-        out, _, _ = yield self._run_command('docker version | grep Experimental')
 
-        defer.returnValue("false" not in out)
+        defer.returnValue(capabilities.supports_multiplatform_build)
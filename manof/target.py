@@ -5,9 +5,76 @@ import os
 from twisted.internet import defer
 
 import manof.utils
+import manof.utils.profiling
+
+
+class _MemoizedProperty(property):
+    """
+    A property whose value is cached on the target when its class sets memoize_properties. Values are
+    cached per the class defining the property, so that super() chains get the value of each class
+    """
+
+    @classmethod
+    def from_property(cls, prop, name, owner):
+        memoized_property = cls(prop.fget, prop.fset, prop.fdel, prop.__doc__)
+        memoized_property._key = (owner, name)
+        return memoized_property
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return super(_MemoizedProperty, self).__get__(instance, owner)
+
+        if (
+            not instance.memoize_properties
+            or self._key[1] in instance.unmemoized_properties
+        ):
+            return self._evaluate(instance, owner)
+
+        values = instance.__dict__.setdefault('_memoized_property_values', {})
+        if self._key not in values:
+            values[self._key] = self._evaluate(instance, owner)
+
+        return values[self._key]
+
+    def _evaluate(self, instance, owner):
+        profiler = manof.utils.profiling.get_property_profiler()
+        if profiler is None:
+            return super(_MemoizedProperty, self).__get__(instance, owner)
+
+        return profiler.evaluate(
+            instance,
+            self._key,
+            lambda: super(_MemoizedProperty, self).__get__(instance, owner),
+        )
 
 
 class Target(object):
+
+    # set to True to compute each property once per command rather than on every access. Values are
+    # recomputed after update_args()
+    memoize_properties = False
+
+    # names of properties that are always recomputed, even if memoize_properties is set
+    unmemoized_properties = frozenset()
+
+    # attributes configuring how the target behaves, rather than describing it
+    _settings = frozenset(['memoize_properties', 'unmemoized_properties'])
+
+    def __init_subclass__(cls, **kwargs):
+        super(Target, cls).__init_subclass__(**kwargs)
+        cls._wrap_properties()
+
+    @classmethod
+    def _wrap_properties(cls):
+
+        # properties copied with .setter() and such are wrapped again, to be keyed by their class
+        for attr, value in list(vars(cls).items()):
+            if isinstance(value, property) and getattr(value, '_key', None) != (
+                cls,
+                attr,
+            ):
+                setattr(cls, attr, _MemoizedProperty.from_property(value, attr, cls))
+
     def __init__(self, logger, args):
         self._logger = logger.get_child(self.name)
         self._args = args
@@ -52,6 +119,9 @@ class Target(object):
     def update_args(self, args):
         vars(self._args).update(vars(args))
 
+        # properties may depend on the args
+        self.__dict__.pop('_memoized_property_values', None)
+
     @property
     def name(self):
         return inflection.underscore(self.__class__.__name__)
@@ -66,12 +136,23 @@ class Target(object):
 
     @property
     def depends_on(self):
+        """
+        The name of the target (or a list of names of targets) this target depends on
+        """
         return None
 
+    def resource_class(self, command_name):
+        """
+        The class of resources the command uses on this target, whose concurrency can be limited with
+        --resource-limit or the manofest's resource_limits: 'build', 'network-pull', 'push' or 'local'
+        (or any other name, to limit targets of your own)
+        """
+        return 'local'
+
     def to_dict(self):
         d = {}
         for attr in dir(self):
-            if attr.startswith('_'):
+            if attr.startswith('_') or attr in self._settings:
                 continue
 
             value = getattr(self, attr)
@@ -108,23 +189,37 @@ class Target(object):
         return True
 
     @defer.inlineCallbacks
-    def _run_command(self, command, cwd=None, raise_on_error=True, env=None):
+    def _run_command(
+        self,
+        command,
+        cwd=None,
+        raise_on_error=True,
+        env=None,
+        out_line_received=None,
+        err_line_received=None,
+    ):
+        # combine commands if list
+        if isinstance(command, list):
+            command = ' && '.join(str(part) for part in command)
+
         self._logger.debug(
             'Running command',
-            command=command,
+            command=str(command),
             cwd=cwd,
             raise_on_error=raise_on_error,
             env=env,
         )
 
-        # combine commands if list
-        if isinstance(command, list):
-            command = ' && '.join(command)
-
         # if dry run, do nothing
         if not self._args.dry_run:
             result = yield manof.utils.execute(
-                command, cwd=cwd, quiet=not raise_on_error, env=env, logger=self._logger
+                command,
+                cwd=cwd,
+                quiet=not raise_on_error,
+                env=env,
+                logger=self._logger,
+                out_line_received=out_line_received,
+                err_line_received=err_line_received,
             )
         else:
             result = yield '', '', 0
@@ -147,3 +242,6 @@ class Target(object):
             argument = '--{0}'.format(argument)
 
         return argument
+
+
+Target._wrap_properties()
@@ -1,13 +1,71 @@
 import os
+import shlex
 import sys
-import io
+import time
 import typing
 
 from twisted.internet import defer, protocol
+from twisted.python import procutils
 
 import simplejson
-import pygments.lexers
-import pygments.formatters
+
+import clients.logging.formatter.helpers
+import manof.utils.metrics
+import manof.utils.tracing
+
+
+# when set, docker commands it supports are executed through the Engine API rather than the docker CLI
+_docker_api_adapter = None
+
+# notified of the commands executed and the operations retried, see observe_commands()
+_command_observer = None
+
+
+# characters a shell would do more than split words by, other than quotes (even when quoted, to be safe)
+_SHELL_SPECIAL_CHARACTERS = frozenset('$`\\|&;<>(){}[]*?~#!\n')
+
+# {executable name: its path, or None if it's not in the PATH}
+_executable_paths = {}
+
+
+class Argv(tuple):
+    """
+    A command as the argv it is executed with - directly, rather than through a shell. Shown (and logged)
+    as the equivalent shell command line
+    """
+
+    def __new__(cls, args):
+        return super(Argv, cls).__new__(cls, [str(arg) for arg in args])
+
+    def __str__(self):
+        return ' '.join(shlex.quote(arg) for arg in self)
+
+
+def split_argv(command_line):
+    """
+    Returns the Argv of a shell command line if the shell would do nothing for it but split it into words,
+    or None if it relies on the shell (e.g. for '&&', pipes, redirections or expansions)
+    """
+    if _SHELL_SPECIAL_CHARACTERS.intersection(command_line):
+        return None
+
+    try:
+        args = shlex.split(command_line)
+    except ValueError:
+        return None
+
+    return Argv(args) if args else None
+
+
+def _find_executable(name):
+    if os.sep in name:
+        return name
+
+    if name not in _executable_paths:
+        paths = procutils.which(name)
+        _executable_paths[name] = paths[0] if paths else None
+
+    return _executable_paths[name]
 
 
 class CommandFailedError(Exception):
@@ -97,15 +155,63 @@ def venv_run(logger, venv_path, command, cwd=None, quiet=False):
     return shell_run(logger, commands, cwd, quiet)
 
 
-def getProcessOutputAndValue(executable, args=(), env={}, path=None, reactor=None):
+def use_docker_api(adapter):
+    """
+    Route the docker commands passed to execute() through the given clients.docker.cli.Adapter. Commands
+    the adapter can't translate keep going through the docker CLI
+    :param adapter: the adapter to use, or None to always use the docker CLI
+    :type adapter: clients.docker.cli.Adapter
+    """
+    global _docker_api_adapter
+    _docker_api_adapter = adapter
+
+
+def observe_commands(observer):
+    """
+    Report each command executed by execute() to observer.command_done(command_line, duration, code, err),
+    and each operation retried by retry_until_successful() to observer.operation_retried()
+    :param observer: the observer, or None to stop reporting
+    :type observer: core.parallelism.AdaptiveParallelism
+    """
+    global _command_observer
+    _command_observer = observer
+
+
+# only the tail of each output stream is kept in memory, for the command's result and error messages
+MAX_CAPTURED_OUTPUT_SIZE = 256 * 1024
+
+# the 'Command succeeded' record carries only this many last lines of each output stream, up to this size.
+# the whole output is logged line by line at verbose severity as it arrives
+MAX_LOGGED_OUTPUT_LINES = 5
+MAX_LOGGED_OUTPUT_SIZE = 1024
+
+
+def getProcessOutputAndValue(
+    executable,
+    args=(),
+    env={},
+    path=None,
+    reactor=None,
+    out_line_received=None,
+    err_line_received=None,
+    max_captured_output_size=MAX_CAPTURED_OUTPUT_SIZE,
+):
     """
     Spawn a process and returns a Deferred that will be called back with
-    its output (from stdout and stderr) and it's exit code as (out, err, code)
-    If a signal is raised, the Deferred will errback with the stdout and
+    the tail of its output (from stdout and stderr) and it's exit code as (out, err, code)
+    If a signal is raised, the Deferred will errback with the tail of the stdout and
     stderr up to that point, along with the signal, as (out, err, signalNum)
+    Output lines are passed to out_line_received / err_line_received as they arrive
     """
     return _callProtocolWithDeferred(
-        _EverythingGetter, executable, args, env, path, reactor
+        lambda d: _StreamingOutputGetter(
+            d, out_line_received, err_line_received, max_captured_output_size
+        ),
+        executable,
+        args,
+        env,
+        path,
+        reactor,
     )
 
 
@@ -119,17 +225,78 @@ def _callProtocolWithDeferred(protocol, executable, args, env, path, reactor=Non
     return d
 
 
-class _EverythingGetter(protocol.ProcessProtocol):
-    def __init__(self, deferred):
+class _OutputStream(object):
+    """
+    Splits a process output stream to decoded lines as it arrives, keeping only a bounded tail of it
+    """
+
+    def __init__(self, line_received, max_captured_size):
+        self._line_received = line_received
+        self._max_captured_size = max_captured_size
+        self._tail = bytearray()
+        self._partial_line = b''
+        self.size = 0
+        self.truncated = False
+
+    def data_received(self, data):
+        self.size += len(data)
+        self._tail += data
+        if len(self._tail) > self._max_captured_size:
+            del self._tail[: len(self._tail) - self._max_captured_size]
+            self.truncated = True
+
+        if self._line_received is None:
+            return
+
+        lines = (self._partial_line + data).split(b'\n')
+        self._partial_line = lines.pop()
+
+        # don't let a never ending line grow unbounded either
+        if len(self._partial_line) > self._max_captured_size:
+            lines.append(self._partial_line)
+            self._partial_line = b''
+
+        for line in lines:
+            self._line_received(line.decode('utf-8', 'replace'))
+
+    def close(self):
+        if self._partial_line and self._line_received is not None:
+            self._line_received(self._partial_line.decode('utf-8', 'replace'))
+
+        self._partial_line = b''
+
+    @property
+    def tail(self):
+        return bytes(self._tail)
+
+
+class _CapturedOutput(bytes):
+    """
+    The captured tail of an output stream, knowing the size of the whole stream and whether it was truncated
+    """
+
+    def __new__(cls, stream):
+        captured = super(_CapturedOutput, cls).__new__(cls, stream.tail)
+        captured.size = stream.size
+        captured.truncated = stream.truncated
+        return captured
+
+
+class _StreamingOutputGetter(protocol.ProcessProtocol):
+    def __init__(
+        self, deferred, out_line_received, err_line_received, max_captured_size
+    ):
         self.deferred = deferred
-        self.outBuf = io.BytesIO()
-        self.errBuf = io.BytesIO()
-        self.outReceived = self.outBuf.write
-        self.errReceived = self.errBuf.write
+        self.out = _OutputStream(out_line_received, max_captured_size)
+        self.err = _OutputStream(err_line_received, max_captured_size)
+        self.outReceived = self.out.data_received
+        self.errReceived = self.err.data_received
 
     def processEnded(self, reason):
-        out = self.outBuf.getvalue()
-        err = self.errBuf.getvalue()
+        self.out.close()
+        self.err.close()
+        out = _CapturedOutput(self.out)
+        err = _CapturedOutput(self.err)
         e = reason.value
         code = e.exitCode
         if e.signal:
@@ -139,27 +306,39 @@ class _EverythingGetter(protocol.ProcessProtocol):
 
 
 @defer.inlineCallbacks
-def execute(command, cwd, quiet, env=None, logger=None):
+def execute(
+    command,
+    cwd,
+    quiet,
+    env=None,
+    logger=None,
+    out_line_received=None,
+    err_line_received=None,
+):
     """
     Runs the specified command in the repo's context (from its directory by default).
     # TODO: Make this trim the last newline of stdout/stderr if one exists, and add support
       for receiving multiline results as a list of strings. Remove any behavior making up for the currently
       existing shortcomings of this function across the board (and boy, that is a large board).
-    :param command: the command to run
-    :type command: str
+    :param command: the command to run - an Argv is spawned directly, a string is run by bash
+    :type command: Argv or str
     :param cwd: (optional) the directory to run the command in (default: None)
     :type cwd: str or NoneType
     :param quiet: (optional) whether to suppress any errors (default: False)
     :type quiet: bool
     :param env: an alternative env dict
     :param logger: an optional logger object
+    :param out_line_received: an optional callable, called with each line of the standard output as it arrives
+    :param err_line_received: an optional callable, called with each line of the standard error as it arrives
     :return: A deferred that is fired when the process has exited.
-        On success, fires with a tuple (out, err, code) of the process.
+        On success, fires with a tuple (out, err, code) of the process. Only the last
+        MAX_CAPTURED_OUTPUT_SIZE bytes of out and err are kept.
         On error, fires with a CommandFailedError.
     :rtype: defer.Deferred
     """
     # if no path was provided, use the repo's current working directory.
     # in instances where this is called with `cwd='.'`, the command is run from ziggy's directory.
+    command_line = str(command)
 
     def _get_error(failure):
         """
@@ -171,7 +350,7 @@ def execute(command, cwd, quiet, env=None, logger=None):
         if logger:
             logger.warn(
                 'Command killed by signal',
-                command=command,
+                command=command_line,
                 cwd=cwd,
                 out=_out,
                 err=_err,
@@ -182,26 +361,107 @@ def execute(command, cwd, quiet, env=None, logger=None):
             if logger:
                 logger.warn('Command failed')
             raise CommandFailedError(
-                command=command, cwd=cwd, out=_out, err=_err, signal=_signal
+                command=command_line, cwd=cwd, out=_out, err=_err, signal=_signal
             )
         else:
             return _out, _err, _signal
 
-    d = getProcessOutputAndValue(
-        '/bin/bash', args=['-c', command], path=cwd, env=env or os.environ
-    )
+    def _line_received(stream_name, consumer):
+        log_lines = logger is not None and logger.isEnabledFor(
+            clients.logging.formatter.helpers.Severity.Verbose
+        )
+
+        # don't bother splitting the output to lines if no one is interested in them
+        if not log_lines and consumer is None:
+            return None
+
+        def _log_and_consume_line(line):
+            if log_lines:
+                logger.verbose('Command output', stream=stream_name, line=line)
+
+            if consumer is not None:
+                consumer(line)
+
+        return _log_and_consume_line
+
+    on_out_line = _line_received('out', out_line_received)
+    on_err_line = _line_received('err', err_line_received)
+
+    started = time.monotonic()
+    d = None
+
+    # the API backend talks to the daemon manof was set up with - overrides in env (e.g. DOCKER_HOST,
+    # DOCKER_CONFIG) are only honored by the CLI
+    if _docker_api_adapter is not None and env is None:
+        d = _docker_api_adapter.execute(command)
+
+    if d is not None:
+
+        # the API backend doesn't stream, pass its output on once the command is done
+        def _consume_api_output(result):
+            for stream, line_received in zip(result, [on_out_line, on_err_line]):
+                if line_received is None:
+                    continue
+
+                for line in stream.decode('utf-8', 'replace').splitlines():
+                    line_received(line)
+
+            return result
+
+        d.addCallback(_consume_api_output)
+    else:
+        executable, args = '/bin/bash', ['-c', command_line]
+
+        # argvs are spawned directly. if the executable isn't found, let bash fail like it would
+        if isinstance(command, Argv) and _find_executable(command[0]) is not None:
+            executable, args = _find_executable(command[0]), command[1:]
+
+        d = getProcessOutputAndValue(
+            executable,
+            args=args,
+            path=cwd,
+            env=env or os.environ,
+            out_line_received=on_out_line,
+            err_line_received=on_err_line,
+        )
 
     # errback chain is fired if a signal is raised in the process
     d.addErrback(_get_error)
-    out, err, code = yield d
 
-    out = out.strip().decode()
-    err = err.strip().decode()
+    subcommand = ' '.join(command_line.split()[:2])
+    manof.utils.metrics.inc('manof_subprocesses_total', subcommand=subcommand)
+
+    with manof.utils.tracing.span(
+        subcommand, 'subprocess', command=command_line, cwd=cwd
+    ) as span:
+        out, err, code = yield d
+        span.set(code=code)
+
+    if _command_observer is not None:
+        _command_observer.command_done(
+            command_line, time.monotonic() - started, code, err
+        )
+
+    manof.utils.metrics.inc('manof_captured_output_bytes_total', len(out), stream='out')
+    manof.utils.metrics.inc('manof_captured_output_bytes_total', len(err), stream='err')
+    if code:
+        manof.utils.metrics.inc(
+            'manof_subprocess_failures_total', subcommand=subcommand
+        )
+
+    # commands run through the docker API backend aren't truncated
+    out_size = getattr(out, 'size', len(out))
+    err_size = getattr(err, 'size', len(err))
+    truncated = getattr(out, 'truncated', False) or getattr(err, 'truncated', False)
+
+    # the tail may start mid character if output was truncated
+    out = out.strip().decode('utf-8', 'replace')
+    err = err.strip().decode('utf-8', 'replace')
     if code:
         if quiet and logger:
             logger.debug(
                 'Command failed quietly',
-                command=command,
+                command=command_line,
                 cwd=cwd,
                 code_or_signal=code,
                 err=err,
@@ -211,27 +471,47 @@ def execute(command, cwd, quiet, env=None, logger=None):
             if logger:
                 logger.warn(
                     'Command failed',
-                    command=command,
+                    command=command_line,
                     cwd=cwd,
                     code_or_signal=code,
                     err=err,
                     out=out,
                 )
             raise CommandFailedError(
-                command=command, cwd=cwd, out=out, err=err, code=code
+                command=command_line, cwd=cwd, out=out, err=err, code=code
             )
     else:
         if logger:
-            logger.info('Command succeeded', command=command, cwd=cwd, out=out, err=err)
+            logger.info(
+                'Command succeeded',
+                command=command_line,
+                cwd=cwd,
+                out_size=out_size,
+                err_size=err_size,
+                truncated=truncated,
+                out=_get_logged_output(out),
+                err=_get_logged_output(err),
+            )
 
     defer.returnValue((out, err, code))
 
 
+def _get_logged_output(output):
+    logged_output = '\n'.join(output.splitlines()[-MAX_LOGGED_OUTPUT_LINES:])
+    return logged_output[-MAX_LOGGED_OUTPUT_SIZE:]
+
+
 @defer.inlineCallbacks
 def get_running_container_label(target_name, label, logger=None):
     sha, _, _ = yield execute(
-        'docker inspect --format \'{{{{ index .Config.Labels "{0}"}}}}\' {1}'.format(
-            label, target_name
+        Argv(
+            [
+                'docker',
+                'inspect',
+                '--format',
+                '{{{{ index .Config.Labels "{0}"}}}}'.format(label),
+                target_name,
+            ]
         ),
         logger=logger,
         cwd=None,
@@ -240,10 +520,79 @@ def get_running_container_label(target_name, label, logger=None):
     return sha
 
 
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls sharing a key into one in-flight operation. Callers arriving while the
+    operation is in flight don't call the function again, they get the in-flight operation's result
+    """
+
+    def __init__(self):
+        self._waiters = {}
+
+    def in_flight(self, key):
+        return key in self._waiters
+
+    def run(self, key, function, *args, **kwargs):
+        """
+        :param key: the identity of the operation
+        :param function: function to run if no operation with this key is in flight
+        :param args: functions args
+        :param kwargs: functions kwargs
+        :return: A deferred firing with the operation's result (or failure)
+        :rtype: defer.Deferred
+        """
+        if key in self._waiters:
+            waiter = defer.Deferred()
+            self._waiters[key].append(waiter)
+            return waiter
+
+        self._waiters[key] = []
+
+        d = defer.maybeDeferred(function, *args, **kwargs)
+        d.addBoth(self._on_operation_done, key)
+        return d
+
+    def _on_operation_done(self, result, key):
+        for waiter in self._waiters.pop(key):
+            waiter.callback(result)
+
+        return result
+
+
 def store_boolean(value):
     return True if value == 'true' else False
 
 
+def cache_dir():
+    """
+    The directory manof keeps its caches in, shared by all invocations of the user
+    """
+    return os.path.join(
+        os.environ.get(
+            'XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')
+        ),
+        'manof',
+    )
+
+
+def write_json_atomically(path, obj):
+    """
+    Write obj as json to path through a temporary file and a rename, so that concurrent invocations never
+    read a partially written file
+    """
+    write_file_atomically(path, simplejson.dumps(obj))
+
+
+def write_file_atomically(path, content):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    temp_path = '{0}.{1}'.format(path, os.getpid())
+    with open(temp_path, 'w') as output_file:
+        output_file.write(content)
+
+    os.rename(temp_path, path)
+
+
 @defer.inlineCallbacks
 def retry_until_successful(num_of_tries, logger, function, *args, **kwargs):
     """
@@ -271,9 +620,15 @@ def retry_until_successful(num_of_tries, logger, function, *args, **kwargs):
     # If retires were not exhausted
     while tries <= num_of_tries:
         try:
-            d = defer.maybeDeferred(function, *args, **kwargs)
-            d.addErrback(_on_operation_callback_error)
-            result = yield d
+            with manof.utils.tracing.span(
+                function.__name__,
+                'retry',
+                try_number=tries,
+                max_number_of_tries=num_of_tries,
+            ):
+                d = defer.maybeDeferred(function, *args, **kwargs)
+                d.addErrback(_on_operation_callback_error)
+                result = yield d
 
         except Exception as exc:
             last_exc = exc
@@ -286,6 +641,14 @@ def retry_until_successful(num_of_tries, logger, function, *args, **kwargs):
             )
             tries += 1
 
+            if tries <= num_of_tries:
+                manof.utils.metrics.inc(
+                    'manof_retries_total', function=function.__name__
+                )
+
+                if _command_observer is not None:
+                    _command_observer.operation_retried()
+
         else:
             defer.returnValue(result)
 
@@ -298,11 +661,7 @@ def retry_until_successful(num_of_tries, logger, function, *args, **kwargs):
 def pprint_json(obj: typing.Union[typing.List, typing.Dict]):
     formatted_json = simplejson.dumps(obj, indent=2)
     if sys.stdout.isatty():
-        json_lexer = pygments.lexers.get_lexer_by_name('Json')
-        formatter = pygments.formatters.get_formatter_by_name(
-            'terminal16m', style='paraiso-dark'
-        )
-        colorful_json = pygments.highlight(formatted_json, json_lexer, formatter)
+        colorful_json = clients.logging.formatter.helpers.highlight_json(formatted_json)
         print(colorful_json)
     else:
         print(formatted_json)
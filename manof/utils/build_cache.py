@@ -0,0 +1,276 @@
+import os
+import re
+import time
+import hashlib
+
+import simplejson
+
+from twisted.internet import defer, threads
+
+import manof.utils
+
+
+# files modified this close to being hashed may be modified again without their mtime changing, so their
+# stat records aren't trusted the next time around
+_RACY_MTIME_WINDOW_NS = 2 * 10**9
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+# the build cache of the invocation, loaded when first used and shared by all images
+_build_cache = None
+
+
+def get_build_cache(logger):
+    global _build_cache
+
+    if _build_cache is None:
+        _build_cache = BuildCache(logger)
+
+    return _build_cache
+
+
+class BuildCache(object):
+    """
+    Remembers, per image name, the key of the last build and the ID of the image it produced, so that a
+    build whose key didn't change can be skipped while the image is still there.
+
+    The key is a hash of the files sent as the build context (after applying the dockerignore), the
+    dockerfile, the build flags and the tag. Hashing the context is incremental - the digests of files
+    whose mtime, size and inode didn't change since they were last hashed are reused
+    """
+
+    def __init__(self, logger, path=None):
+        self._logger = logger
+        self._path = path or os.path.join(manof.utils.cache_dir(), 'build_cache.json')
+
+        try:
+            with open(self._path) as cache_file:
+                cache = simplejson.load(cache_file)
+
+            self._files = cache['files']
+            self._builds = cache['builds']
+        except Exception:
+            self._files = {}
+            self._builds = {}
+
+    @defer.inlineCallbacks
+    def compute_key(self, context, dockerfile, dockerignore, build_args, tag):
+        """
+        :param context: path of the build context
+        :param dockerfile: path of the dockerfile
+        :param dockerignore: the dockerignore patterns, or None to read them from the context's .dockerignore
+        :type dockerignore: list
+        :param build_args: the flags docker build is called with
+        :type build_args: list
+        :param tag: the tag of the built image
+        :return: A deferred firing with the key
+        :rtype: defer.Deferred
+        """
+        context = os.path.abspath(context)
+
+        if dockerignore is None:
+            dockerignore = _read_dockerignore(context)
+
+        # hash in a thread so the other targets keep running while a large context is read
+        context_digest, file_records = yield threads.deferToThread(
+            _hash_context, context, dockerignore, self._files
+        )
+
+        # replace the records of the context as a whole, so records of deleted files don't linger
+        context_prefix = os.path.join(context, '')
+        for path in [path for path in self._files if path.startswith(context_prefix)]:
+            del self._files[path]
+        self._files.update(file_records)
+
+        key = hashlib.sha256()
+        for part in [
+            context_digest,
+            _hash_file(dockerfile),
+            '\n'.join(dockerignore),
+            ' '.join(sorted(build_args)),
+            tag,
+        ]:
+            key.update(part.encode('utf-8') + b'\0')
+
+        self._logger.debug(
+            'Computed build key',
+            context=context,
+            num_files=len(file_records),
+            key=key.hexdigest(),
+        )
+
+        defer.returnValue(key.hexdigest())
+
+    def get_image_id(self, tag, key):
+        """
+        Returns the ID of the image built as tag with the given key, or None if the last build of tag had
+        a different key
+        """
+        build = self._builds.get(tag)
+        if build is None or build['key'] != key:
+            return None
+
+        return build['image_id']
+
+    def store(self, tag, key, image_id):
+        self._builds[tag] = {'key': key, 'image_id': image_id}
+
+        try:
+            manof.utils.write_json_atomically(
+                self._path, {'files': self._files, 'builds': self._builds}
+            )
+        except Exception as exc:
+            self._logger.debug('Failed to store build cache', exc=repr(exc))
+
+
+def _read_dockerignore(context):
+    try:
+        with open(os.path.join(context, '.dockerignore')) as dockerignore_file:
+            return dockerignore_file.read().splitlines()
+    except IOError:
+        return []
+
+
+def _hash_context(context, dockerignore, previous_file_records):
+    """
+    Hash the files docker build would send from context, in a stable order.
+    Returns the digest and the stat records of the hashed files
+    """
+    rules = _compile_dockerignore(dockerignore)
+    has_exceptions = any(not exclude for _, exclude in rules)
+    hashed_at_ns = time.time_ns()
+
+    context_hash = hashlib.sha256()
+    file_records = {}
+
+    for dir_path, dir_names, file_names in os.walk(context):
+        dir_names.sort()
+        rel_dir_path = os.path.relpath(dir_path, context)
+        if rel_dir_path == '.':
+            rel_dir_path = ''
+
+        # a directory can only be skipped entirely if no exception can bring back files under it
+        if not has_exceptions:
+            dir_names[:] = [
+                dir_name
+                for dir_name in dir_names
+                if not _is_ignored(os.path.join(rel_dir_path, dir_name), rules)
+            ]
+
+        for file_name in sorted(file_names):
+            rel_path = os.path.join(rel_dir_path, file_name)
+            if _is_ignored(rel_path, rules):
+                continue
+
+            path = os.path.join(dir_path, file_name)
+            stat = os.lstat(path)
+            record = [stat.st_mtime_ns, stat.st_size, stat.st_ino, stat.st_mode]
+
+            previous_record = previous_file_records.get(path)
+            if previous_record is not None and previous_record[:4] == record:
+                digest = previous_record[4]
+            elif os.path.islink(path):
+                digest = hashlib.sha256(os.readlink(path).encode('utf-8')).hexdigest()
+            else:
+                digest = _hash_file(path)
+
+            if hashed_at_ns - stat.st_mtime_ns > _RACY_MTIME_WINDOW_NS:
+                file_records[path] = record + [digest]
+
+            context_hash.update(
+                '{0}\0{1:o}\0{2}\n'.format(rel_path, stat.st_mode, digest).encode(
+                    'utf-8'
+                )
+            )
+
+    return context_hash.hexdigest(), file_records
+
+
+def _hash_file(path):
+    file_hash = hashlib.sha256()
+
+    with open(path, 'rb') as hashed_file:
+        for chunk in iter(lambda: hashed_file.read(_HASH_CHUNK_SIZE), b''):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
+def _compile_dockerignore(patterns):
+    """
+    Returns [(regex, exclude)] for the dockerignore patterns, where exclude is False for exceptions
+    (patterns starting with !)
+    """
+    rules = []
+
+    for pattern in patterns:
+        pattern = pattern.strip()
+        if not pattern or pattern.startswith('#'):
+            continue
+
+        exclude = not pattern.startswith('!')
+        if not exclude:
+            pattern = pattern[1:].strip()
+
+        pattern = os.path.normpath(pattern).lstrip('/')
+        if pattern in ['', '.']:
+            continue
+
+        rules.append((re.compile(_pattern_to_regex(pattern)), exclude))
+
+    return rules
+
+
+def _pattern_to_regex(pattern):
+    regex = ''
+    index = 0
+
+    while index < len(pattern):
+        char = pattern[index]
+
+        if pattern.startswith('**/', index):
+            regex += '(.*/)?'
+            index += 3
+            continue
+
+        if pattern.startswith('**', index):
+            regex += '.*'
+            index += 2
+            continue
+
+        if char == '*':
+            regex += '[^/]*'
+        elif char == '?':
+            regex += '[^/]'
+        elif char == '[':
+            end = pattern.find(']', index + 1)
+            if end == -1:
+                regex += re.escape(char)
+            else:
+                regex += '[{0}]'.format(pattern[index + 1 : end].replace('\\', '\\\\'))
+                index = end
+        elif char == '\\' and index + 1 < len(pattern):
+            index += 1
+            regex += re.escape(pattern[index])
+        else:
+            regex += re.escape(char)
+
+        index += 1
+
+    return '^{0}$'.format(regex)
+
+
+def _is_ignored(rel_path, rules):
+    """
+    Like docker, the last matching pattern wins, and a pattern matching a directory matches everything
+    under it
+    """
+    parts = rel_path.split(os.sep)
+    candidates = ['/'.join(parts[: index + 1]) for index in range(len(parts))]
+
+    ignored = False
+    for regex, exclude in rules:
+        if any(regex.match(candidate) for candidate in candidates):
+            ignored = exclude
+
+    return ignored
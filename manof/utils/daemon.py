@@ -0,0 +1,192 @@
+import os
+import time
+
+import simplejson
+
+from twisted.internet import defer
+
+import manof.utils
+
+
+# capabilities of the daemon, probed at most once per invocation and shared by all targets
+_capabilities = None
+_probe_single_flight = manof.utils.SingleFlight()
+
+
+class DaemonCapabilities(object):
+    def __init__(
+        self,
+        client_version=None,
+        server_version=None,
+        api_version=None,
+        client_experimental=False,
+        server_experimental=False,
+        buildx=False,
+        buildkit=False,
+    ):
+        self.client_version = client_version
+        self.server_version = server_version
+        self.api_version = api_version
+        self.client_experimental = client_experimental
+        self.server_experimental = server_experimental
+        self.buildx = buildx
+        self.buildkit = buildkit
+
+    @property
+    def supports_multiplatform_build(self):
+
+        # multiplatform build is not experimental from 20.10.21
+        if _version_at_least(self.client_version, '20.10.21'):
+            return True
+
+        # both the client and the server need to be experimental for the multiplatform build to be supported
+        return self.client_experimental and self.server_experimental
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d)
+
+
+def get_capabilities(logger, cache_ttl=0):
+    """
+    Returns a deferred firing with the DaemonCapabilities of the docker daemon. The daemon is probed once
+    per invocation, concurrent callers wait for the same probe
+    :param logger: a logger so we can log the probe
+    :param cache_ttl: if positive, probes are also cached on disk for this many seconds, keyed by DOCKER_HOST
+    :rtype: defer.Deferred
+    """
+    if _capabilities is not None:
+        return defer.succeed(_capabilities)
+
+    return _probe_single_flight.run(
+        'capabilities', _load_or_probe_capabilities, logger, cache_ttl
+    )
+
+
+@defer.inlineCallbacks
+def _load_or_probe_capabilities(logger, cache_ttl):
+    global _capabilities
+
+    docker_host = os.environ.get('DOCKER_HOST', 'default')
+
+    capabilities = _load_cached_capabilities(logger, docker_host, cache_ttl)
+    if capabilities is None:
+        capabilities = yield _probe_capabilities(logger)
+
+        if cache_ttl > 0:
+            _store_cached_capabilities(logger, docker_host, capabilities)
+
+    _capabilities = capabilities
+    defer.returnValue(capabilities)
+
+
+@defer.inlineCallbacks
+def _probe_capabilities(logger):
+    logger.debug('Probing docker daemon capabilities')
+
+    # the daemon may be unreachable, in which case we still get the client's version
+    out, _, _ = yield manof.utils.execute(
+        manof.utils.Argv(['docker', 'version', '--format', '{{json .}}']),
+        cwd=None,
+        quiet=True,
+        logger=logger,
+    )
+
+    try:
+        version = simplejson.loads(out)
+    except ValueError:
+        version = {}
+
+    client = version.get('Client') or {}
+    server = version.get('Server') or {}
+
+    _, _, buildx_code = yield manof.utils.execute(
+        manof.utils.Argv(['docker', 'buildx', 'version']),
+        cwd=None,
+        quiet=True,
+        logger=logger,
+    )
+
+    # BuildKit is the default builder from 23.0, and can be forced either way using DOCKER_BUILDKIT
+    buildkit = os.environ.get('DOCKER_BUILDKIT')
+    if buildkit is None:
+        buildkit = _version_at_least(server.get('Version'), '23.0.0')
+    else:
+        buildkit = buildkit == '1'
+
+    capabilities = DaemonCapabilities(
+        client_version=client.get('Version'),
+        server_version=server.get('Version'),
+        api_version=server.get('ApiVersion') or client.get('ApiVersion'),
+        client_experimental=_experimental(client.get('Experimental')),
+        server_experimental=_experimental(server.get('Experimental')),
+        buildx=buildx_code == 0,
+        buildkit=buildkit,
+    )
+
+    logger.debug('Probed docker daemon capabilities', **capabilities.to_dict())
+    defer.returnValue(capabilities)
+
+
+def _cache_path():
+    return os.path.join(manof.utils.cache_dir(), 'daemon_capabilities.json')
+
+
+def _load_cached_capabilities(logger, docker_host, cache_ttl):
+    if cache_ttl <= 0:
+        return None
+
+    try:
+        with open(_cache_path()) as cache_file:
+            cached = simplejson.load(cache_file)[docker_host]
+    except Exception:
+        return None
+
+    age = time.time() - cached['probed_at']
+    if not 0 <= age < cache_ttl:
+        logger.debug('Cached docker daemon capabilities expired', age=age)
+        return None
+
+    logger.debug('Using cached docker daemon capabilities', age=age)
+    return DaemonCapabilities.from_dict(cached['capabilities'])
+
+
+def _store_cached_capabilities(logger, docker_host, capabilities):
+    cache_path = _cache_path()
+
+    try:
+        with open(cache_path) as cache_file:
+            cache = simplejson.load(cache_file)
+    except Exception:
+        cache = {}
+
+    cache[docker_host] = {
+        'probed_at': time.time(),
+        'capabilities': capabilities.to_dict(),
+    }
+
+    try:
+        manof.utils.write_json_atomically(cache_path, cache)
+    except Exception as exc:
+        logger.debug('Failed to cache docker daemon capabilities', exc=repr(exc))
+
+
+def _experimental(value):
+
+    # older clients report this as a "true"/"false" string. like `docker version | grep Experimental` did, only
+    # an explicit false counts - a daemon that doesn't report the field (or can't be reached) doesn't
+    return value not in [False, 'false']
+
+
+def _version_at_least(version, minimal_version):
+    import semver
+
+    try:
+        return bool(version) and semver.Version.parse(version) >= semver.Version.parse(
+            minimal_version
+        )
+    except ValueError:
+        return False
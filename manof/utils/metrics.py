@@ -0,0 +1,191 @@
+import manof.utils
+
+
+# the metrics of the invocation, None unless a metrics file was requested
+_registry = None
+
+# long enough for pushes and builds
+DURATION_BUCKETS = [0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800]
+
+# {name: (type, help)}
+_metric_definitions = {
+    'manof_command_duration_seconds': (
+        'histogram',
+        'Duration of manof commands',
+    ),
+    'manof_command_success': (
+        'gauge',
+        'Whether the last invocation of the command succeeded',
+    ),
+    'manof_command_last_run_timestamp_seconds': (
+        'gauge',
+        'When the last invocation of the command ended',
+    ),
+    'manof_target_duration_seconds': (
+        'histogram',
+        'Duration of the command on each target',
+    ),
+    'manof_target_failures_total': (
+        'counter',
+        'Targets the command failed on',
+    ),
+    'manof_target_results_total': (
+        'counter',
+        'Results of run, lift and provision on targets: recreated, or skipped as unchanged (incremental run, '
+        'build cache)',
+    ),
+    'manof_subprocesses_total': (
+        'counter',
+        'Commands executed, by program and subcommand',
+    ),
+    'manof_subprocess_failures_total': (
+        'counter',
+        'Commands executed that failed, by program and subcommand',
+    ),
+    'manof_captured_output_bytes_total': (
+        'counter',
+        'Bytes of output captured from executed commands, by stream',
+    ),
+    'manof_retries_total': (
+        'counter',
+        'Operations retried after failing',
+    ),
+    'manof_coalesced_operations_total': (
+        'counter',
+        'Pulls and builds that waited for an identical one in flight rather than running again',
+    ),
+    'manof_build_cache_total': (
+        'counter',
+        'Build cache lookups, by result (hit: the build was skipped)',
+    ),
+}
+
+
+def enable(path):
+    """
+    Start collecting metrics, to be written to path in the Prometheus text format by write()
+    """
+    global _registry
+
+    _registry = Registry(path)
+    return _registry
+
+
+def disable():
+    global _registry
+
+    _registry = None
+
+
+def is_enabled():
+    return _registry is not None
+
+
+def write():
+    if _registry is not None:
+        _registry.write()
+
+
+def inc(name, value=1, **labels):
+    if _registry is not None:
+        _registry.inc(name, value, labels)
+
+
+def observe(name, value, **labels):
+    if _registry is not None:
+        _registry.observe(name, value, labels)
+
+
+def set_gauge(name, value, **labels):
+    if _registry is not None:
+        _registry.set_gauge(name, value, labels)
+
+
+class Registry(object):
+    """
+    Holds the metrics of an invocation and writes them as a node_exporter textfile collector file. The file
+    is replaced as a whole, so each invocation reports its own run
+    """
+
+    def __init__(self, path):
+        self._path = path
+
+        # {name: {sorted label items: value}}, where histogram values are [bucket counts, sum, count]
+        self._samples = {name: {} for name in _metric_definitions}
+
+    def inc(self, name, value, labels):
+        samples = self._samples[name]
+        key = _labels_key(labels)
+        samples[key] = samples.get(key, 0) + value
+
+    def set_gauge(self, name, value, labels):
+        self._samples[name][_labels_key(labels)] = value
+
+    def observe(self, name, value, labels):
+        sample = self._samples[name].setdefault(
+            _labels_key(labels), [[0] * len(DURATION_BUCKETS), 0.0, 0]
+        )
+
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if value <= bound:
+                sample[0][index] += 1
+
+        sample[1] += value
+        sample[2] += 1
+
+    def format(self):
+        lines = []
+
+        for name, samples in self._samples.items():
+            if not samples:
+                continue
+
+            metric_type, metric_help = _metric_definitions[name]
+            lines.append('# HELP {0} {1}'.format(name, metric_help))
+            lines.append('# TYPE {0} {1}'.format(name, metric_type))
+
+            for key, value in sorted(samples.items()):
+                if metric_type != 'histogram':
+                    lines.append(_format_sample(name, key, value))
+                    continue
+
+                bucket_counts, total, count = value
+                for bound, bucket_count in zip(DURATION_BUCKETS, bucket_counts):
+                    lines.append(
+                        _format_sample(
+                            name + '_bucket',
+                            key + (('le', repr(float(bound))),),
+                            bucket_count,
+                        )
+                    )
+
+                lines.append(
+                    _format_sample(name + '_bucket', key + (('le', '+Inf'),), count)
+                )
+                lines.append(_format_sample(name + '_sum', key, total))
+                lines.append(_format_sample(name + '_count', key, count))
+
+        return ''.join(line + '\n' for line in lines)
+
+    def write(self):
+        manof.utils.write_file_atomically(self._path, self.format())
+
+
+def _labels_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_sample(name, labels_key, value):
+    if labels_key:
+        name += '{{{0}}}'.format(
+            ','.join(
+                '{0}="{1}"'.format(label, _escape_label_value(label_value))
+                for label, label_value in labels_key
+            )
+        )
+
+    return '{0} {1}'.format(name, repr(float(value)))
+
+
+def _escape_label_value(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
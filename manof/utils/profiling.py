@@ -0,0 +1,135 @@
+import time
+
+import simplejson
+
+
+# the profiler of manofest properties, None unless profiling was requested
+_property_profiler = None
+
+
+def start_property_profiler():
+    global _property_profiler
+
+    _property_profiler = PropertyProfiler()
+    return _property_profiler
+
+
+def stop_property_profiler():
+    """
+    Stops profiling and returns the profiler, for reporting
+    """
+    global _property_profiler
+
+    profiler, _property_profiler = _property_profiler, None
+    return profiler
+
+
+def get_property_profiler():
+    return _property_profiler
+
+
+class PropertyProfiler(object):
+    """
+    Counts the evaluations of target properties and the time spent in them. Cumulative time includes the
+    properties a property reads (e.g. through super() chains), own time doesn't
+    """
+
+    def __init__(self):
+
+        # {(target, class defining the property, property name): [calls, cumulative time, own time]}
+        self._stats = {}
+
+        # [[key, started, time spent in properties it read]] of the properties being evaluated
+        self._stack = []
+
+    def evaluate(self, target, key, getter):
+        """
+        :param target: the target whose property is evaluated
+        :param key: (class defining the property, property name)
+        :param getter: a callable computing the value
+        :return: the value of the property
+        """
+        stats_key = (target,) + key
+        frame = [stats_key, time.perf_counter(), 0.0]
+        self._stack.append(frame)
+
+        try:
+            return getter()
+        finally:
+            self._stack.pop()
+            elapsed = time.perf_counter() - frame[1]
+
+            stats = self._stats.setdefault(stats_key, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[2] += elapsed - frame[2]
+
+            # a property reading itself (recursion) is only counted once
+            if not any(outer[0] == stats_key for outer in self._stack):
+                stats[1] += elapsed
+
+            if self._stack:
+                self._stack[-1][2] += elapsed
+
+    def get_report(self):
+        """
+        Returns [{target, property, calls, cumulative_ms, own_ms}], costliest first. Properties overridden
+        by the target's class are named <defining class>.<property>
+        """
+        report = []
+
+        for (target, owner, name), (calls, cumulative, own) in list(
+            self._stats.items()
+        ):
+            resolving_cls = next(
+                cls for cls in type(target).__mro__ if name in vars(cls)
+            )
+
+            report.append(
+                {
+                    'target': target.name,
+                    'property': (
+                        name
+                        if resolving_cls is owner
+                        else '{0}.{1}'.format(owner.__name__, name)
+                    ),
+                    'calls': calls,
+                    'cumulative_ms': round(cumulative * 1000, 3),
+                    'own_ms': round(own * 1000, 3),
+                }
+            )
+
+        return sorted(
+            report,
+            key=lambda row: (-row['cumulative_ms'], row['target'], row['property']),
+        )
+
+    def format_table(self):
+        report = self.get_report()
+        target_width = max([len('target')] + [len(row['target']) for row in report])
+        property_width = max(
+            [len('property')] + [len(row['property']) for row in report]
+        )
+
+        row_format = '{0:<%d}  {1:<%d}  {2:>8}  {3:>14}  {4:>10}' % (
+            target_width,
+            property_width,
+        )
+
+        lines = [
+            row_format.format('target', 'property', 'calls', 'cumulative ms', 'own ms')
+        ]
+        for row in report:
+            lines.append(
+                row_format.format(
+                    row['target'],
+                    row['property'],
+                    row['calls'],
+                    '{0:.3f}'.format(row['cumulative_ms']),
+                    '{0:.3f}'.format(row['own_ms']),
+                )
+            )
+
+        return '\n'.join(lines)
+
+    def format_json(self):
+        return simplejson.dumps(self.get_report(), indent=2)
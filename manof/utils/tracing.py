@@ -0,0 +1,241 @@
+import contextvars
+import itertools
+import os
+import time
+
+import manof.utils
+
+
+# the tracer of the invocation, None unless a trace file was requested
+_tracer = None
+
+# the innermost open span of the running code. inlineCallbacks runs each generator in a copy of the context
+# it was started in, so spans opened by a target's operation are the parents of the spans opened by what it
+# calls, even while other targets run in between
+_current_span = contextvars.ContextVar('manof_current_span', default=None)
+
+
+def enable(path):
+    """
+    Start recording spans, to be written to path (in Chrome Trace Event format) by write()
+    """
+    global _tracer
+
+    _tracer = Tracer(path)
+    return _tracer
+
+
+def disable():
+    global _tracer
+
+    _tracer = None
+
+
+def is_enabled():
+    return _tracer is not None
+
+
+def write():
+    if _tracer is not None:
+        _tracer.write()
+
+
+def now():
+    """
+    The current trace timestamp, to pass to async_span() later
+    """
+    return _tracer.timestamp() if _tracer is not None else None
+
+
+def span(name, category, **args):
+    """
+    A context manager recording a span around its block. Usable inside inlineCallbacks generators, where
+    the span covers the yielded deferreds too:
+
+        with manof.utils.tracing.span('docker run', 'subprocess', command=command):
+            yield execute(...)
+    """
+    if _tracer is None:
+        return _null_span
+
+    return _Span(_tracer, name, category, args)
+
+
+def async_span(name, category, started, **args):
+    """
+    Record a span from started (a timestamp from now()) until now, that may overlap others of its kind -
+    e.g. the time targets wait for a free slot
+    """
+    if _tracer is not None and started is not None:
+        _tracer.add_async_span(name, category, started, args)
+
+
+def counter(name, **values):
+    if _tracer is not None:
+        _tracer.add_counter(name, values)
+
+
+class Tracer(object):
+    """
+    Collects trace events and writes them as a Chrome Trace Event file, viewable in chrome://tracing or
+    https://ui.perfetto.dev.
+
+    Spans are laid out on lanes (shown as threads): a span nests in the lane of its parent if the parent is
+    the innermost span there, and otherwise takes the first free lane - so the number of lanes in use at
+    any moment is the parallelism achieved. Only used from the reactor thread
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._started = time.perf_counter()
+        self._pid = os.getpid()
+        self._events = []
+        self._lanes = []
+        self._async_ids = itertools.count(1)
+
+    def timestamp(self):
+        return round((time.perf_counter() - self._started) * 1e6, 3)
+
+    def open_span(self, span):
+        parent = span.parent
+        while parent is not None and parent.ended:
+            parent = parent.parent
+
+        if parent is not None and self._lanes[parent.lane][-1] is parent:
+            span.lane = parent.lane
+        else:
+            span.lane = next(
+                (lane for lane, spans in enumerate(self._lanes) if not spans),
+                len(self._lanes),
+            )
+
+            if span.lane == len(self._lanes):
+                self._lanes.append([])
+
+        self._lanes[span.lane].append(span)
+        span.started = self.timestamp()
+
+    def close_span(self, span):
+        ended = self.timestamp()
+        self._lanes[span.lane].remove(span)
+
+        self._events.append(
+            {
+                'name': span.name,
+                'cat': span.category,
+                'ph': 'X',
+                'ts': span.started,
+                'dur': round(ended - span.started, 3),
+                'pid': self._pid,
+                'tid': span.lane,
+                'args': span.args,
+            }
+        )
+
+    def add_async_span(self, name, category, started, args):
+        async_id = next(self._async_ids)
+
+        for phase, timestamp in [('b', started), ('e', self.timestamp())]:
+            self._events.append(
+                {
+                    'name': name,
+                    'cat': category,
+                    'ph': phase,
+                    'ts': timestamp,
+                    'id': async_id,
+                    'pid': self._pid,
+                    'tid': 0,
+                    'args': args if phase == 'b' else {},
+                }
+            )
+
+    def add_counter(self, name, values):
+        self._events.append(
+            {
+                'name': name,
+                'ph': 'C',
+                'ts': self.timestamp(),
+                'pid': self._pid,
+                'args': values,
+            }
+        )
+
+    def write(self):
+        metadata_events = [
+            {
+                'name': 'process_name',
+                'ph': 'M',
+                'pid': self._pid,
+                'args': {'name': 'manof'},
+            }
+        ]
+
+        for lane in range(len(self._lanes)):
+            metadata_events.append(
+                {
+                    'name': 'thread_name',
+                    'ph': 'M',
+                    'pid': self._pid,
+                    'tid': lane,
+                    'args': {'name': 'lane {0}'.format(lane)},
+                }
+            )
+
+        manof.utils.write_json_atomically(
+            self._path,
+            {
+                'traceEvents': metadata_events + self._events,
+                'displayTimeUnit': 'ms',
+            },
+        )
+
+
+class _Span(object):
+    def __init__(self, tracer, name, category, args):
+        self._tracer = tracer
+        self._token = None
+        self.name = name
+        self.category = category
+        self.args = args
+        self.parent = None
+        self.lane = None
+        self.started = None
+        self.ended = False
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def __enter__(self):
+        self.parent = _current_span.get()
+        self._tracer.open_span(self)
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+
+            # exited in another context than it was entered in
+            _current_span.set(self.parent)
+
+        # inlineCallbacks returns values by raising, which isn't an error
+        if isinstance(exc_value, Exception):
+            self.args['error'] = repr(exc_value)
+
+        self.ended = True
+        self._tracer.close_span(self)
+
+
+class _NullSpan(object):
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        pass
+
+
+_null_span = _NullSpan()
@@ -1,8 +1,75 @@
 import manof
+import manof.utils
 
 from twisted.internet import defer
 
 
+class _NamedVolumeIndex(object):
+    """
+    The names of the named volumes on the daemon. Listed once per invocation (rather than inspecting
+    each volume) and kept up to date with the volumes manof creates and removes
+    """
+
+    def __init__(self):
+        self._volume_names = None
+        self._single_flight = manof.utils.SingleFlight()
+
+    @defer.inlineCallbacks
+    def exists(self, named_volume):
+        if self._volume_names is None:
+            yield self._single_flight.run('list', self._list, named_volume)
+
+        defer.returnValue(named_volume.volume_name in self._volume_names)
+
+    def add(self, volume_name):
+        if self._volume_names is not None:
+            self._volume_names.add(volume_name)
+
+    def discard(self, volume_name):
+        if self._volume_names is not None:
+            self._volume_names.discard(volume_name)
+
+    @defer.inlineCallbacks
+    def _list(self, named_volume):
+        out, _, _ = yield named_volume._run_command(
+            manof.utils.Argv(['docker', 'volume', 'ls', '--format', '{{.Name}}'])
+        )
+
+        self._volume_names = set(out.split())
+        named_volume._logger.debug(
+            'Listed named volumes', num_volumes=len(self._volume_names)
+        )
+
+
+class _NamedVolumeRegistry(object):
+    """
+    Coordinates operations on named volumes across the NamedVolume instances each image creates for the
+    volumes it mounts. Operations are serialized per volume name, and concurrent identical operations on
+    a volume are coalesced into one - every caller gets its result
+    """
+
+    def __init__(self):
+        self._locks = {}
+        self._single_flight = manof.utils.SingleFlight()
+
+    def run(self, volume_name, operation, function, *args, **kwargs):
+        """
+        :param volume_name: the name of the volume the operation is done on
+        :param operation: the identity of the operation (e.g. its name and arguments)
+        :param function: function to run, returning a deferred
+        :rtype: defer.Deferred
+        """
+        lock = self._locks.setdefault(volume_name, defer.DeferredLock())
+
+        return self._single_flight.run(
+            (volume_name, operation), lock.run, function, *args, **kwargs
+        )
+
+
+named_volume_index = _NamedVolumeIndex()
+named_volume_registry = _NamedVolumeRegistry()
+
+
 class Volume(manof.Target):
     def provision(self):
         pass
@@ -32,11 +99,6 @@ class Volume(manof.Target):
 
 
 class NamedVolume(Volume):
-    def __init__(self, *args, **kwargs):
-        super(NamedVolume, self).__init__(*args, **kwargs)
-        self._lock = defer.DeferredLock()
-
-    @defer.inlineCallbacks
     def provision(self, rm=None):
         """
         De facto "docker volume create"
@@ -46,22 +108,33 @@ class NamedVolume(Volume):
         if rm is None:
             rm = 'force_rm' in self._args and self._args.force_rm
 
+        return named_volume_registry.run(
+            self.volume_name, ('provision', rm), self._provision, rm
+        )
+
+    @defer.inlineCallbacks
+    def _provision(self, rm):
         if rm:
-            yield self.rm(safe=True)
+            yield self._rm(safe=True)
 
         self._logger.info('Creating named-volume', name=self.name)
 
         creation_args = []
         if len(self.labels):
             for k, v in self.labels.items():
-                creation_args.append('--label {0}={1}'.format(k, v))
+                creation_args += ['--label', '{0}={1}'.format(k, v)]
 
         if len(self.options):
             for k, v in self.options.items():
-                creation_args.append('--opt {0}={1}'.format(k, v))
-
-        command = 'docker volume create {0} --driver={1} --name={2}'.format(
-            ' '.join(creation_args), self.driver, self.volume_name
+                creation_args += ['--opt', '{0}={1}'.format(k, v)]
+
+        command = manof.utils.Argv(
+            ['docker', 'volume', 'create']
+            + creation_args
+            + [
+                '--driver={0}'.format(self.driver),
+                '--name={0}'.format(self.volume_name),
+            ]
         )
         # don't count on idempotency (labels):
         exists = yield self.exists()
@@ -74,6 +147,7 @@ class NamedVolume(Volume):
                 'Named volume doesn\'t exist. Creating.', named_volume=self.volume_name
             )
             yield self._run_command(command)
+            named_volume_index.add(self.volume_name)
 
     def run(self):
         self._logger.info('Running a named-volume is meaningless', name=self.name)
@@ -81,26 +155,26 @@ class NamedVolume(Volume):
     def stop(self):
         self._logger.info('Stopping a named-volume is meaningless', name=self.name)
 
-    @defer.inlineCallbacks
     def rm(self, safe=True):
         """
         De facto "docker volume rm"
         """
+        return named_volume_registry.run(self.volume_name, ('rm', safe), self._rm, safe)
+
+    @defer.inlineCallbacks
+    def _rm(self, safe):
         self._logger.info('Removing named-volume')
 
-        yield self._lock.acquire()
-        try:
-            if safe:
-                exists = yield self.exists()
-                if not exists:
-                    defer.returnValue(None)
+        if safe:
+            exists = yield self.exists()
+            if not exists:
+                defer.returnValue(None)
 
-            command = 'docker volume rm {0}'.format(self.volume_name)
+        command = manof.utils.Argv(['docker', 'volume', 'rm', self.volume_name])
 
-            # remove volume (fail if doesn't exist)
-            yield self._run_command(command)
-        finally:
-            self._lock.release()
+        # remove volume (fail if doesn't exist)
+        yield self._run_command(command)
+        named_volume_index.discard(self.volume_name)
 
     @defer.inlineCallbacks
     def lift(self):
@@ -109,14 +183,8 @@ class NamedVolume(Volume):
         # just provision
         yield self.provision()
 
-    @defer.inlineCallbacks
     def exists(self):
-        command = 'docker volume inspect {0}'.format(self.volume_name)
-
-        # retcode=0 -> volume exists
-        _, _, retcode = yield self._run_command(command, raise_on_error=False)
-
-        defer.returnValue(False if retcode else True)
+        return named_volume_index.exists(self)
 
     @property
     def prefix(self):
@@ -0,0 +1,91 @@
+import os
+import shutil
+import time
+import tempfile
+
+from twisted.internet import defer
+from twisted.trial import unittest
+
+import manof.utils.build_cache
+import clients.logging
+
+logger = clients.logging.TestingClient('unit_test').logger
+
+
+class BuildCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self._logger = logger
+        self._dir = tempfile.mkdtemp()
+        self._context = os.path.join(self._dir, 'context')
+        self._cache_path = os.path.join(self._dir, 'cache', 'build_cache.json')
+
+        for path, contents in [
+            ('Dockerfile', 'FROM scratch'),
+            ('src/main.py', 'print(1)'),
+            ('src/main.pyc', 'compiled'),
+            ('docs/index.md', 'docs'),
+            ('docs/README.md', 'readme'),
+        ]:
+            self._write(path, contents)
+
+    def tearDown(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _write(self, path, contents):
+        path = os.path.join(self._context, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(contents)
+
+        # make the file old enough for its stat record to be trusted
+        old = time.time() - 60
+        os.utime(path, (old, old))
+
+    def _compute_key(self, build_cache, dockerignore):
+        return build_cache.compute_key(
+            self._context,
+            os.path.join(self._context, 'Dockerfile'),
+            dockerignore,
+            ['--force-rm'],
+            'image:latest',
+        )
+
+    def test_dockerignore(self):
+        rules = manof.utils.build_cache._compile_dockerignore(
+            ['# comment', '**/*.pyc', 'docs', '!docs/README.md', '/tmp?']
+        )
+
+        for path, ignored in [
+            ('src/main.pyc', True),
+            ('main.pyc', True),
+            ('src/main.py', False),
+            ('docs/index.md', True),
+            ('docs/README.md', False),
+            ('tmp1', True),
+            ('tmp12', False),
+        ]:
+            self.assertEqual(
+                manof.utils.build_cache._is_ignored(path, rules), ignored, path
+            )
+
+    @defer.inlineCallbacks
+    def test_key_changes_only_with_sent_files(self):
+        dockerignore = ['**/*.pyc', 'docs']
+        build_cache = manof.utils.build_cache.BuildCache(self._logger, self._cache_path)
+
+        key = yield self._compute_key(build_cache, dockerignore)
+        build_cache.store('image:latest', key, 'sha256:1')
+
+        # a new instance reads the stored build and reuses the stat records
+        build_cache = manof.utils.build_cache.BuildCache(self._logger, self._cache_path)
+        self.assertEqual(build_cache.get_image_id('image:latest', key), 'sha256:1')
+
+        # ignored files don't change the key
+        self._write('docs/index.md', 'more docs')
+        unchanged_key = yield self._compute_key(build_cache, dockerignore)
+        self.assertEqual(unchanged_key, key)
+
+        self._write('src/main.py', 'print(2)')
+        changed_key = yield self._compute_key(build_cache, dockerignore)
+        self.assertNotEqual(changed_key, key)
+        self.assertIsNone(build_cache.get_image_id('image:latest', changed_key))
@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+
+import simplejson
+
+from twisted.internet import defer
+from twisted.trial import unittest
+
+import manof.utils
+import manof.utils.daemon
+import clients.logging
+
+logger = clients.logging.TestingClient('unit_test').logger
+
+
+class _Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class DaemonCapabilitiesTestCase(unittest.TestCase):
+    def setUp(self):
+        self._logger = logger
+        self._dir = tempfile.mkdtemp()
+        self._clock = _Clock()
+        self._version = {
+            'Client': {'Version': '19.03.0', 'Experimental': True},
+            'Server': {'Version': '19.03.0', 'Experimental': True},
+        }
+        self._commands = []
+        self._pending_version = None
+
+        # every test starts as a process of its own, with no capabilities probed yet
+        self._start_process()
+        self.patch(manof.utils, 'execute', self._execute)
+        self.patch(manof.utils, 'cache_dir', lambda: self._dir)
+        self.patch(manof.utils.daemon, 'time', self._clock)
+        self.patch(os, 'environ', dict(os.environ, DOCKER_HOST='unix:///a.sock'))
+
+    def tearDown(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _start_process(self):
+        self.patch(manof.utils.daemon, '_capabilities', None)
+        self.patch(
+            manof.utils.daemon, '_probe_single_flight', manof.utils.SingleFlight()
+        )
+
+    def _execute(self, command, **kwargs):
+        self._commands.append(str(command))
+
+        if command[:2] == ('docker', 'version'):
+            result = (simplejson.dumps(self._version), '', 0)
+            if self._pending_version is not None:
+                return self._pending_version.addCallback(lambda _: result)
+
+            return defer.succeed(result)
+
+        return defer.succeed(('', '', 0))
+
+    def _num_probes(self):
+        return sum(command.startswith('docker version') for command in self._commands)
+
+    @defer.inlineCallbacks
+    def test_probed_once_per_process(self):
+        self._pending_version = defer.Deferred()
+
+        probes = [manof.utils.daemon.get_capabilities(self._logger) for _ in range(2)]
+        self._pending_version.callback(None)
+        capabilities = yield defer.gatherResults(probes)
+        self.assertIs(capabilities[0], capabilities[1])
+
+        later_capabilities = yield manof.utils.daemon.get_capabilities(self._logger)
+        self.assertIs(later_capabilities, capabilities[0])
+        self.assertEqual(self._num_probes(), 1)
+
+    @defer.inlineCallbacks
+    def test_missing_experimental_field_counts_as_experimental(self):
+        del self._version['Server']['Experimental']
+        capabilities = yield manof.utils.daemon.get_capabilities(self._logger)
+        self.assertTrue(capabilities.supports_multiplatform_build)
+
+        # older clients report it as a string
+        self._start_process()
+        self._version['Server']['Experimental'] = 'false'
+        capabilities = yield manof.utils.daemon.get_capabilities(self._logger)
+        self.assertFalse(capabilities.supports_multiplatform_build)
+
+    @defer.inlineCallbacks
+    def test_cache_expires(self):
+        yield manof.utils.daemon.get_capabilities(self._logger, cache_ttl=60)
+
+        self._start_process()
+        self._clock.now += 30
+        capabilities = yield manof.utils.daemon.get_capabilities(
+            self._logger, cache_ttl=60
+        )
+        self.assertEqual(capabilities.client_version, '19.03.0')
+        self.assertEqual(self._num_probes(), 1)
+
+        self._start_process()
+        self._clock.now += 31
+        yield manof.utils.daemon.get_capabilities(self._logger, cache_ttl=60)
+        self.assertEqual(self._num_probes(), 2)
+
+        # without a ttl, the cache isn't used
+        self._start_process()
+        yield manof.utils.daemon.get_capabilities(self._logger)
+        self.assertEqual(self._num_probes(), 3)
+
+    @defer.inlineCallbacks
+    def test_cache_is_keyed_by_docker_host(self):
+        yield manof.utils.daemon.get_capabilities(self._logger, cache_ttl=60)
+
+        self._start_process()
+        os.environ['DOCKER_HOST'] = 'unix:///b.sock'
+        self._version['Client']['Version'] = '24.0.0'
+        capabilities = yield manof.utils.daemon.get_capabilities(
+            self._logger, cache_ttl=60
+        )
+        self.assertEqual(capabilities.client_version, '24.0.0')
+        self.assertEqual(self._num_probes(), 2)
+
+        self._start_process()
+        os.environ['DOCKER_HOST'] = 'unix:///a.sock'
+        capabilities = yield manof.utils.daemon.get_capabilities(
+            self._logger, cache_ttl=60
+        )
+        self.assertEqual(capabilities.client_version, '19.03.0')
+        self.assertEqual(self._num_probes(), 2)
@@ -0,0 +1,190 @@
+import os
+import shutil
+import tempfile
+
+import simplejson
+
+from twisted.internet import defer, reactor
+from twisted.trial import unittest
+from twisted.web import resource, server
+
+import clients.docker
+import clients.docker.cli
+import clients.logging
+
+logger = clients.logging.TestingClient('unit_test').logger
+
+
+class _FakeDockerDaemon(resource.Resource):
+    """
+    Serves a tiny in-memory subset of the Engine API, recording every request it gets
+    """
+
+    isLeaf = True
+
+    def __init__(self):
+        resource.Resource.__init__(self)
+        self.requests = []
+        self.volumes = {}
+        self.containers = {}
+
+    def render(self, request):
+        method = request.method.decode()
+        path = request.path.decode()
+        body = request.content.read()
+        body = simplejson.loads(body) if body else None
+        self.requests.append((method, path, request.args, body))
+
+        request.setHeader(b'Content-Type', b'application/json')
+        status, response = self._route(method, path, request.args, body)
+        request.setResponseCode(status)
+
+        return simplejson.dumps(response).encode() if response is not None else b''
+
+    def _route(self, method, path, args, body):
+        parts = path.strip('/').split('/')
+
+        if parts == ['volumes', 'create']:
+            self.volumes[body['Name']] = dict(body, Mountpoint='/fake')
+            return 201, self.volumes[body['Name']]
+
+        if parts[0] == 'volumes' and len(parts) == 2:
+            if parts[1] not in self.volumes:
+                return 404, {'message': 'get {0}: no such volume'.format(parts[1])}
+            if method == 'DELETE':
+                del self.volumes[parts[1]]
+                return 204, None
+            return 200, self.volumes[parts[1]]
+
+        if parts == ['containers', 'create']:
+            name = args[b'name'][0].decode()
+            self.containers[name] = dict(body, Id='id-{0}'.format(name))
+            return 201, {'Id': 'id-{0}'.format(name), 'Warnings': []}
+
+        if parts[0] == 'containers' and parts[-1] == 'start':
+            return 204, None
+
+        if parts[0] == 'containers' and method == 'DELETE':
+            if self.containers.pop(parts[1], None) is None:
+                return 404, {'message': 'No such container: {0}'.format(parts[1])}
+            return 204, None
+
+        if parts[0] == 'containers' and parts[-1] == 'json':
+            if parts[1] not in self.containers:
+                return 404, {'message': 'No such container: {0}'.format(parts[1])}
+            return 200, {
+                'Id': self.containers[parts[1]]['Id'],
+                'Config': {'Labels': self.containers[parts[1]]['Labels']},
+            }
+
+        return 404, {'message': 'page not found'}
+
+
+class DockerClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self._logger = logger
+        self._daemon = _FakeDockerDaemon()
+
+        site = server.Site(self._daemon)
+        site.connections = 0
+        build_protocol = site.buildProtocol
+
+        def _count_connections(addr):
+            site.connections += 1
+            return build_protocol(addr)
+
+        site.buildProtocol = _count_connections
+        self._site = site
+
+        self._dir = tempfile.mkdtemp()
+        socket_path = os.path.join(self._dir, 'docker.sock')
+        self._port = reactor.listenUNIX(socket_path, site)
+        self._client = clients.docker.Client(self._logger, socket_path)
+        self._adapter = clients.docker.cli.Adapter(self._logger, self._client)
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        yield self._client.close()
+        yield self._port.stopListening()
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    @defer.inlineCallbacks
+    def test_volume_lifecycle_reuses_connection(self):
+        yield self._client.create_volume('data', labels={'a': 'b'})
+        volume = yield self._client.inspect_volume('data')
+        self.assertEqual(volume['Labels'], {'a': 'b'})
+
+        yield self._client.remove_volume('data')
+        with self.assertRaises(clients.docker.DockerApiError) as ctx:
+            yield self._client.inspect_volume('data')
+
+        self.assertEqual(ctx.exception.code, 404)
+
+        # all requests were sent over the same pooled connection
+        self.assertEqual(self._site.connections, 1)
+
+    @defer.inlineCallbacks
+    def test_adapter_run(self):
+        out, err, code = yield self._adapter.execute(
+            'docker run --detach --net host --label manof.runCommandMD5Hash=abc '
+            '--publish 8000:80 --env VERSE=\'Plain talking\' --name moby '
+            'ubuntu:16.04 /bin/bash -c "echo \'hi\'"'
+        )
+
+        self.assertEqual((out, err, code), (b'id-moby', b'', 0))
+
+        config = self._daemon.containers['moby']
+        self.assertEqual(config['Image'], 'ubuntu:16.04')
+        self.assertEqual(config['Cmd'], ['/bin/bash', '-c', 'echo \'hi\''])
+        self.assertEqual(config['Env'], ['VERSE=Plain talking'])
+        self.assertEqual(config['HostConfig']['NetworkMode'], 'host')
+        self.assertEqual(
+            config['HostConfig']['PortBindings'],
+            {'80/tcp': [{'HostIp': '', 'HostPort': '8000'}]},
+        )
+
+        out, _, _ = yield self._adapter.execute(
+            'docker inspect --format \'{{ index .Config.Labels '
+            '"manof.runCommandMD5Hash"}}\' moby'
+        )
+        self.assertEqual(out, b'abc')
+
+    @defer.inlineCallbacks
+    def test_adapter_emulates_cli_errors(self):
+        out, err, code = yield self._adapter.execute('docker rm --force missing')
+
+        self.assertEqual(code, 1)
+        self.assertEqual(err, b'Error response from daemon: No such container: missing')
+
+    def test_adapter_leaves_shell_commands_to_cli(self):
+        for command in [
+            'docker version | grep Experimental',
+            'docker build --rm --tag=a -f a/Dockerfile a',
+            'docker run --net host busybox',
+            'docker run --detach --env A=$HOME busybox',
+            'git pull',
+        ]:
+            self.assertIsNone(self._adapter.execute(command), command)
+
+    def test_adapter_leaves_credential_helper_registries_to_cli(self):
+        config_dir = os.path.join(self._dir, 'docker-config')
+        os.makedirs(config_dir)
+        self.patch(os, 'environ', dict(os.environ, DOCKER_CONFIG=config_dir))
+
+        def _write_config(docker_config):
+            with open(os.path.join(config_dir, 'config.json'), 'w') as config_file:
+                simplejson.dump(docker_config, config_file)
+
+        _write_config({'credHelpers': {'123.dkr.ecr.example.com': 'ecr-login'}})
+        self.assertIsNone(
+            self._adapter.execute('docker pull 123.dkr.ecr.example.com/a:1')
+        )
+        self.assertIsNone(
+            self._adapter.execute('docker push 123.dkr.ecr.example.com/a:1')
+        )
+        self.assertFalse(clients.docker.uses_credential_helper('quay.io/a'))
+
+        # a credentials store holds the credentials of all registries
+        _write_config({'auths': {'quay.io': {}}, 'credsStore': 'desktop'})
+        self.assertIsNone(self._adapter.execute('docker pull quay.io/a:1'))
+        self.assertIsNone(self._adapter.execute('docker pull busybox'))
@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+
+import mock
+
+from twisted.internet import defer
+from twisted.trial import unittest
+
+import core
+import core.history
+import manof.image
+import manof.utils
+import clients.logging
+
+logger = clients.logging.TestingClient('unit_test').logger
+
+
+class HistoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self._logger = logger
+        self._temp_dir = tempfile.mkdtemp()
+        self.patch(manof.utils, 'cache_dir', lambda: self._temp_dir)
+        self._path = core.history.get_path('/projects/web/manofest.py')
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def _record_invocation(self, durations, succeeded=True):
+        history = core.history.History(self._path)
+        for (target_name, command_name), duration in durations.items():
+            history.record(target_name, command_name, duration, succeeded)
+
+        history.write()
+
+    def test_expected_durations(self):
+        history = core.history.History(self._path)
+        self.assertEqual(history.get_expected_durations('provision'), {})
+
+        for duration in [100, 10, 12, 11, 11]:
+            self._record_invocation({('a', 'provision'): duration, ('b', 'run'): 1})
+
+        self._record_invocation({('a', 'provision'): 1000}, succeeded=False)
+
+        self.assertTrue(os.path.exists(self._path))
+        self.assertEqual(
+            history.get_expected_durations('provision'),
+            {'a': 11},
+        )
+        self.assertEqual(history.get_expected_durations('run'), {'b': 1})
+
+    def test_stats_flag_regressions(self):
+        for duration in [10, 11, 9, 10, 30]:
+            self._record_invocation({('a', 'provision'): duration, ('b', 'run'): 2})
+
+        # only the last runs are shown
+        stats = core.history.History(self._path).get_stats(num_runs=4)
+        self.assertEqual(
+            [(row['target'], row['command']) for row in stats],
+            [('a', 'provision'), ('b', 'run')],
+        )
+
+        provision_stats = stats[0]
+        self.assertEqual(provision_stats['durations'], [11, 9, 10, 30])
+        self.assertEqual(provision_stats['change'], 3)
+        self.assertTrue(provision_stats['regressed'])
+        self.assertFalse(stats[1]['regressed'])
+
+        table = core.history.format_stats(stats)
+        self.assertIn('REGRESSED', table.splitlines()[1])
+        self.assertNotIn('REGRESSED', table.splitlines()[2])
+
+        stats = core.history.History(self._path).get_stats(target_names={'b'})
+        self.assertEqual([row['target'] for row in stats], ['b'])
+
+    def test_old_runs_are_pruned(self):
+        self.patch(core.history, 'MAX_RUNS_KEPT', 3)
+
+        for duration in range(5):
+            self._record_invocation({('a', 'run'): duration})
+
+        stats = core.history.History(self._path).get_stats()
+        self.assertEqual(stats[0]['durations'], [2, 3, 4])
+
+    def test_path_is_in_cache_dir(self):
+
+        # one database per manofest, out of its repository
+        self.assertEqual(
+            os.path.dirname(self._path), os.path.join(self._temp_dir, 'history')
+        )
+        self.assertTrue(os.path.basename(self._path).startswith('web-'))
+        self.assertNotEqual(
+            self._path, core.history.get_path('/projects/other/web/manofest.py')
+        )
+        self.assertEqual(
+            self._path, core.history.get_path('/projects/web/../web/manofest.py')
+        )
+
+    @defer.inlineCallbacks
+    def test_skipped_commands_are_not_recorded(self):
+        manof_core = mock.Mock(core.Manof)
+        manof_core._logger = self._logger
+        manof_core._number_of_tries = 1
+        manof_core._history = core.history.History(self._path)
+
+        target = mock.Mock(manof.Image)
+        target.name = 'a'
+        target.provision.__name__ = 'provision'
+        target.run.__name__ = 'run'
+        target.provision.side_effect = [
+            defer.succeed(manof.image.Constants.PROVISION_RESULT_SKIPPED),
+            defer.succeed(None),
+        ]
+        target.run.return_value = defer.succeed(
+            manof.image.Constants.RUN_RESULT_SKIPPED
+        )
+
+        # a build cache hit, an incremental run that didn't recreate the container, and a build
+        for command_name in ['provision', 'run', 'provision']:
+            yield core.Manof._run_command_on_target(manof_core, target, command_name)
+
+        manof_core._history.write()
+
+        stats = manof_core._history.get_stats()
+        self.assertEqual(
+            [(row['target'], row['command'], row['runs']) for row in stats],
+            [('a', 'provision', 1)],
+        )
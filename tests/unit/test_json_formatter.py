@@ -0,0 +1,111 @@
+import collections
+import logging
+import os
+import random
+import time
+
+from twisted.trial import unittest
+
+import clients.logging.formatter.json
+
+ARTIFACTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'artifacts')
+
+
+class _Loggable(object):
+    def __log__(self):
+        return {'loggable': True}
+
+
+class _Unloggable(object):
+    def __repr__(self):
+        return '<unloggable>'
+
+
+_Point = collections.namedtuple('_Point', ['x', 'y'])
+
+
+def _records():
+    """
+    Records with the kinds of vars manof logs, and the ones the formatter has to fall back on
+    """
+    records = []
+
+    for created, levelno, msg, args, record_vars in [
+        (1700000000.0, logging.DEBUG, 'No vars', (), {}),
+        (1700000000.123456, logging.INFO, 'Message %s %d', ('with', 2), {'a': 'b'}),
+        (1700000000.9999996, logging.WARNING, 'Rounds up', (), {'ctx': 'context'}),
+        (
+            1700000001.5,
+            logging.ERROR,
+            'Types',
+            (),
+            {
+                'str': 'é "quoted" \\ \n\t',
+                'int': -3,
+                'big': 10**30,
+                'float': 1.5,
+                'nan': float('nan'),
+                'bool': False,
+                'none': None,
+                'list': [1, 'two', None],
+                'tuple': (1, 2),
+                'namedtuple': _Point(1, 2),
+                'dict': {'nested': {'deep': [True]}},
+                'loggable': _Loggable(),
+                'unloggable': _Unloggable(),
+                'ctx': 'ctx value',
+            },
+        ),
+        (1700000002.25, 5, 'Verbose', (), {'non_utf8': b'\xff\xfe', 'ok': 'yes'}),
+        (1700000003.000001, logging.DEBUG, 'Unicode é', (), {'ключ': 'значение'}),
+    ]:
+        record = logging.LogRecord(
+            'manof.target', levelno, __file__, 0, msg, args, None
+        )
+        record.created = created
+        record.vars = record_vars
+        records.append(record)
+
+    return records
+
+
+class FilebeatJsonFormatterTestCase(unittest.TestCase):
+    def setUp(self):
+
+        # the golden file has timestamps in UTC
+        self._tz = os.environ.get('TZ')
+        os.environ['TZ'] = 'UTC'
+        time.tzset()
+
+    def tearDown(self):
+        if self._tz is None:
+            del os.environ['TZ']
+        else:
+            os.environ['TZ'] = self._tz
+        time.tzset()
+
+    def test_golden_output(self):
+        formatter = clients.logging.formatter.json.FilebeatJsonFormatter()
+
+        with open(
+            os.path.join(ARTIFACTS_DIR, 'filebeat_json_golden.txt')
+        ) as golden_file:
+            golden_lines = golden_file.read().splitlines()
+
+        self.assertEqual(
+            [formatter.format(record) for record in _records()], golden_lines
+        )
+
+    def test_timestamps(self):
+        formatter = clients.logging.formatter.json.FilebeatJsonFormatter()
+        record = _records()[0]
+        random.seed(0)
+
+        for _ in range(10000):
+            record.created = 1700000000 + random.random() * 5
+            self.assertEqual(
+                formatter._format_when(record.created),
+                clients.logging.formatter.json.datetime.datetime.fromtimestamp(
+                    record.created
+                ).isoformat(),
+            )
@@ -0,0 +1,159 @@
+import logging
+import textwrap
+import threading
+
+import simplejson
+
+from twisted.trial import unittest
+
+import clients.logging
+import clients.logging.formatter.helpers as helpers
+import clients.logging.formatter.human_readable
+
+
+def _prettify_output_with_pygments(vars_dict):
+    """
+    The vars as HumanReadableFormatter used to color them - with a pygments highlight pass over all of them
+    """
+    short_values = []
+    long_values = []
+
+    for var_name, var_value in vars_dict.items():
+        if isinstance(var_value, dict):
+            long_values.append(
+                (
+                    var_name,
+                    simplejson.dumps(var_value, indent=4, cls=helpers.ObjectEncoder),
+                )
+            )
+        elif isinstance(var_value, str) and len(var_value) > 40:
+            long_values.append(
+                (
+                    var_name,
+                    textwrap.fill(
+                        '"{0}"'.format(var_value),
+                        width=80,
+                        break_long_words=False,
+                        initial_indent='   ',
+                        subsequent_indent='   ',
+                        replace_whitespace=False,
+                    ),
+                )
+            )
+        else:
+            short_values.append((var_name, str(var_value)))
+
+    values_str = ''
+    if short_values:
+        values_str = helpers.JsonFormatter.format_to_json_str(
+            {k: v for k, v in short_values}
+        )
+    if long_values:
+        values_str += '\n'
+        for lv_name, lv_value in long_values:
+            values_str += '{{{0}:\n{1}}}\n'.format(
+                helpers.JsonFormatter.format_to_json_str(lv_name),
+                lv_value.rstrip('\n'),
+            )
+
+    return helpers.highlight_json(values_str)
+
+
+class HumanReadableFormatterTestCase(unittest.TestCase):
+    def setUp(self):
+        self._formatter = (
+            clients.logging.formatter.human_readable.HumanReadableFormatter(True)
+        )
+
+    def test_colored_like_pygments(self):
+        for vars_dict in [
+            {'a': 'b', 'n': 1, 'none': None, 'escaped': 'é\t"\\'},
+            {
+                'command': 'docker run --detach --name container image:latest ' * 3,
+                'code': 0,
+            },
+            {'output': 'first line\n\nthird line of a long multi-line output'},
+            {
+                'nested': {'a': 1, 'b': ['x', None]},
+                'quoted': 'a long value with "quotes" and \\ backslashes, again and again',
+                'short': 'value',
+            },
+        ]:
+            self.assertEqual(
+                self._formatter._prettify_output(vars_dict),
+                _prettify_output_with_pygments(vars_dict),
+            )
+
+
+class _CollectingHandler(logging.Handler):
+    def __init__(self, level=logging.NOTSET):
+        super(_CollectingHandler, self).__init__(level)
+        self.records = []
+        self.emitting = threading.Event()
+        self.unblocked = threading.Event()
+        self.unblocked.set()
+
+    def emit(self, record):
+        self.emitting.set()
+        self.unblocked.wait()
+        self.records.append((record.getMessage(), record.vars))
+
+
+class AsyncLoggingTestCase(unittest.TestCase):
+    def _create_client(self, name, **kwargs):
+        client = clients.logging.Client(
+            name, 'debug', output_stdout=False, log_async=True, **kwargs
+        )
+        self.addCleanup(client.close)
+
+        handler = _CollectingHandler()
+        client._add_handler(handler)
+        return client, handler
+
+    def test_records_written_in_order(self):
+        client, handler = self._create_client('async_order')
+        args = {'index': 0}
+
+        for index in range(1000):
+            args['index'] = index
+            client.logger.debug('Record %d', index, **args)
+
+        # first_error is tracked when the error is logged, not when it's written
+        client.logger.error('Failed')
+        self.assertEqual(client.logger.first_error['msg'], 'Failed')
+
+        client.close()
+
+        self.assertEqual(len(handler.records), 1001)
+        self.assertEqual(handler.records[10], ('Record 10', {'index': 10}))
+        self.assertEqual(handler.records[-1], ('Failed', {}))
+
+    def test_drop_verbose_on_overflow(self):
+        client, handler = self._create_client(
+            'async_drop', log_async_queue_size=2, log_async_overflow='drop-verbose'
+        )
+
+        # stall the writer on the first record, then overflow the queue with debug records
+        handler.unblocked.clear()
+        client.logger.debug('Stalled')
+        handler.emitting.wait()
+
+        for index in range(5):
+            client.logger.debug('Debug', index=index)
+
+        handler.unblocked.set()
+        client.flush()
+
+        # the drops are reported once the batch that was being written when they happened is done
+        self.assertEqual(
+            handler.records,
+            [
+                ('Stalled', {}),
+                (
+                    'Dropped verbose log records, the log writer fell behind',
+                    {'num_dropped': 3},
+                ),
+                ('Debug', {'index': 0}),
+                ('Debug', {'index': 1}),
+            ],
+        )
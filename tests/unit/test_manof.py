@@ -1,3 +1,4 @@
+import argparse
 import os
 import mock
 
@@ -10,6 +11,28 @@ import clients.logging
 logger = clients.logging.TestingClient('unit_test').logger
 
 
+class Web(manof.Image):
+    @property
+    def image_name(self):
+        return 'web:1.0'
+
+    @property
+    def labels(self):
+        return {'tier': 'front'}
+
+    @property
+    def exposed_ports(self):
+        return [8000, {9000: 9001}]
+
+    @property
+    def env(self):
+        return [{'MODE': 'prod'}]
+
+    @property
+    def command(self):
+        return '/bin/sh -c "echo \'hi\'"'
+
+
 class ManofUnitTestCase(unittest.TestCase):
     def setUp(self):
         self._logger = logger
@@ -66,6 +89,8 @@ class ManofUnitTestCase(unittest.TestCase):
                 'dockerfile': 'test_image/Dockerfile',
             }
         )
+        image._build_cache_requested.return_value = False
+        self._use_real_methods(image, ['_run_coalesced', '_build'])
 
         self._logger.debug('Calling image provisioning')
         yield manof.Image.provision(image)
@@ -78,7 +103,171 @@ class ManofUnitTestCase(unittest.TestCase):
             'Checking _run_command method has been called with a docker build command',
             command=command,
         )
-        self.assertSubstring('docker build', command)
+        self.assertSubstring('docker build', str(command))
+
+    @defer.inlineCallbacks
+    def test_provision_build_skips_up_to_date_image(self):
+        self._logger.info('Testing manof provision of an up to date image')
+        image = self._create_manof_image(
+            image_properties={
+                'image_name': 'test_image',
+                'dockerignore': None,
+                'context': 'test_image',
+                'dockerfile': 'test_image/Dockerfile',
+                'platform_architecture': None,
+            },
+            image_args={'no_cache': False, 'force_rm': False},
+        )
+        image._build_cache_requested.return_value = True
+        image._build_cache.compute_key.return_value = defer.succeed('key')
+        image._image_is_built_from.return_value = True
+
+        result = yield manof.Image.provision(image)
+
+        self.assertEqual(result, manof.image.Constants.PROVISION_RESULT_SKIPPED)
+        image._image_is_built_from.assert_called_once_with('key')
+        self.assertFalse(image._run_command.called)
+        self.assertFalse(image.pull.called)
+
+    @defer.inlineCallbacks
+    def test_run_command_md5_is_stable(self):
+        image = Web(self._logger, argparse.Namespace(manofest_path='manofest.py'))
+
+        command, command_sha = yield image._generate_run_command()
+
+        # the md5 manof has always given this target - changing it recreates every container on incremental
+        # runs
+        self.assertEqual(command_sha, '437cbf65e9099dc603dd440ed2823646')
+        self.assertIn('manof.runCommandMD5Hash=' + command_sha, command)
+        self.assertEqual(command[-3:], ('/bin/sh', '-c', 'echo \'hi\''))
+
+    @defer.inlineCallbacks
+    def test_incremental_run_skips_unchanged_container(self):
+        self._logger.info('Testing manof incremental run of an unchanged container')
+        image = self._create_manof_image(
+            image_properties={
+                'image_name': 'test_image',
+                'container_name': 'test_image',
+                'pipe_stdout': False,
+            },
+            image_args={'print_command_only': False, 'print_run_md5_only': False},
+        )
+        image._incremental_run_requested.return_value = True
+        image._generate_run_command.return_value = ('docker run test_image', 'sha')
+        image._container_is_unchanged.return_value = True
+        image._run_command.return_value = ('', '', 0)
+
+        result = yield manof.Image.run(image)
+
+        self.assertEqual(result, manof.image.Constants.RUN_RESULT_SKIPPED)
+        image._container_is_unchanged.assert_called_once_with('sha')
+        self.assertFalse(image.rm.called)
+        self.assertFalse(image._run_command.called)
+
+        # once changed, the container is re-created
+        image._container_is_unchanged.return_value = False
+
+        result = yield manof.Image.run(image)
+
+        self.assertEqual(result, manof.image.Constants.RUN_RESULT_RECREATED)
+        image.rm.assert_called_once_with(True)
+        image._run_command.assert_called_once()
+        self.assertEqual(image._run_command.call_args.args[0], 'docker run test_image')
+
+    @defer.inlineCallbacks
+    def test_concurrent_pulls_of_same_image_are_coalesced(self):
+        self._logger.info('Testing manof coalescing of concurrent pulls')
+        pending_pull = defer.Deferred()
+        images = []
+
+        for image_name in ['role_a', 'role_b']:
+            image = self._create_manof_image(
+                image_properties={
+                    'image_name': image_name,
+                    'remote_image_name': 'registry/shared:latest',
+                },
+                image_args={'tag_local': None},
+            )
+            self._use_real_methods(image, ['pull', '_run_coalesced'])
+            image._run_command.return_value = pending_pull
+            images.append(image)
+
+        pulls = [image.pull() for image in images]
+        pending_pull.callback(('', '', 0))
+        yield defer.gatherResults(pulls)
+
+        images[0]._run_command.assert_called_once_with(
+            manof.utils.Argv(['docker', 'pull', 'registry/shared:latest'])
+        )
+        self.assertFalse(images[1]._run_command.called)
+
+    @defer.inlineCallbacks
+    def test_batched_stop(self):
+        self._logger.info('Testing manof batched stop')
+        images = self._create_manof_images(['a', 'b', 'c'], time=10, dry_run=False)
+
+        # docker reports the containers it stopped, b is stopped on its own to fail like stop() does
+        images[0]._run_command.return_value = ('a\nc', 'No such container: b', 1)
+        images[1].stop.side_effect = RuntimeError('No such container: b')
+
+        failures = yield manof.Image.batched_stop(images)
+
+        images[0]._run_command.assert_called_once_with(
+            manof.utils.Argv(['docker', 'stop', '--time=10', 'a', 'b', 'c']),
+            raise_on_error=False,
+        )
+        self.assertFalse(images[0].stop.called)
+        images[1].stop.assert_called_once_with()
+        self.assertFalse(images[2].stop.called)
+        self.assertEqual(list(failures), [images[1]])
+        self.assertIsInstance(failures[images[1]].value, RuntimeError)
+
+    @defer.inlineCallbacks
+    def test_batched_rm_deletes_volumes_after_containers(self):
+        self._logger.info('Testing manof batched rm')
+        images = self._create_manof_images(
+            ['a', 'b'], force=True, volumes=True, dry_run=False
+        )
+        calls = []
+
+        images[0]._run_command.side_effect = lambda command, **kwargs: calls.append(
+            str(command)
+        )
+        for image in images:
+            image._delete_all_named_volumes.side_effect = (
+                lambda name=image.container_name: calls.append('volumes of ' + name)
+            )
+
+        failures = yield manof.Image.batched_rm(images)
+
+        self.assertEqual(
+            calls, ['docker rm --force a b', 'volumes of a', 'volumes of b']
+        )
+        self.assertEqual(failures, {})
+
+    @staticmethod
+    def _use_real_methods(image, method_names):
+        for method_name in method_names:
+            setattr(
+                image,
+                method_name,
+                getattr(manof.Image, method_name).__get__(image, manof.Image),
+            )
+
+    def _create_manof_images(self, container_names, **image_args):
+
+        # the targets of an invocation share its args
+        args = argparse.Namespace(**image_args)
+
+        images = []
+        for container_name in container_names:
+            image = self._create_manof_image(
+                image_properties={'container_name': container_name}
+            )
+            image._args = args
+            images.append(image)
+
+        return images
 
     def _create_manof_image(self, image_properties, image_args=None):
         self._logger.debug('Creating test image mock')
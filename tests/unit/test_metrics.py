@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+
+from twisted.trial import unittest
+
+import manof.utils.metrics
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self._metrics_path = os.path.join(self._temp_dir, 'manof.prom')
+        manof.utils.metrics.enable(self._metrics_path)
+
+    def tearDown(self):
+        manof.utils.metrics.disable()
+        shutil.rmtree(self._temp_dir)
+
+    def _read_samples(self):
+        manof.utils.metrics.write()
+
+        with open(self._metrics_path) as metrics_file:
+            lines = metrics_file.read().splitlines()
+
+        return dict(line.rsplit(' ', 1) for line in lines if not line.startswith('#'))
+
+    def test_counters_and_gauges(self):
+        manof.utils.metrics.inc('manof_subprocesses_total', subcommand='docker run')
+        manof.utils.metrics.inc('manof_subprocesses_total', subcommand='docker run')
+        manof.utils.metrics.inc('manof_captured_output_bytes_total', 10, stream='out')
+        manof.utils.metrics.set_gauge('manof_command_success', 1, command='lift')
+
+        samples = self._read_samples()
+
+        self.assertEqual(
+            samples,
+            {
+                'manof_subprocesses_total{subcommand="docker run"}': '2.0',
+                'manof_captured_output_bytes_total{stream="out"}': '10.0',
+                'manof_command_success{command="lift"}': '1.0',
+            },
+        )
+
+    def test_histograms(self):
+        for duration in [0.05, 3, 4000]:
+            manof.utils.metrics.observe(
+                'manof_target_duration_seconds', duration, command='run', target='a'
+            )
+
+        samples = self._read_samples()
+        labels = 'command="run",target="a"'
+
+        self.assertEqual(
+            samples['manof_target_duration_seconds_bucket{%s,le="0.1"}' % labels], '1.0'
+        )
+        self.assertEqual(
+            samples['manof_target_duration_seconds_bucket{%s,le="5.0"}' % labels], '2.0'
+        )
+        self.assertEqual(
+            samples['manof_target_duration_seconds_bucket{%s,le="+Inf"}' % labels],
+            '3.0',
+        )
+        self.assertEqual(
+            samples['manof_target_duration_seconds_count{%s}' % labels], '3.0'
+        )
+        self.assertEqual(
+            float(samples['manof_target_duration_seconds_sum{%s}' % labels]), 4003.05
+        )
+
+    def test_label_values_are_escaped(self):
+        manof.utils.metrics.inc('manof_retries_total', function='a"b\\c\nd')
+
+        self.assertIn(
+            'manof_retries_total{function="a\\"b\\\\c\\nd"}', self._read_samples()
+        )
@@ -0,0 +1,145 @@
+from twisted.internet import defer
+from twisted.trial import unittest
+
+import core.parallelism
+import manof.utils.tracing
+import clients.logging
+
+logger = clients.logging.TestingClient('unit_test').logger
+
+
+class _HostLoad(object):
+    def __init__(self):
+        self.overload = None
+
+    def get_overload(self):
+        return self.overload
+
+
+class AdaptiveParallelismTestCase(unittest.TestCase):
+    def setUp(self):
+        self._logger = logger
+        self._now = 100.0
+        self._host_load = _HostLoad()
+        self._parallelism = core.parallelism.AdaptiveParallelism(
+            self._logger,
+            minimum=1,
+            maximum=8,
+            host_load=self._host_load,
+            clock=lambda: self._now,
+        )
+
+    def _fill(self):
+        while self._parallelism.try_acquire():
+            pass
+
+    def _command_done(self, duration=0.1, code=0, err=''):
+        self._now += duration
+        self._parallelism.command_done('docker run --detach a', duration, code, err)
+
+    def test_additive_increase_multiplicative_decrease(self):
+
+        # ramps up by one per command while all slots are in use, until congested
+        for _ in range(3):
+            self._fill()
+            self._command_done()
+
+        self.assertEqual(self._parallelism.limit, 4)
+
+        # a command much slower than the fastest of its kind halves the limit
+        self._command_done(duration=5)
+        self.assertEqual(self._parallelism.limit, 2)
+
+        # ...once: commands started before the decrease don't decrease it again
+        self._now += 0.1
+        self._parallelism.command_done('docker run --detach a', 5, 0, '')
+        self.assertEqual(self._parallelism.limit, 2)
+
+        # from then on it grows by one per round of commands
+        self._fill()
+        self._command_done()
+        self.assertEqual(self._parallelism.limit, 2)
+        self._command_done()
+        self.assertEqual(self._parallelism.limit, 3)
+
+    def test_congestion_signals(self):
+        self._fill()
+        self._command_done()
+        self._fill()
+        self._command_done()
+        self.assertEqual(self._parallelism.limit, 3)
+
+        # a command failing because of the daemon
+        self._command_done(code=1, err='context deadline exceeded')
+        self.assertEqual(self._parallelism.limit, 1)
+
+        # the limit doesn't grow unless all slots are in use, and never drops below the minimum
+        self._parallelism.release()
+        self._parallelism.release()
+        self._command_done()
+        self.assertEqual(self._parallelism.limit, 1)
+
+        self._now += 1
+        decisions = []
+        self.patch(
+            manof.utils.tracing,
+            'counter',
+            lambda name, **values: decisions.append(values),
+        )
+        self._parallelism.operation_retried()
+        self.assertEqual(self._parallelism.limit, 1)
+
+        # a decrease at the minimum isn't traced (nor logged)
+        self.assertEqual(decisions, [])
+
+        # failing commands that don't signal congestion, and slow builds, don't count
+        self._fill()
+        self._command_done(code=1, err='No such container: a')
+        self._fill()
+        self._parallelism.command_done('docker build', 60, 0, '')
+        self._command_done()
+        self.assertEqual(self._parallelism.limit, 3)
+
+        # an overloaded host
+        self._host_load.overload = 'Host load average is 2.00 per CPU'
+        self._command_done()
+        self.assertEqual(self._parallelism.limit, 1)
+
+    def test_commands_doing_work_dont_signal_congestion(self):
+        self._fill()
+        self._command_done()
+        self._fill()
+        self._command_done()
+        self.assertEqual(self._parallelism.limit, 3)
+
+        # stops wait for the grace period, batched ones for many containers, and foreground runs for
+        # the container to exit
+        self._parallelism.command_done('docker stop --time 10 a', 0.1, 0, '')
+        self._now += 10
+        for command_line in [
+            'docker stop --time 10 a b c',
+            'docker rm --force a',
+            'docker run --rm a',
+        ]:
+            self._parallelism.command_done(command_line, 10, 0, '')
+
+        self.assertEqual(self._parallelism.limit, 3)
+
+    @defer.inlineCallbacks
+    def test_waiters_get_slots_as_the_limit_grows(self):
+        pending = defer.Deferred()
+        running = [self._parallelism.run(lambda: pending)]
+        running.append(self._parallelism.run(lambda: 'second'))
+        self.assertFalse(running[1].called)
+
+        # the limit grows to 2 while the first runs, so the second starts
+        self._command_done()
+        result = yield running[1]
+        self.assertEqual(result, 'second')
+
+        pending.callback('first')
+        result = yield running[0]
+        self.assertEqual(result, 'first')
+        self.assertTrue(self._parallelism.try_acquire())
+        self.assertTrue(self._parallelism.try_acquire())
+        self.assertFalse(self._parallelism.try_acquire())
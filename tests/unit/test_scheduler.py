@@ -0,0 +1,246 @@
+from twisted.internet import defer
+from twisted.trial import unittest
+
+import core.scheduler
+import clients.logging
+
+logger = clients.logging.TestingClient('unit_test').logger
+
+
+class _Target(object):
+    def __init__(self, name):
+        self.name = name
+
+
+class SchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self._logger = logger
+        self._targets = {name: _Target(name) for name in 'abcdef'}
+        self._started = []
+        self._pending = {}
+
+    def _graph(self, dependencies):
+        return core.scheduler.TargetGraph(
+            [self._targets[name] for name in sorted(self._targets)],
+            {
+                self._targets[name]: [self._targets[parent] for parent in parents]
+                for name, parents in dependencies.items()
+            },
+        )
+
+    def _operation(self, target):
+        self._started.append(target.name)
+        self._pending[target.name] = defer.Deferred()
+        return self._pending[target.name]
+
+    def test_cycle_detection(self):
+        with self.assertRaises(RuntimeError) as ctx:
+            self._graph({'b': ['a', 'd'], 'c': ['b'], 'd': ['c']})
+
+        self.assertIn('b -> c -> d -> b', str(ctx.exception))
+
+    def test_teardown_levels(self):
+
+        # a -> b -> c, and d depends on both b and e. f is independent
+        graph = self._graph({'b': ['a'], 'c': ['b'], 'd': ['b', 'e']})
+
+        self.assertEqual(
+            [[target.name for target in level] for level in graph.teardown_levels()],
+            [['c', 'd', 'f'], ['b', 'e'], ['a']],
+        )
+
+    @defer.inlineCallbacks
+    def test_multiple_dependencies_and_critical_path_first(self):
+
+        # a -> b -> c, and d depends on both a and e. f is independent
+        graph = self._graph({'b': ['a'], 'c': ['b'], 'd': ['a', 'e']})
+        d = core.scheduler.Scheduler(self._logger, max_parallel=2).run(
+            graph, self._operation
+        )
+
+        # a heads the longest chain, f and e are tied, so they start by order
+        self.assertEqual(self._started, ['a', 'e'])
+
+        # d still waits for a
+        self._pending['e'].callback('e done')
+        self.assertEqual(self._started, ['a', 'e', 'f'])
+
+        self._pending['a'].callback('a done')
+        self.assertEqual(self._started, ['a', 'e', 'f', 'b'])
+
+        for name in ['b', 'f', 'd', 'c']:
+            self._pending[name].callback('{0} done'.format(name))
+
+        self.assertEqual(self._started, ['a', 'e', 'f', 'b', 'd', 'c'])
+
+        results = yield d
+        self.assertEqual(results['d'], 'd done')
+
+    @defer.inlineCallbacks
+    def test_failure_stops_scheduling(self):
+        graph = self._graph({'b': ['a']})
+        d = core.scheduler.Scheduler(self._logger, max_parallel=1).run(
+            graph, self._operation
+        )
+
+        self._pending['a'].errback(RuntimeError('failed'))
+
+        with self.assertRaises(RuntimeError):
+            yield d
+
+        self.assertEqual(self._started, ['a'])
+
+    @defer.inlineCallbacks
+    def test_prerequisites(self):
+
+        # a -> b, where both also wait for their own prerequisite
+        self._targets = {name: self._targets[name] for name in 'ab'}
+        graph = self._graph({'b': ['a']})
+        prerequisites = {self._targets[name]: defer.Deferred() for name in 'ab'}
+
+        d = core.scheduler.Scheduler(self._logger, max_parallel=2).run(
+            graph, self._operation, prerequisites=prerequisites
+        )
+        self.assertEqual(self._started, [])
+
+        # b's prerequisite is done, but it still waits for a
+        prerequisites[self._targets['b']].callback(None)
+        self.assertEqual(self._started, [])
+
+        prerequisites[self._targets['a']].callback(None)
+        self.assertEqual(self._started, ['a'])
+
+        self._pending['a'].callback('a done')
+        self.assertEqual(self._started, ['a', 'b'])
+
+        self._pending['b'].callback('b done')
+        results = yield d
+        self.assertEqual(results, {'a': 'a done', 'b': 'b done'})
+
+    @defer.inlineCallbacks
+    def test_failed_prerequisite_fails_run(self):
+        self._targets = {name: self._targets[name] for name in 'ab'}
+        graph = self._graph({})
+        prerequisites = {self._targets['b']: defer.Deferred()}
+
+        d = core.scheduler.Scheduler(self._logger, max_parallel=2).run(
+            graph, self._operation, prerequisites=prerequisites
+        )
+        self.assertEqual(self._started, ['a'])
+
+        # the run waits for the pending prerequisite even once a is done
+        self._pending['a'].callback('a done')
+        self.assertFalse(d.called)
+
+        prerequisites[self._targets['b']].errback(RuntimeError('failed'))
+
+        with self.assertRaises(RuntimeError):
+            yield d
+
+        self.assertEqual(self._started, ['a'])
+
+    @defer.inlineCallbacks
+    def test_failure_fails_queued_prerequisites(self):
+        self._targets = {name: self._targets[name] for name in 'abc'}
+        graph = self._graph({})
+
+        # b and c are provisioned one at a time, like lift does - provisions still queued once the run
+        # failed fail right away rather than start
+        provision_semaphore = defer.DeferredSemaphore(1)
+        pending_provision = defer.Deferred()
+        provisioned = []
+        failures = []
+
+        def _provision(target):
+            if failures:
+                return defer.fail(failures[0])
+
+            provisioned.append(target.name)
+            return pending_provision
+
+        prerequisites = {
+            self._targets[name]: provision_semaphore.run(
+                _provision, self._targets[name]
+            )
+            for name in 'bc'
+        }
+
+        d = core.scheduler.Scheduler(self._logger, max_parallel=3).run(
+            graph,
+            self._operation,
+            prerequisites=prerequisites,
+            on_failure=failures.append,
+        )
+        self.assertEqual(self._started, ['a'])
+
+        self._pending['a'].errback(RuntimeError('a failed'))
+        self.assertEqual(len(failures), 1)
+
+        # the run waits for the provision in flight, but not for the queued one to run
+        self.assertFalse(d.called)
+        pending_provision.callback(None)
+
+        with self.assertRaises(RuntimeError) as ctx:
+            yield d
+
+        self.assertEqual(str(ctx.exception), 'a failed')
+        self.assertEqual(provisioned, ['b'])
+        self.assertEqual(self._started, ['a'])
+
+    @defer.inlineCallbacks
+    def test_resource_limits(self):
+
+        # a, b and c are builds, limited to one at a time. the rest are unlimited
+        self._targets = {name: self._targets[name] for name in 'abcd'}
+        graph = self._graph({})
+        resource_limits = core.scheduler.ResourceLimits({'build': 1})
+
+        d = core.scheduler.Scheduler(
+            self._logger, max_parallel=2, resource_limits=resource_limits
+        ).run(
+            graph,
+            self._operation,
+            resource_class=lambda target: 'build' if target.name in 'abc' else 'local',
+        )
+
+        # builds waiting for their class don't take the global slot d can use
+        self.assertEqual(self._started, ['a', 'd'])
+
+        self._pending['d'].callback('d done')
+        self.assertEqual(self._started, ['a', 'd'])
+
+        self._pending['a'].callback('a done')
+        self.assertEqual(self._started, ['a', 'd', 'b'])
+
+        self._pending['b'].errback(RuntimeError('failed'))
+
+        with self.assertRaises(RuntimeError):
+            yield d
+
+        # c got the build slot after the failure, and gave it up
+        self.assertEqual(self._started, ['a', 'd', 'b'])
+        acquired = resource_limits.acquire('build')
+        self.assertTrue(acquired.called)
+
+    def test_weighted_critical_path_lengths(self):
+
+        # a -> b, and c is independent but slow
+        graph = self._graph({'b': ['a']})
+        weights = {target: 1 for target in self._targets.values()}
+        weights[self._targets['c']] = 10
+
+        lengths = graph.critical_path_lengths(weights)
+        self.assertEqual(lengths[self._targets['a']], 2)
+        self.assertEqual(lengths[self._targets['c']], 10)
+
+        d = core.scheduler.Scheduler(self._logger, max_parallel=1).run(
+            graph, self._operation, weights=weights
+        )
+        self.assertEqual(self._started, ['c'])
+        self._pending['c'].callback(None)
+        self.assertEqual(self._started, ['c', 'a'])
+
+        while len(self._started) < len(self._targets) or not d.called:
+            self._pending[self._started[-1]].callback(None)
+
+        return d
@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+from twisted.trial import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StartupTestCase(unittest.TestCase):
+    def test_help_does_not_import_heavy_modules(self):
+
+        # register manof's arguments (what --help does) in a fresh interpreter and list what it imported
+        imported_modules = subprocess.check_output(
+            [
+                sys.executable,
+                '-c',
+                'import argparse, runpy, sys\n'
+                'manof_script = runpy.run_path(\'manof.py\')\n'
+                'manof_script[\'_register_arguments\'](argparse.ArgumentParser())\n'
+                'print(\' \'.join(sys.modules))',
+            ],
+            cwd=ROOT_DIR,
+            universal_newlines=True,
+        ).split()
+
+        for heavy_module in ['twisted', 'pygments', 'colorama', 'semver', 'core']:
+            self.assertNotIn(heavy_module, imported_modules)
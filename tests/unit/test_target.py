@@ -0,0 +1,124 @@
+import argparse
+
+from twisted.trial import unittest
+
+import manof
+import manof.utils.profiling
+import clients.logging
+
+logger = clients.logging.TestingClient('unit_test').logger
+
+
+class _Base(manof.Target):
+    memoize_properties = True
+    unmemoized_properties = frozenset(['volatile'])
+
+    def __init__(self, logger, args):
+        super(_Base, self).__init__(logger, args)
+        self.computations = []
+
+    @property
+    def env(self):
+        self.computations.append('base')
+        return ['BASE']
+
+    @property
+    def volatile(self):
+        self.computations.append('volatile')
+        return self._args.value
+
+
+class _Derived(_Base):
+    @property
+    def env(self):
+        self.computations.append('derived')
+        return super(_Derived, self).env + ['DERIVED={0}'.format(self._args.value)]
+
+
+class MemoizedPropertiesTestCase(unittest.TestCase):
+    def setUp(self):
+        self._logger = logger
+        self._args = argparse.Namespace(manofest_path='manofest.py', value=1)
+
+    def test_memoized_per_defining_class(self):
+        target = _Derived(self._logger, self._args)
+
+        self.assertEqual(target.env, ['BASE', 'DERIVED=1'])
+        self.assertEqual(target.env, ['BASE', 'DERIVED=1'])
+        self.assertEqual(target.computations, ['derived', 'base'])
+
+        # properties opted out are always recomputed
+        self.assertEqual([target.volatile, target.volatile], [1, 1])
+        self.assertEqual(target.computations.count('volatile'), 2)
+
+    def test_update_args_invalidates(self):
+        target = _Derived(self._logger, self._args)
+        self.assertEqual(target.env, ['BASE', 'DERIVED=1'])
+
+        target.update_args(argparse.Namespace(value=2))
+        self.assertEqual(target.env, ['BASE', 'DERIVED=2'])
+
+    def test_not_memoized_by_default(self):
+        class NotMemoized(_Derived):
+            memoize_properties = False
+
+        target = NotMemoized(self._logger, self._args)
+        target.env
+        target.env
+
+        self.assertEqual(target.computations, ['derived', 'base'] * 2)
+
+    def test_settings_not_serialized(self):
+        target = _Derived(self._logger, self._args)
+
+        d = target.to_dict()
+
+        self.assertEqual(d['env'], ['BASE', 'DERIVED=1'])
+        self.assertNotIn('memoize_properties', d)
+        self.assertNotIn('unmemoized_properties', d)
+
+
+class PropertyProfilerTestCase(unittest.TestCase):
+    def setUp(self):
+        self._logger = logger
+        self._args = argparse.Namespace(manofest_path='manofest.py', value=1)
+
+    def tearDown(self):
+        manof.utils.profiling.stop_property_profiler()
+
+    def test_counts_evaluations_per_target_and_property(self):
+        class NotMemoized(_Derived):
+            memoize_properties = False
+
+        target = NotMemoized(self._logger, self._args)
+        manof.utils.profiling.start_property_profiler()
+
+        target.env
+        target.env
+        target.volatile
+
+        report = manof.utils.profiling.stop_property_profiler().get_report()
+        rows = {row['property']: row for row in report}
+
+        # the overridden property in the super() chain is named by its defining class
+        self.assertEqual(set(rows), set(['env', '_Base.env', 'volatile']))
+        self.assertEqual(rows['env']['calls'], 2)
+        self.assertEqual(rows['_Base.env']['calls'], 2)
+        self.assertEqual(rows['volatile']['calls'], 1)
+        self.assertEqual(set(row['target'] for row in report), set(['not_memoized']))
+
+        # the time of the property read through super() is included in the cumulative time only
+        self.assertGreaterEqual(
+            rows['env']['cumulative_ms'], rows['_Base.env']['cumulative_ms']
+        )
+        self.assertLessEqual(rows['env']['own_ms'], rows['env']['cumulative_ms'])
+
+    def test_memoized_values_are_evaluated_once(self):
+        target = _Derived(self._logger, self._args)
+        manof.utils.profiling.start_property_profiler()
+
+        target.env
+        target.env
+
+        report = manof.utils.profiling.stop_property_profiler().get_report()
+        self.assertEqual([row['calls'] for row in report], [1, 1])
@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+
+import simplejson
+from twisted.internet import defer
+from twisted.trial import unittest
+
+import manof.utils
+import manof.utils.tracing
+import clients.logging
+
+logger = clients.logging.TestingClient('unit_test').logger
+
+
+class TracingTestCase(unittest.TestCase):
+    def setUp(self):
+        self._logger = logger
+        self._temp_dir = tempfile.mkdtemp()
+        self._trace_path = os.path.join(self._temp_dir, 'trace.json')
+        manof.utils.tracing.enable(self._trace_path)
+
+    def tearDown(self):
+        manof.utils.tracing.disable()
+        shutil.rmtree(self._temp_dir)
+
+    def _read_events(self):
+        manof.utils.tracing.write()
+
+        with open(self._trace_path) as trace_file:
+            return simplejson.load(trace_file)['traceEvents']
+
+    @defer.inlineCallbacks
+    def test_concurrent_spans_take_separate_lanes(self):
+        pending = {name: defer.Deferred() for name in ['a', 'b']}
+
+        @defer.inlineCallbacks
+        def _target(name):
+            with manof.utils.tracing.span('target ' + name, 'target'):
+                with manof.utils.tracing.span('subprocess ' + name, 'subprocess'):
+                    yield pending[name]
+
+        with manof.utils.tracing.span('command', 'command'):
+            running = [_target('a'), _target('b')]
+            pending['a'].callback(None)
+            pending['b'].callback(None)
+            yield defer.gatherResults(running)
+
+        spans = {
+            event['name']: event for event in self._read_events() if event['ph'] == 'X'
+        }
+
+        # the first target nests in the command's lane, the second runs alongside it
+        self.assertEqual(spans['target a']['tid'], spans['command']['tid'])
+        self.assertNotEqual(spans['target b']['tid'], spans['command']['tid'])
+
+        # each subprocess nests in its own target's lane
+        for name in ['a', 'b']:
+            target_span = spans['target ' + name]
+            subprocess_span = spans['subprocess ' + name]
+            self.assertEqual(subprocess_span['tid'], target_span['tid'])
+            self.assertGreaterEqual(subprocess_span['ts'], target_span['ts'])
+            self.assertLessEqual(
+                subprocess_span['ts'] + subprocess_span['dur'],
+                target_span['ts'] + target_span['dur'],
+            )
+
+    @defer.inlineCallbacks
+    def test_retries_are_traced(self):
+        calls = []
+
+        def flaky():
+            calls.append(None)
+            if len(calls) == 1:
+                raise RuntimeError('failed')
+
+            return 'result'
+
+        result = yield manof.utils.retry_until_successful(2, self._logger, flaky)
+        self.assertEqual(result, 'result')
+
+        tries = [
+            event['args']
+            for event in self._read_events()
+            if event.get('cat') == 'retry'
+        ]
+        self.assertEqual([args['try_number'] for args in tries], [1, 2])
+        self.assertIn('error', tries[0])
+        self.assertNotIn('error', tries[1])
@@ -0,0 +1,146 @@
+from twisted.internet import defer
+from twisted.trial import unittest
+
+import manof.utils
+import clients.logging
+
+logger = clients.logging.TestingClient('unit_test').logger
+
+
+class SingleFlightTestCase(unittest.TestCase):
+    def setUp(self):
+        self._logger = logger
+        self._single_flight = manof.utils.SingleFlight()
+        self._calls = []
+
+    def _operation(self, name):
+        self._calls.append(name)
+        d = defer.Deferred()
+        self._pending = d
+        return d
+
+    @defer.inlineCallbacks
+    def test_concurrent_calls_share_result(self):
+        first = self._single_flight.run('key', self._operation, 'first')
+        second = self._single_flight.run('key', self._operation, 'second')
+        self.assertTrue(self._single_flight.in_flight('key'))
+
+        self._pending.callback('result')
+        results = yield defer.gatherResults([first, second])
+
+        self.assertEqual(results, ['result', 'result'])
+        self.assertEqual(self._calls, ['first'])
+        self.assertFalse(self._single_flight.in_flight('key'))
+
+        # once done, the next call runs the operation again
+        third = self._single_flight.run('key', self._operation, 'third')
+        self._pending.callback('another result')
+        result = yield third
+
+        self.assertEqual(result, 'another result')
+        self.assertEqual(self._calls, ['first', 'third'])
+
+    @defer.inlineCallbacks
+    def test_concurrent_calls_share_failure(self):
+        first = self._single_flight.run('key', self._operation, 'first')
+        second = self._single_flight.run('key', self._operation, 'second')
+
+        self._pending.errback(RuntimeError('failed'))
+
+        for d in [first, second]:
+            with self.assertRaises(RuntimeError):
+                yield d
+
+
+class OutputStreamTestCase(unittest.TestCase):
+    def test_lines_and_bounded_tail(self):
+        lines = []
+        stream = manof.utils._OutputStream(lines.append, max_captured_size=8)
+
+        for data in [b'first li', b'ne\nsecond\nthi', b'rd \xc3', b'\xa9']:
+            stream.data_received(data)
+        stream.close()
+
+        self.assertEqual(lines, ['first line', 'second', 'third é'])
+        self.assertEqual(stream.tail, b'third \xc3\xa9')
+        self.assertTrue(stream.truncated)
+
+    @defer.inlineCallbacks
+    def test_success_record_is_bounded(self):
+        records = []
+
+        class _Logger(object):
+            def isEnabledFor(self, severity):
+                return False
+
+            def info(self, message, **kwargs):
+                records.append((message, kwargs))
+
+        # ~590KiB of output, more than is captured
+        out, _, _ = yield manof.utils.execute(
+            manof.utils.Argv(['seq', '100000']),
+            cwd=None,
+            quiet=False,
+            logger=_Logger(),
+        )
+        self.assertTrue(out.endswith('99999\n100000'))
+
+        message, record_vars = records[-1]
+        self.assertEqual(message, 'Command succeeded')
+        self.assertEqual(record_vars['out_size'], 588895)
+        self.assertEqual(record_vars['err_size'], 0)
+        self.assertTrue(record_vars['truncated'])
+        self.assertEqual(record_vars['out'], '99996\n99997\n99998\n99999\n100000')
+
+
+class ArgvTestCase(unittest.TestCase):
+    def test_split_argv(self):
+        self.assertEqual(
+            manof.utils.split_argv('sleep  "a b" c=\'d\''),
+            manof.utils.Argv(['sleep', 'a b', 'c=d']),
+        )
+
+        # command lines the shell does more than split are left to it
+        for command_line in ['a && b', 'echo $HOME', 'a > b', 'a "b', '']:
+            self.assertIsNone(manof.utils.split_argv(command_line))
+
+    def test_str_is_equivalent_command_line(self):
+        argv = manof.utils.Argv(['docker', 'run', '--env', 'A=b c', 5])
+
+        self.assertEqual(str(argv), 'docker run --env \'A=b c\' 5')
+        self.assertEqual(manof.utils.split_argv(str(argv)), argv)
+
+    @defer.inlineCallbacks
+    def test_argv_is_executed_without_shell(self):
+        out, _, code = yield manof.utils.execute(
+            manof.utils.Argv(['echo', '$HOME && "quoted"']), cwd=None, quiet=False
+        )
+
+        self.assertEqual(code, 0)
+        self.assertEqual(out, '$HOME && "quoted"')
+
+    @defer.inlineCallbacks
+    def test_env_overrides_go_through_cli(self):
+        executed = []
+
+        class _Adapter(object):
+            def execute(self, command):
+                executed.append(command)
+                return defer.succeed((b'api', b'', 0))
+
+        manof.utils.use_docker_api(_Adapter())
+        self.addCleanup(manof.utils.use_docker_api, None)
+
+        out, _, _ = yield manof.utils.execute(
+            manof.utils.Argv(['echo', 'cli']), cwd=None, quiet=False
+        )
+        self.assertEqual(out, 'api')
+
+        out, _, _ = yield manof.utils.execute(
+            manof.utils.Argv(['echo', 'cli']),
+            cwd=None,
+            quiet=False,
+            env={'DOCKER_HOST': 'unix:///elsewhere.sock'},
+        )
+        self.assertEqual(out, 'cli')
+        self.assertEqual(len(executed), 1)
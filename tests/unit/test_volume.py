@@ -0,0 +1,143 @@
+import argparse
+
+from twisted.internet import defer
+from twisted.trial import unittest
+
+import manof
+import manof.volume
+import clients.logging
+
+logger = clients.logging.TestingClient('unit_test').logger
+
+
+class _FakeDocker(object):
+    """
+    Records the docker commands of named volumes. Volume listing completes at once, other commands when
+    the test fires their deferred
+    """
+
+    def __init__(self, volume_names=()):
+        self.volume_names = volume_names
+        self.commands = []
+        self.pending = []
+
+    def run_command(self, command, **kwargs):
+        self.commands.append(str(command))
+
+        if command[:3] == ('docker', 'volume', 'ls'):
+            return defer.succeed(('\n'.join(self.volume_names), '', 0))
+
+        d = defer.Deferred()
+        self.pending.append(d)
+        return d
+
+
+class SharedData(manof.NamedVolume):
+    pass
+
+
+class NamedVolumeTestCase(unittest.TestCase):
+    def setUp(self):
+        self._logger = logger
+
+        # every test starts from an invocation of its own
+        self.patch(manof.volume, 'named_volume_index', manof.volume._NamedVolumeIndex())
+        self.patch(
+            manof.volume, 'named_volume_registry', manof.volume._NamedVolumeRegistry()
+        )
+        self._args = argparse.Namespace(
+            manofest_path='manofest.py', dry_run=False, force_rm=False
+        )
+
+    def _create_volumes(self, docker, count=1):
+        volumes = []
+        for _ in range(count):
+            volume = SharedData(self._logger, self._args)
+            volume._run_command = docker.run_command
+            volumes.append(volume)
+
+        return volumes
+
+    @defer.inlineCallbacks
+    def test_volumes_are_listed_once(self):
+        docker = _FakeDocker(volume_names=['other'])
+        volume, other_volume = self._create_volumes(docker, count=2)
+
+        results = yield defer.gatherResults(
+            [volume.exists(), other_volume.exists(), volume.exists()]
+        )
+        self.assertEqual(results, [False, False, False])
+        self.assertEqual(docker.commands, ['docker volume ls --format \'{{.Name}}\''])
+
+        # creating and removing volumes keeps the listing up to date
+        d = volume.provision()
+        docker.pending.pop().callback(('', '', 0))
+        yield d
+
+        exists = yield other_volume.exists()
+        self.assertTrue(exists)
+
+        d = volume.rm()
+        docker.pending.pop().callback(('', '', 0))
+        yield d
+
+        exists = yield other_volume.exists()
+        self.assertFalse(exists)
+
+        self.assertEqual(
+            docker.commands,
+            [
+                'docker volume ls --format \'{{.Name}}\'',
+                'docker volume create --driver=local --name=shared_data',
+                'docker volume rm shared_data',
+            ],
+        )
+
+    @defer.inlineCallbacks
+    def test_concurrent_operations_on_a_volume_are_coalesced(self):
+        docker = _FakeDocker()
+        volumes = self._create_volumes(docker, count=2)
+
+        provisions = [volume.provision() for volume in volumes]
+        self.assertEqual(len(docker.pending), 1)
+        docker.pending.pop().callback(('', '', 0))
+        yield defer.gatherResults(provisions)
+
+        removals = [volume.rm() for volume in volumes]
+        self.assertEqual(len(docker.pending), 1)
+        docker.pending.pop().callback(('', '', 0))
+        yield defer.gatherResults(removals)
+
+        self.assertEqual(
+            docker.commands,
+            [
+                'docker volume ls --format \'{{.Name}}\'',
+                'docker volume create --driver=local --name=shared_data',
+                'docker volume rm shared_data',
+            ],
+        )
+
+    @defer.inlineCallbacks
+    def test_failure_reaches_every_caller(self):
+        docker = _FakeDocker()
+        volumes = self._create_volumes(docker, count=2)
+
+        provisions = [volume.provision() for volume in volumes]
+        docker.pending.pop().errback(RuntimeError('Volume create failed'))
+
+        for provision in provisions:
+            yield self.assertFailure(provision, RuntimeError)
+
+        self.assertEqual(
+            docker.commands,
+            [
+                'docker volume ls --format \'{{.Name}}\'',
+                'docker volume create --driver=local --name=shared_data',
+            ],
+        )
+
+        # the volume wasn't created, so the next provision tries again
+        d = volumes[0].provision()
+        docker.pending.pop().callback(('', '', 0))
+        yield d
+        self.assertEqual(len(docker.commands), 3)